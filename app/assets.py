@@ -0,0 +1,306 @@
+# Static asset pipeline, per-page bundles that are minified, fingerprinted and precompressed at build time
+
+import functools
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+ASSETS_FOLDER = "dist"
+MANIFEST_NAME = "manifest.json"
+ASSET_MAX_AGE = 60 * 60 * 24 * 365
+
+# Every page loads one stylesheet and one script, the sources keep the order the partials used to load them in
+
+_SITE_CSS_HEAD = ["css/base.css"]
+_SITE_CSS_TAIL = ["css/navbar.css", "css/footer.css"]
+_SITE_JS_HEAD = ["js/base.js"]
+_SITE_JS_TAIL = ["js/navbar.js"]
+
+BUNDLES = {
+    "index.css": _SITE_CSS_HEAD + ["css/index.css"] + _SITE_CSS_TAIL,
+    "index.js": _SITE_JS_HEAD + ["js/index.js"] + _SITE_JS_TAIL,
+    "blog.css": _SITE_CSS_HEAD + ["css/blog.css"] + _SITE_CSS_TAIL,
+    "blog.js": _SITE_JS_HEAD + ["js/blog.js"] + _SITE_JS_TAIL,
+    "search.css": _SITE_CSS_HEAD + ["css/search.css"] + _SITE_CSS_TAIL,
+    "editor.css": _SITE_CSS_HEAD + ["css/create_blog.css"] + _SITE_CSS_TAIL,
+    "create_blog.js": _SITE_JS_HEAD + _SITE_JS_TAIL + ["js/create_blog.js"],
+    "edit_blog.js": _SITE_JS_HEAD + _SITE_JS_TAIL + ["js/edit_blog.js"],
+    "login.css": _SITE_CSS_HEAD + ["css/authorize.css"] + _SITE_CSS_TAIL,
+    "site.js": _SITE_JS_HEAD + _SITE_JS_TAIL,
+}
+
+MIMETYPES = {
+    ".css": "text/css",
+    ".js": "text/javascript",
+}
+
+
+def minify_css(source):
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{};,])\s*", r"\1", source)
+    source = re.sub(r":\s+", ":", source)
+    return source.replace(";}", "}").strip()
+
+
+# A / after these starts a regular expression, after anything else it divides
+
+REGEX_PRECEDING_CHARACTERS = set("(,=:[!&|?{};+-*%<>~^")
+REGEX_PRECEDING_KEYWORDS = {
+    "await", "case", "delete", "do", "else", "in", "instanceof", "new", "of", "return",
+    "throw", "typeof", "void", "yield",
+}
+
+
+def _scan_string(source, start):
+    """Returns the end of the string literal opened at `start`."""
+    quote = source[start]
+    position = start + 1
+    while position < len(source) and source[position] not in (quote, "\n"):
+        position += 2 if source[position] == "\\" else 1
+    return min(position + 1, len(source))
+
+
+def _scan_template(source, position):
+    """Returns the end of the template literal text from `position` and whether a ${ substitution ends it."""
+    while position < len(source):
+        if source[position] == "\\":
+            position += 2
+        elif source[position] == "`":
+            return position + 1, False
+        elif source.startswith("${", position):
+            return position + 2, True
+        else:
+            position += 1
+    return len(source), False
+
+
+def _scan_regex(source, start):
+    """Returns the end of the regular expression literal opened at `start`, before its flags."""
+    position = start + 1
+    in_class = False
+    while position < len(source) and source[position] != "\n":
+        character = source[position]
+        if character == "\\":
+            position += 2
+            continue
+        if in_class:
+            in_class = character != "]"
+        elif character == "[":
+            in_class = True
+        elif character == "/":
+            return position + 1
+        position += 1
+    return position
+
+
+def minify_js(source):
+    """
+    Drops comments, indentation and blank lines.
+
+    Strings, template literals and regular expressions are copied as they are, so comment
+    markers inside them are kept. Lines are never joined, automatic semicolon insertion is
+    left as it is, this is deliberately conservative for hand written scripts.
+    """
+    lines = []
+    line = []
+
+    def end_line():
+        text = "".join(line).strip()
+        if text:
+            lines.append(text)
+        line.clear()
+
+    previous_character = ""
+    previous_word = ""
+    in_word = False
+    # Open braces of every ${ substitution being scanned, the template resumes at its closing brace
+    substitution_depths = []
+    in_template = False
+    position = 0
+    while position < len(source):
+        if in_template:
+            end, in_substitution = _scan_template(source, position)
+            line.append(source[position:end])
+            position = end
+            in_template = False
+            if in_substitution:
+                substitution_depths.append(0)
+                previous_character, previous_word, in_word = "{", "", False
+            else:
+                previous_character, previous_word, in_word = "`", "", False
+            continue
+
+        character = source[position]
+        if character == "\n":
+            end_line()
+            in_word = False
+            position += 1
+            continue
+        if source.startswith("//", position):
+            end = source.find("\n", position)
+            position = len(source) if end == -1 else end
+            continue
+        if source.startswith("/*", position):
+            end = source.find("*/", position + 2)
+            end = len(source) if end == -1 else end + 2
+            # A comment spanning lines still ends the line it started on
+            if "\n" in source[position:end]:
+                end_line()
+            else:
+                line.append(" ")
+            in_word = False
+            position = end
+            continue
+
+        if character in "'\"":
+            end = _scan_string(source, position)
+        elif character == "`":
+            position += 1
+            line.append(character)
+            in_template = True
+            continue
+        elif character == "/" and (
+            previous_character in REGEX_PRECEDING_CHARACTERS
+            or not previous_character
+            or previous_word in REGEX_PRECEDING_KEYWORDS
+        ):
+            end = _scan_regex(source, position)
+        else:
+            end = None
+
+        if end is not None:
+            line.append(source[position:end])
+            previous_character, previous_word, in_word = source[end - 1], "", False
+            position = end
+            continue
+
+        if substitution_depths and character == "{":
+            substitution_depths[-1] += 1
+        elif substitution_depths and character == "}":
+            if substitution_depths[-1] == 0:
+                substitution_depths.pop()
+                line.append(character)
+                in_template = True
+                position += 1
+                continue
+            substitution_depths[-1] -= 1
+
+        line.append(character)
+        if character.isalnum() or character in "_$":
+            previous_word = previous_word + character if in_word else character
+            in_word = True
+        else:
+            in_word = False
+            if not character.isspace():
+                previous_word = ""
+        if not character.isspace():
+            previous_character = character
+        position += 1
+    end_line()
+    return "\n".join(lines)
+
+
+def bundle_source(bundle, static_folder=STATIC_FOLDER):
+    """Concatenates the sources of a bundle without minifying them."""
+    separator = "\n;\n" if bundle.endswith(".js") else "\n"
+    sources = []
+    for source_path in BUNDLES[bundle]:
+        with open(os.path.join(static_folder, source_path), encoding="utf-8") as source_file:
+            sources.append(source_file.read())
+    return separator.join(sources)
+
+
+def _write(path, content):
+    with open(path, "wb") as output_file:
+        output_file.write(content)
+
+
+def _build_bundle(bundle, static_folder):
+    """Returns the fingerprinted filename and the minified content of a bundle."""
+    stem, extension = os.path.splitext(bundle)
+    minify = minify_css if extension == ".css" else minify_js
+    content = minify(bundle_source(bundle, static_folder)).encode("utf-8")
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}", content
+
+
+@functools.lru_cache(maxsize=None)
+def memory_bundle(bundle, static_folder=STATIC_FOLDER):
+    """
+    Builds a bundle in memory, once per process, for deployments that never ran build_assets.
+
+    It gets the filename the build would give it, so its URL stays immutable either way.
+    """
+    return _build_bundle(bundle, static_folder)
+
+
+def find_memory_bundle(filename, static_folder=STATIC_FOLDER):
+    """Returns the content of the in-memory bundle named `filename`, None when there is none."""
+    name_parts = filename.split(".")
+    if len(name_parts) != 3 or f"{name_parts[0]}.{name_parts[2]}" not in BUNDLES:
+        return None
+    built_filename, content = memory_bundle(f"{name_parts[0]}.{name_parts[2]}", static_folder)
+    return content if built_filename == filename else None
+
+
+def build_assets(static_folder=STATIC_FOLDER):
+    """
+    Writes every bundle as <name>.<content hash>.<ext> with .gz and .br variants, and the manifest.
+
+    The gzip variants carry no timestamp, so a build of unchanged sources produces identical files.
+    Files left over from previous builds are removed. Returns the manifest.
+    """
+    output_folder = os.path.join(static_folder, ASSETS_FOLDER)
+    os.makedirs(output_folder, exist_ok=True)
+
+    manifest = {}
+    for bundle in BUNDLES:
+        filename, content = _build_bundle(bundle, static_folder)
+        output_path = os.path.join(output_folder, filename)
+        _write(output_path, content)
+        _write(f"{output_path}.gz", gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write(f"{output_path}.br", brotli.compress(content, mode=brotli.MODE_TEXT))
+        manifest[bundle] = filename
+
+    built_files = {MANIFEST_NAME}
+    for filename in manifest.values():
+        built_files.update((filename, f"{filename}.gz", f"{filename}.br"))
+    for filename in os.listdir(output_folder):
+        if filename not in built_files:
+            os.remove(os.path.join(output_folder, filename))
+
+    with open(os.path.join(output_folder, MANIFEST_NAME), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder=STATIC_FOLDER):
+    """Returns the manifest of the last build, empty when the assets have not been built."""
+    try:
+        with open(os.path.join(static_folder, ASSETS_FOLDER, MANIFEST_NAME)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def precompressed_variant(asset_path, accept_encodings):
+    """Returns (path, content encoding) of the smallest variant the client accepts."""
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if accept_encodings[encoding] > 0 and os.path.exists(asset_path + suffix):
+            return asset_path + suffix, encoding
+    return asset_path, None
+
+
+if __name__ == "__main__":
+    for bundle, filename in build_assets().items():
+        print(f"{bundle} -> {ASSETS_FOLDER}/{filename}")
@@ -0,0 +1,70 @@
+# Denormalized author snapshots, embedded in BLOGS and COMMENTS so read paths skip the USERS lookup
+
+
+def author_snapshot(user_id, username, name, avatar_url):
+    """Returns the compact author record embedded as blog_author / comment_author."""
+    return {
+        "user_id": user_id,
+        "user_info": {
+            "username": username,
+            "name": name,
+            "avatar_url": avatar_url,
+        },
+    }
+
+
+def author_snapshot_from_user(user):
+    return author_snapshot(
+        user["user_id"],
+        user["user_info"]["username"],
+        user["user_info"]["name"],
+        user["user_info"]["avatar_url"],
+    )
+
+
+def refresh_author_snapshots(database, user):
+    """
+    Fans an updated USERS document out to every blog and comment it authored.
+
+    Documents whose snapshot is already current are not rewritten, so the usual login with an
+    unchanged profile costs two index lookups. Returns the ids of the blogs whose rendered
+    pages show the author, for the caller to invalidate.
+    """
+    snapshot = author_snapshot_from_user(user)
+
+    stale_blog_ids = [
+        blog["blog_id"]
+        for blog in database["BLOGS"].find(
+            {
+                "blog_author.user_id": user["user_id"],
+                "blog_author.user_info": {"$ne": snapshot["user_info"]},
+            },
+            {"_id": 0, "blog_id": 1},
+        )
+    ]
+    if stale_blog_ids:
+        database["BLOGS"].update_many(
+            {"blog_id": {"$in": stale_blog_ids}}, {"$set": {"blog_author": snapshot}}
+        )
+
+    stale_comment_filter = {
+        "comment_author.user_id": user["user_id"],
+        "comment_author.user_info": {"$ne": snapshot["user_info"]},
+    }
+    commented_blog_ids = database["COMMENTS"].distinct(
+        "comment_metadata.blog_id", stale_comment_filter
+    )
+    if commented_blog_ids:
+        database["COMMENTS"].update_many(
+            stale_comment_filter, {"$set": {"comment_author": snapshot}}
+        )
+
+    return set(stale_blog_ids) | set(commented_blog_ids)
+
+
+def backfill_author_snapshots(database):
+    """Embeds the author snapshots into every existing blog and comment, returns the blog ids touched."""
+    touched_blog_ids = set()
+    for user in database["USERS"].find({}, {"_id": 0, "user_id": 1, "user_info": 1}):
+        touched_blog_ids |= refresh_author_snapshots(database, user)
+    return touched_blog_ids
@@ -0,0 +1,143 @@
+# Change feed of the BLOGS collection, lets every worker keep its in-process indexes in sync
+
+import threading
+
+import redis
+
+
+BLOGS_VERSION_KEY = "inkbloom:blogs:version"
+BLOGS_CHANGES_KEY = "inkbloom:blogs:changes"
+BLOGS_CHANGES_RETAINED = 1000
+
+# View flushes go to a feed of their own, the blogs version keys the search cache and the ETags
+# of the blog lists and must only change with the content
+
+VIEWS_VERSION_KEY = "inkbloom:blogs:views:version"
+VIEWS_CHANGES_KEY = "inkbloom:blogs:views:changes"
+
+BLOGS_FEED = (BLOGS_VERSION_KEY, BLOGS_CHANGES_KEY)
+VIEWS_FEED = (VIEWS_VERSION_KEY, VIEWS_CHANGES_KEY)
+
+# Returns {version, needs_rebuild, changed_blog_ids} for a reader that has seen ARGV[1] changes
+
+POLL_CHANGES_SCRIPT = """
+local version = tonumber(redis.call('GET', KEYS[1]) or '0')
+local seen = tonumber(ARGV[1])
+if seen == version then
+    return {version, 0, {}}
+end
+local length = redis.call('LLEN', KEYS[2])
+if seen > version or version - seen > length then
+    return {version, 1, {}}
+end
+return {version, 0, redis.call('LRANGE', KEYS[2], seen - version, -1)}
+"""
+
+
+def _record_change(redis_client, feed, blog_ids):
+    """Appends the blog ids to a change feed, the version always equals the number of changes."""
+    version_key, changes_key = feed
+    try:
+        pipeline = redis_client.pipeline(transaction=True)
+        for blog_id in blog_ids:
+            pipeline.rpush(changes_key, blog_id)
+            pipeline.incr(version_key)
+        pipeline.ltrim(changes_key, -BLOGS_CHANGES_RETAINED, -1)
+        pipeline.execute()
+    except redis.RedisError:
+        pass
+
+
+def record_blog_change(redis_client, *blog_ids):
+    """Records a write to the content or metadata of the blogs."""
+    _record_change(redis_client, BLOGS_FEED, blog_ids)
+
+
+def record_views_change(redis_client, *blog_ids):
+    """Records new view counts of the blogs, only the indexes ordering by views follow these."""
+    _record_change(redis_client, VIEWS_FEED, blog_ids)
+
+
+def current_blogs_version(redis_client):
+    return int(redis_client.get(BLOGS_VERSION_KEY) or 0)
+
+
+class BlogChangeFeed:
+    """Tracks how far a reader has consumed a change feed."""
+
+    def __init__(self, feed=BLOGS_FEED):
+        self.version_key, self.changes_key = feed
+        self.seen_version = None
+
+    def poll(self, redis_client):
+        """
+        Returns a (needs_rebuild, changed_blog_ids) tuple and marks the changes as seen.
+
+        A full rebuild is requested on the first poll, and when the reader fell further behind
+        than the retained part of the feed.
+        """
+        if self.seen_version is None:
+            self.seen_version = int(redis_client.get(self.version_key) or 0)
+            return True, []
+
+        version, needs_rebuild, changed_blog_ids = redis_client.eval(
+            POLL_CHANGES_SCRIPT,
+            2,
+            self.version_key,
+            self.changes_key,
+            self.seen_version,
+        )
+        self.seen_version = int(version)
+        return bool(needs_rebuild), list(
+            dict.fromkeys(blog_id.decode() for blog_id in changed_blog_ids)
+        )
+
+
+class ChangeFeedIndex:
+    """
+    Base class of the in-process indexes derived from BLOGS.
+
+    Subclasses implement add, remove, is_empty and load_blogs, refresh keeps them in sync with
+    the blog writes of every worker through the change feeds listed in change_feeds.
+    """
+
+    change_feeds = (BLOGS_FEED,)
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._change_feeds = [BlogChangeFeed(feed) for feed in self.change_feeds]
+        self._clear()
+
+    def rebuild(self, database):
+        with self._lock:
+            self._clear()
+            for blog in self.load_blogs(database, {}):
+                self.add(blog)
+
+    def refresh(self, database, redis_client):
+        """Applies the blog writes made by any worker since the last refresh."""
+        with self._lock:
+            try:
+                needs_rebuild, changed_blog_ids = False, []
+                for change_feed in self._change_feeds:
+                    feed_needs_rebuild, feed_changed_blog_ids = change_feed.poll(redis_client)
+                    needs_rebuild = needs_rebuild or feed_needs_rebuild
+                    changed_blog_ids.extend(feed_changed_blog_ids)
+                changed_blog_ids = list(dict.fromkeys(changed_blog_ids))
+            except redis.RedisError:
+                # Serve from the index we have, build one straight from Mongo if there is none
+                needs_rebuild, changed_blog_ids = self.is_empty(), []
+
+            if needs_rebuild:
+                self.rebuild(database)
+                return
+
+            if changed_blog_ids:
+                found_blog_ids = set()
+                for blog in self.load_blogs(
+                    database, {"blog_id": {"$in": changed_blog_ids}}
+                ):
+                    found_blog_ids.add(blog["blog_id"])
+                    self.add(blog)
+                for blog_id in set(changed_blog_ids) - found_blog_ids:
+                    self.remove(blog_id)
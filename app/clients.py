@@ -0,0 +1,55 @@
+# Lazily created, fork-safe clients, each process opens its own connections on first use
+
+import os
+import threading
+
+from werkzeug.local import LocalProxy
+
+
+class LazyClient:
+    """
+    Holds the client built by `factory`, creating it on first use and again after a fork.
+
+    A client created at import would make every serverless cold start pay for it before the
+    first request needs it, and would share its sockets and monitor threads with every process
+    forked from the importing one.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.factory()
+                client = self._client
+        return client
+
+    def reset(self):
+        # The parent's client is dropped without closing it, its connections belong to the parent
+        self._client = None
+        self._lock = threading.Lock()
+
+
+def lazy_client(factory):
+    """Returns a proxy to the client of `factory`, it behaves like the client, isinstance included."""
+    return LocalProxy(LazyClient(factory).get)
+
+
+def http_session(pool_maxsize):
+    """Returns a requests session keeping up to `pool_maxsize` connections per host alive."""
+    # Only the calls to other services need requests, importing it is left out of the cold start
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
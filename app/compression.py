@@ -0,0 +1,97 @@
+# Response compression, negotiated from Accept-Encoding with whichever codecs are installed
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/json",
+    "application/xml",
+    "application/rss+xml",
+    "image/svg+xml",
+}
+
+
+def _compress_gzip(body):
+    return gzip.compress(body, compresslevel=6)
+
+
+def _compress_brotli(body):
+    return brotli.compress(body, mode=brotli.MODE_TEXT, quality=5)
+
+
+def _compress_zstd(body):
+    return zstandard.ZstdCompressor(level=10).compress(body)
+
+
+# In order of preference, for clients that accept several encodings with the same quality
+
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS["br"] = _compress_brotli
+if zstandard is not None:
+    ENCODERS["zstd"] = _compress_zstd
+ENCODERS["gzip"] = _compress_gzip
+
+
+def negotiate_encoding(accept_encodings, available_encodings=ENCODERS):
+    """Returns the preferred encoding the client accepts, None for an identity response."""
+    return accept_encodings.best_match(
+        [encoding for encoding in ENCODERS if encoding in available_encodings]
+    )
+
+
+def compress(body, encoding):
+    return ENCODERS[encoding](body)
+
+
+def should_compress(response):
+    return (
+        response.status_code == 200
+        and not response.direct_passthrough
+        and not response.is_streamed
+        and "Content-Encoding" not in response.headers
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+        and (response.content_length or 0) >= COMPRESSION_MIN_SIZE
+    )
+
+
+def set_encoded_body(response, body, encoding):
+    """
+    Replaces the body with its encoded variant.
+
+    A strong ETag is weakened, the validator still identifies the content but not the bytes,
+    so revalidations match whichever encoding the client got.
+    """
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    etag, is_weak = response.get_etag()
+    if etag is not None and not is_weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_response(response, accept_encodings):
+    """Compresses eligible responses in place, for the after-request hook."""
+    if not should_compress(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    return set_encoded_body(response, compress(response.get_data(), encoding), encoding)
@@ -0,0 +1,275 @@
+# Write-time processing of the article HTML, everything the read paths need is derived in one parse
+
+import hashlib
+import re
+from html import escape, unescape
+from html.parser import HTMLParser
+
+from images import CONTENT_IMAGE_SIZES
+
+
+WORDS_PER_MINUTE = 200
+IMAGE_READ_TIME_SECONDS = 12
+EXCERPT_LENGTH = 280
+
+TOC_HEADINGS = {"h1", "h2", "h3"}
+
+# Text of these elements is not part of the article prose
+
+SKIPPED_TEXT_TAGS = {"script", "style", "template"}
+
+# A boundary between these elements separates words even without whitespace in the markup
+
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+    "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "td", "th",
+    "tr", "ul",
+}
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def _render_starttag(tag, attrs, self_closing=False):
+    rendered_attrs = "".join(
+        f' {name}="{escape(value, quote=True)}"' if value is not None else f" {name}"
+        for name, value in attrs
+    )
+    return f"<{tag}{rendered_attrs}{' /' if self_closing else ''}>"
+
+
+def _dimension(value):
+    return int(value) if value and value.isdigit() else None
+
+
+def _heading_id(title, used_ids):
+    base_id = re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-") or "section"
+    heading_id = base_id
+    suffix = 2
+    while heading_id in used_ids:
+        heading_id = f"{base_id}-{suffix}"
+        suffix += 1
+    used_ids.add(heading_id)
+    return heading_id
+
+
+class ContentProcessor(HTMLParser):
+    """
+    Streams the article HTML once, copying it through while collecting the derived data.
+
+    Character references are kept as written, only <img> tags and the table of contents
+    headings are rewritten, every other tag is copied verbatim. The <img> tags are left as
+    slots in the output, render_images fills them once the sources collected by the parse
+    are resolved to their responsive images.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.output = []
+        self.image_sources = []
+        self.text = []
+        self.images = []
+        self.table_of_contents = []
+        self._used_ids = set()
+        self._skipped_depth = 0
+        self._picture_depth = 0
+        self._heading = None
+        self._image_slots = []
+
+    def _add_text(self, text):
+        if self._skipped_depth:
+            return
+        self.text.append(text)
+        if self._heading is not None:
+            self._heading["text"].append(text)
+
+    def _add_image(self, attrs, self_closing):
+        attributes = dict(attrs)
+        if attributes.get("src"):
+            self.image_sources.append(attributes["src"])
+        self._image_slots.append((len(self.output), attributes, self_closing))
+        self.output.append(None)
+
+    def render_images(self, responsive_images):
+        """Renders the <img> slots, `responsive_images` maps sources to images.responsive_image."""
+        for index, attributes, self_closing in self._image_slots:
+            self.output[index] = self._image_tag(
+                attributes, responsive_images.get(attributes.get("src")), self_closing
+            )
+
+    def _image_tag(self, attributes, image, self_closing):
+        if image is not None:
+            attributes.update(
+                src=image["src"],
+                width=str(image["width"]),
+                height=str(image["height"]),
+                srcset=image["srcset"],
+                sizes=CONTENT_IMAGE_SIZES,
+            )
+        attributes.setdefault("loading", "lazy")
+        attributes.setdefault("decoding", "async")
+        self.images.append(
+            {
+                "src": attributes.get("src"),
+                "alt": attributes.get("alt") or "",
+                "width": _dimension(attributes.get("width")),
+                "height": _dimension(attributes.get("height")),
+            }
+        )
+        image_tag = _render_starttag("img", attributes.items(), self_closing)
+        if image is None or not image["sources"]:
+            return image_tag
+        sources = "".join(
+            _render_starttag(
+                "source",
+                [("type", source["type"]), ("srcset", source["srcset"]), ("sizes", CONTENT_IMAGE_SIZES)],
+            )
+            for source in image["sources"]
+        )
+        return f"<picture>{sources}{image_tag}</picture>"
+
+    def _is_derived_tag(self, tag):
+        # <picture> and its <source> elements are rendered from the responsive images on every
+        # pass, the editor drops them anyway, so the ones in the input are never copied
+        return tag == "picture" or (tag == "source" and self._picture_depth)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+        if tag in SKIPPED_TEXT_TAGS:
+            self._skipped_depth += 1
+
+        if self._is_derived_tag(tag):
+            if tag == "picture":
+                self._picture_depth += 1
+        elif tag == "img":
+            self._add_image(attrs, self_closing=False)
+        elif tag in TOC_HEADINGS and self._heading is None:
+            # The id depends on the heading text, the tag is rendered once the heading closes
+            self._heading = {"tag": tag, "attrs": attrs, "index": len(self.output), "text": []}
+            self.output.append(None)
+        else:
+            self.output.append(self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+        if self._is_derived_tag(tag):
+            return
+        if tag == "img":
+            self._add_image(attrs, self_closing=True)
+        else:
+            self.output.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TEXT_TAGS and self._skipped_depth:
+            self._skipped_depth -= 1
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+
+        if tag == "picture" and self._picture_depth:
+            self._picture_depth -= 1
+            return
+        if self._heading is not None and tag == self._heading["tag"]:
+            self._close_heading()
+        self.output.append(f"</{tag}>")
+
+    def _close_heading(self):
+        heading = self._heading
+        self._heading = None
+        title = " ".join(unescape("".join(heading["text"])).split())
+        attributes = dict(heading["attrs"])
+        if attributes.get("id"):
+            # Ids written in the content are kept, the generated ones must not repeat them
+            self._used_ids.add(attributes["id"])
+        elif title:
+            attributes["id"] = _heading_id(title, self._used_ids)
+        if title:
+            self.table_of_contents.append(
+                {"level": int(heading["tag"][1]), "id": attributes["id"], "title": title}
+            )
+        self.output[heading["index"]] = _render_starttag(heading["tag"], attributes.items())
+
+    def handle_data(self, data):
+        self.output.append(data)
+        self._add_text(data)
+
+    def handle_entityref(self, name):
+        self.output.append(f"&{name};")
+        self._add_text(f"&{name};")
+
+    def handle_charref(self, name):
+        self.output.append(f"&#{name};")
+        self._add_text(f"&#{name};")
+
+    def handle_comment(self, data):
+        self.output.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.output.append(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self.output.append(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        self.output.append(f"<![{data}]>")
+
+    def close(self):
+        super().close()
+        if self._heading is not None:
+            self._close_heading()
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(" ", 1)[0].rstrip(" ,.;:") + "…"
+
+
+def process_content(html_content, resolve_images=None):
+    """
+    Returns the processed article HTML with everything derived from it.
+
+    Images get loading="lazy" and decoding="async". `resolve_images` is called once with the
+    image sources found by the parse and returns their responsive images by source, those
+    images also get their srcset and a <picture> with the other formats. Headings of the
+    table of contents get anchor ids. The read time keeps the previous estimate of 200 words
+    per minute plus 12 seconds per image.
+    """
+    processor = ContentProcessor()
+    processor.feed(html_content)
+    processor.close()
+    processor.render_images(resolve_images(processor.image_sources) if resolve_images else {})
+
+    processed_html = "".join(processor.output)
+    text = " ".join(unescape("".join(processor.text)).split())
+    word_count = len(WORD_PATTERN.findall(text))
+    read_time = word_count / WORDS_PER_MINUTE + (
+        len(processor.images) * IMAGE_READ_TIME_SECONDS / 60
+    )
+
+    return {
+        "html": processed_html,
+        "read_time": int(read_time),
+        "word_count": word_count,
+        "excerpt": make_excerpt(text),
+        "table_of_contents": processor.table_of_contents,
+        "images": processor.images,
+        "content_hash": hashlib.sha256(processed_html.encode("utf-8")).hexdigest(),
+    }
+
+
+def content_metadata(processed_content):
+    """Returns the blog_metadata fields of a processed article, for $set or a new document."""
+    return {
+        field: processed_content[field]
+        for field in (
+            "read_time",
+            "word_count",
+            "excerpt",
+            "table_of_contents",
+            "images",
+            "content_hash",
+        )
+    }
+
@@ -0,0 +1,104 @@
+# Stateless CSRF protection, HMAC signed double-submit tokens that never touch the session store
+
+import functools
+import hashlib
+import hmac
+import secrets
+import time
+
+from flask import current_app, g, jsonify, request, session
+
+
+CSRF_COOKIE_NAME = "inkbloom-csrf"
+CSRF_HEADER_NAME = "X-CSRF-Token"
+CSRF_FORM_FIELD = "csrf_token"
+CSRF_TOKEN_TTL = 60 * 60 * 12
+
+
+def _signature(secret_key, payload, subject):
+    return hmac.new(
+        secret_key.encode(), f"{payload}|{subject}".encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def _subject():
+    # Tokens are bound to the signed in user, a token leaked for one account is useless for another
+    return (session.get("user") or {}).get("user_id", "")
+
+
+def generate_csrf_token(secret_key, subject):
+    payload = f"{secrets.token_urlsafe(16)}.{int(time.time())}"
+    return f"{payload}.{_signature(secret_key, payload, subject)}"
+
+
+def is_valid_csrf_token(secret_key, subject, token):
+    try:
+        nonce, issued_at, signature = token.split(".")
+        issued_at = int(issued_at)
+    except (AttributeError, ValueError):
+        return False
+    if time.time() - issued_at > CSRF_TOKEN_TTL:
+        return False
+    return hmac.compare_digest(
+        signature, _signature(secret_key, f"{nonce}.{issued_at}", subject)
+    )
+
+
+def csrf_token():
+    """
+    Returns the CSRF token of the request, for the templates of forms that submit writes.
+
+    A still valid cookie token is reused so pages open in other tabs keep working, a new
+    one is only signed when the cookie is missing or stale.
+    """
+    if "csrf_token" not in g:
+        secret_key = current_app.config["SECRET_KEY"]
+        cookie_token = request.cookies.get(CSRF_COOKIE_NAME)
+        if is_valid_csrf_token(secret_key, _subject(), cookie_token):
+            g.csrf_token = cookie_token
+        else:
+            g.csrf_token = generate_csrf_token(secret_key, _subject())
+            g.csrf_token_issued = True
+    return g.csrf_token
+
+
+def set_csrf_cookie(response):
+    """Sends the token issued during the request as the double-submit cookie."""
+    if g.get("csrf_token_issued"):
+        response.set_cookie(
+            CSRF_COOKIE_NAME,
+            g.csrf_token,
+            max_age=CSRF_TOKEN_TTL,
+            secure=current_app.config["SESSION_COOKIE_SECURE"],
+            httponly=True,
+            samesite="Strict",
+        )
+    return response
+
+
+def csrf_protected(view):
+    """Rejects the request unless the submitted token matches the cookie and its signature."""
+
+    @functools.wraps(view)
+    def decorated_view(*args, **kwargs):
+        submitted_token = request.headers.get(CSRF_HEADER_NAME) or request.form.get(
+            CSRF_FORM_FIELD
+        )
+        cookie_token = request.cookies.get(CSRF_COOKIE_NAME)
+        if (
+            not submitted_token
+            or not cookie_token
+            or not hmac.compare_digest(submitted_token, cookie_token)
+            or not is_valid_csrf_token(
+                current_app.config["SECRET_KEY"], _subject(), submitted_token
+            )
+        ):
+            return jsonify(
+                {
+                    "status": "error",
+                    "message": "The form has expired, please reload the page and try again!",
+                }
+            ), 403
+        return view(*args, **kwargs)
+
+    return decorated_view
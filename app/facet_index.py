@@ -0,0 +1,144 @@
+# In-process faceted index for the /search filters (tags, category, publish date and views)
+
+import bisect
+from collections import defaultdict
+
+from blog_changes import BLOGS_FEED, VIEWS_FEED, ChangeFeedIndex
+from pagination import BLOG_CARD_PROJECTION
+
+
+class SortedPostings:
+    """Blog ids kept sorted by a value, so a range filter is two binary searches."""
+
+    def __init__(self):
+        self.values = []
+        self.blog_ids = []
+
+    def insert(self, value, blog_id):
+        position = bisect.bisect_right(self.values, value)
+        self.values.insert(position, value)
+        self.blog_ids.insert(position, blog_id)
+
+    def remove(self, value, blog_id):
+        start = bisect.bisect_left(self.values, value)
+        end = bisect.bisect_right(self.values, value)
+        position = self.blog_ids.index(blog_id, start, end)
+        del self.values[position]
+        del self.blog_ids[position]
+
+    def range(self, lt=None, gt=None, lte=None, gte=None):
+        start, end = 0, len(self.values)
+        if gte is not None:
+            start = max(start, bisect.bisect_left(self.values, gte))
+        if gt is not None:
+            start = max(start, bisect.bisect_right(self.values, gt))
+        if lte is not None:
+            end = min(end, bisect.bisect_right(self.values, lte))
+        if lt is not None:
+            end = min(end, bisect.bisect_left(self.values, lt))
+        return set(self.blog_ids[start:end])
+
+
+class FacetIndex(ChangeFeedIndex):
+    # The views filter and the ordering of the categories follow the view counts
+    change_feeds = (BLOGS_FEED, VIEWS_FEED)
+
+    def _clear(self):
+        self.records = {}
+        self.public_blog_ids = set()
+        self.tag_postings = defaultdict(set)
+        self.category_postings = defaultdict(set)
+        self.created_at_postings = SortedPostings()
+        self.views_postings = SortedPostings()
+
+    def add(self, blog):
+        """Indexes a compact blog card, replacing any earlier version of it."""
+        with self._lock:
+            blog_id = blog["blog_id"]
+            self.remove(blog_id)
+
+            blog_metadata = blog["blog_metadata"]
+            self.records[blog_id] = blog
+            if blog_metadata.get("visibility") == "public":
+                self.public_blog_ids.add(blog_id)
+            for tag in blog_metadata.get("tags", []):
+                self.tag_postings[tag].add(blog_id)
+            self.category_postings[blog_metadata.get("category")].add(blog_id)
+            self.created_at_postings.insert(blog_metadata["created_at"], blog_id)
+            self.views_postings.insert(blog_metadata.get("number_of_views", 0), blog_id)
+
+    def remove(self, blog_id):
+        with self._lock:
+            blog = self.records.pop(blog_id, None)
+            if blog is None:
+                return
+
+            blog_metadata = blog["blog_metadata"]
+            self.public_blog_ids.discard(blog_id)
+            for tag in blog_metadata.get("tags", []):
+                self.tag_postings[tag].discard(blog_id)
+                if not self.tag_postings[tag]:
+                    del self.tag_postings[tag]
+            category_postings = self.category_postings[blog_metadata.get("category")]
+            category_postings.discard(blog_id)
+            if not category_postings:
+                del self.category_postings[blog_metadata.get("category")]
+            self.created_at_postings.remove(blog_metadata["created_at"], blog_id)
+            self.views_postings.remove(blog_metadata.get("number_of_views", 0), blog_id)
+
+    def is_empty(self):
+        return not self.records
+
+    def load_blogs(self, database, match):
+        return database["BLOGS"].find(
+            match, dict(BLOG_CARD_PROJECTION, **{"blog_metadata.visibility": 1})
+        )
+
+    def search(
+        self,
+        tags=None,
+        category=None,
+        created_at_range=None,
+        views_range=None,
+    ):
+        """
+        Returns the public blogs matching every given filter, grouped by category.
+
+        A blog matches the tag filter when it has any of the tags. The groups are ordered by
+        their average views and the blogs inside a group from newest to oldest.
+        """
+        with self._lock:
+            matching_blog_ids = set(self.public_blog_ids)
+            if tags:
+                matching_blog_ids &= set().union(
+                    *(self.tag_postings.get(tag, set()) for tag in tags)
+                )
+            if category:
+                matching_blog_ids &= self.category_postings.get(category, set())
+            if created_at_range:
+                matching_blog_ids &= self.created_at_postings.range(**created_at_range)
+            if views_range:
+                matching_blog_ids &= self.views_postings.range(**views_range)
+
+            categories = defaultdict(list)
+            for blog_id in matching_blog_ids:
+                blog = self.records[blog_id]
+                categories[blog["blog_metadata"].get("category")].append(blog)
+
+        search_results = []
+        for category_name, blogs in categories.items():
+            blogs.sort(key=lambda blog: blog["_id"], reverse=True)
+            search_results.append(
+                {
+                    "category": category_name,
+                    "averageViews": sum(
+                        blog["blog_metadata"].get("number_of_views", 0) for blog in blogs
+                    )
+                    / len(blogs),
+                    "totalBlogs": len(blogs),
+                    "blogs": blogs,
+                }
+            )
+        search_results.sort(key=lambda result: result["averageViews"], reverse=True)
+        return search_results
+
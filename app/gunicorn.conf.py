@@ -0,0 +1,57 @@
+# Gunicorn configuration, loaded from the working directory by `gunicorn "main:create_app()"`
+
+import os
+import subprocess
+import sys
+
+from dotenv import load_dotenv
+
+
+# Loaded before the workers import the app, whose settings are read at import
+
+load_dotenv()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+
+# The gevent workers serve up to worker_connections requests each, a request waiting on the
+# accounts API, MongoDB or Redis yields to the others instead of holding the whole process.
+# GUNICORN_WORKER_CLASS=sync restores one request per worker.
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+
+# The app must not be preloaded, gevent patches the standard library when a worker starts and
+# pymongo and redis have to be imported after that to use the patched sockets and locks
+
+preload_app = False
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+
+# The job workers run next to the web workers, started and stopped by the gunicorn master.
+# Set JOB_WORKERS=0 when they run as a service of their own, the app runs the jobs in the
+# request whenever no worker sends a heartbeat.
+
+job_workers = int(os.getenv("JOB_WORKERS", 1))
+_job_worker_processes = []
+
+
+def when_ready(server):
+    for _ in range(job_workers):
+        _job_worker_processes.append(
+            subprocess.Popen([sys.executable, "-m", "flask", "--app", "main", "run-worker"])
+        )
+    if job_workers:
+        server.log.info(f"Started {job_workers} job workers")
+
+
+def on_exit(server):
+    for process in _job_worker_processes:
+        process.terminate()
+    for process in _job_worker_processes:
+        try:
+            process.wait(timeout=graceful_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,66 @@
+# Per-route HTTP caching policies, with ETags computed from stored content versions
+
+import hashlib
+import hmac
+
+
+class CachePolicy:
+    """
+    Cache-Control policy of a route.
+
+    `version` is a callable returning a token that changes whenever the response would, read
+    from stored versions only, or None when no ETag can be given. It must not render anything.
+    `not_modified` is called when a revalidation is answered with 304 before the view runs, for
+    the side effects of the view that still have to happen.
+    """
+
+    def __init__(self, max_age=0, stale_while_revalidate=0, public=True, version=None, not_modified=None):
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.public = public
+        self.version = version
+        self.not_modified = not_modified
+
+    def cache_control(self, is_personalized):
+        directives = [
+            "public" if self.public and not is_personalized else "private",
+            f"max-age={self.max_age}",
+        ]
+        if self.stale_while_revalidate:
+            directives.append(f"stale-while-revalidate={self.stale_while_revalidate}")
+        return ", ".join(directives)
+
+
+def cache_policy(**policy_options):
+    """Attaches a CachePolicy to a view function, the decorator has to sit below @app.route."""
+
+    def decorator(view):
+        view.cache_policy = CachePolicy(**policy_options)
+        return view
+
+    return decorator
+
+
+def policy_for(app, endpoint):
+    return getattr(app.view_functions.get(endpoint), "cache_policy", None)
+
+
+def compute_etag(policy, secret_key, service_version, full_path, viewer_id):
+    """
+    Returns the strong ETag of the response, or None when the route has no version.
+
+    The request path, the viewer and the service version are part of the tag, so pages that
+    differ per query string, per logged-in user or per deploy never share a validator. The
+    tag is keyed with the secret key, otherwise the 304 answered before the view checks the
+    visibility would tell anyone who computes the tag of a private slug that it exists.
+    """
+    if policy is None or policy.version is None:
+        return None
+    version = policy.version()
+    if version is None:
+        return None
+    return hmac.new(
+        secret_key.encode(),
+        f"{service_version}|{full_path}|{viewer_id or 'anonymous'}|{version}".encode(),
+        hashlib.sha256,
+    ).hexdigest()[:32]
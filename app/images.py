@@ -0,0 +1,133 @@
+# Upload-time image processing, every image is re-encoded into right-sized WebP and AVIF variants
+
+import functools
+import io
+
+
+# Widths wider than the image are skipped, the image itself is encoded at its own width up to the last
+
+IMAGE_WIDTHS = (320, 640, 960, 1280, 1920)
+
+# (format, content type, encoder options), the first format with variants is the <img> fallback
+
+IMAGE_FORMATS = [
+    ("webp", "image/webp", {"quality": 80, "method": 4}),
+    ("avif", "image/avif", {"quality": 55, "speed": 6}),
+]
+
+# Where the images are shown, the browser picks the variant of its width and pixel density
+
+CONTENT_IMAGE_SIZES = "(max-width: 800px) 100vw, 60vw"
+
+
+@functools.lru_cache(maxsize=None)
+def image_encoders():
+    """
+    Returns Pillow's Image and ImageOps modules and the IMAGE_FORMATS it can encode, None without Pillow.
+
+    Only the publish job encodes images, so the web processes never pay for importing Pillow.
+    """
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        return None
+
+    def is_supported(image_format):
+        try:
+            return features.check(image_format)
+        except ValueError:
+            # Pillow releases before AVIF support don't know the feature
+            return False
+
+    return Image, ImageOps, [image_format for image_format in IMAGE_FORMATS if is_supported(image_format[0])]
+
+
+def image_variants(image):
+    """
+    Returns (width, height, variants) of an image, None when it can't be processed.
+
+    Each variant is a dict of format, content_type, width, height and data. The EXIF
+    orientation is applied and no metadata is written, so the camera, GPS and editing
+    details of an upload never reach the CDN. Animated images, SVGs and anything Pillow
+    can't decode are left as uploaded, as is everything when Pillow isn't installed.
+    """
+    encoders = image_encoders()
+    if encoders is None or not encoders[2]:
+        return None
+    Image, ImageOps, image_formats = encoders
+    try:
+        with Image.open(io.BytesIO(image)) as source:
+            if getattr(source, "is_animated", False):
+                return None
+            source = ImageOps.exif_transpose(source)
+            source.load()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    has_alpha = "A" in source.getbands() or "transparency" in source.info
+    source = source.convert("RGBA" if has_alpha else "RGB")
+
+    widths = [width for width in IMAGE_WIDTHS if width < source.width]
+    if source.width <= IMAGE_WIDTHS[-1]:
+        widths.append(source.width)
+
+    variants = []
+    for width in widths:
+        height = max(1, round(source.height * width / source.width))
+        resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+        for image_format, content_type, options in image_formats:
+            variant = io.BytesIO()
+            resized.save(variant, format=image_format.upper(), **options)
+            variants.append(
+                {
+                    "format": image_format,
+                    "content_type": content_type,
+                    "width": width,
+                    "height": height,
+                    "data": variant.getvalue(),
+                }
+            )
+    return source.width, source.height, variants
+
+
+def _srcset(variants, image_format):
+    return ", ".join(
+        f"{variant['url']} {variant['width']}w"
+        for variant in sorted(variants, key=lambda variant: variant["width"])
+        if variant["format"] == image_format
+    )
+
+
+def fallback_variant(variants):
+    """The widest variant of the fallback format, its URL is the src of the image."""
+    formats = [variant["format"] for variant in variants]
+    fallback_format = IMAGE_FORMATS[0][0] if IMAGE_FORMATS[0][0] in formats else formats[0]
+    return max(
+        (variant for variant in variants if variant["format"] == fallback_format),
+        key=lambda variant: variant["width"],
+    )
+
+
+def responsive_image(media):
+    """
+    Returns what the markup of a media record needs, None when it has no variants.
+
+    src, width, height and srcset describe the <img> in the fallback format, sources the
+    <source> elements of the other formats.
+    """
+    variants = media.get("variants")
+    if not variants:
+        return None
+    fallback = fallback_variant(variants)
+    formats = {variant["format"]: variant["content_type"] for variant in variants}
+    formats.pop(fallback["format"])
+    return {
+        "src": fallback["url"],
+        "width": media["width"],
+        "height": media["height"],
+        "srcset": _srcset(variants, fallback["format"]),
+        "sources": [
+            {"type": content_type, "srcset": _srcset(variants, image_format)}
+            for image_format, content_type in formats.items()
+        ],
+    }
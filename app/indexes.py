@@ -0,0 +1,189 @@
+# Index declarations for every collection, and query plan checks for the hot queries of the routes
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+
+REQUIRED_INDEXES = {
+    "BLOGS": [
+        IndexModel([("blog_id", ASCENDING)], name="blog_id", unique=True),
+        IndexModel([("blog_metadata.slug", ASCENDING)], name="slug"),
+        IndexModel(
+            [("blog_metadata.visibility", ASCENDING), ("_id", DESCENDING)],
+            name="visibility_id",
+        ),
+        IndexModel(
+            [
+                ("blog_metadata.visibility", ASCENDING),
+                ("blog_metadata.featured", ASCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="visibility_featured_id",
+        ),
+        IndexModel(
+            [
+                ("blog_metadata.visibility", ASCENDING),
+                ("blog_metadata.created_at", DESCENDING),
+            ],
+            name="visibility_created_at",
+        ),
+        IndexModel(
+            [
+                ("blog_metadata.visibility", ASCENDING),
+                ("blog_metadata.updated_at", DESCENDING),
+            ],
+            name="visibility_updated_at",
+        ),
+        IndexModel([("blog_author.user_id", ASCENDING)], name="author_user_id"),
+    ],
+    "COMMENTS": [
+        IndexModel([("comment_id", ASCENDING)], name="comment_id", unique=True),
+        IndexModel(
+            [("comment_metadata.blog_id", ASCENDING), ("_id", DESCENDING)],
+            name="blog_id_id",
+        ),
+        IndexModel([("comment_author.user_id", ASCENDING)], name="author_user_id"),
+    ],
+    "USERS": [
+        IndexModel([("user_id", ASCENDING)], name="user_id", unique=True),
+        IndexModel(
+            [("account_info.oauth_id", ASCENDING)], name="oauth_id", unique=True
+        ),
+    ],
+    "MEDIA": [
+        IndexModel([("digest", ASCENDING)], name="digest", unique=True),
+        IndexModel([("file_url", ASCENDING)], name="file_url"),
+    ],
+    "PENDING_MEDIA": [
+        IndexModel([("digest", ASCENDING)], name="digest", unique=True),
+    ],
+}
+
+# The queries issued by the routes, with placeholder values, each must be served by an index
+
+HOT_QUERIES = [
+    {
+        "name": "index: public feed page",
+        "collection": "BLOGS",
+        "filter": {"blog_metadata.visibility": "public"},
+        "sort": [("_id", DESCENDING)],
+        "limit": 11,
+    },
+    {
+        "name": "index: featured blogs",
+        "collection": "BLOGS",
+        "filter": {"blog_metadata.visibility": "public", "blog_metadata.featured": True},
+        "sort": [("_id", DESCENDING)],
+        "limit": 5,
+    },
+    {
+        "name": "blog: by slug",
+        "collection": "BLOGS",
+        "filter": {"blog_metadata.slug": "category:-slug"},
+    },
+    {
+        "name": "edit_blog / update_blog / create_comment: by blog_id",
+        "collection": "BLOGS",
+        "filter": {"blog_id": "blog-id"},
+    },
+    {
+        "name": "blog / blog_comments_api: comments page",
+        "collection": "COMMENTS",
+        "filter": {"comment_metadata.blog_id": "blog-id"},
+        "sort": [("_id", DESCENDING)],
+        "limit": 21,
+    },
+    {
+        "name": "delete_comment: by comment_id",
+        "collection": "COMMENTS",
+        "filter": {"comment_id": "comment-id"},
+    },
+    {
+        "name": "rss_feed: latest public blogs",
+        "collection": "BLOGS",
+        "filter": {"blog_metadata.visibility": "public"},
+        "sort": [("blog_metadata.created_at", DESCENDING)],
+        "limit": 20,
+    },
+    {
+        "name": "sitemap: public blogs",
+        "collection": "BLOGS",
+        "filter": {"blog_metadata.visibility": "public"},
+        "sort": [("blog_metadata.updated_at", DESCENDING)],
+    },
+    {
+        "name": "github_callback: by oauth_id",
+        "collection": "USERS",
+        "filter": {"account_info.oauth_id": "oauth-id"},
+    },
+    {
+        "name": "github_callback: by user_id",
+        "collection": "USERS",
+        "filter": {"user_id": "user-id"},
+    },
+    {
+        "name": "github_callback: author snapshot fan out",
+        "collection": "BLOGS",
+        "filter": {"blog_author.user_id": "user-id"},
+    },
+    {
+        "name": "github_callback: comment snapshot fan out",
+        "collection": "COMMENTS",
+        "filter": {"comment_author.user_id": "user-id"},
+    },
+    {
+        "name": "create_blog / update_blog: media digests",
+        "collection": "MEDIA",
+        "filter": {"digest": {"$in": ["digest"]}},
+    },
+    {
+        "name": "create_blog / update_blog / publish-blog-media job: responsive images",
+        "collection": "MEDIA",
+        "filter": {"$or": [{"digest": {"$in": ["digest"]}}, {"file_url": {"$in": ["file-url"]}}]},
+    },
+    {
+        "name": "staged_media / publish-blog-media job: staged media digests",
+        "collection": "PENDING_MEDIA",
+        "filter": {"digest": {"$in": ["digest"]}},
+    },
+]
+
+
+def ensure_indexes(database):
+    """Creates the declared indexes, existing indexes with the same definition are left alone."""
+    created_indexes = {}
+    for collection_name, indexes in REQUIRED_INDEXES.items():
+        created_indexes[collection_name] = database[collection_name].create_indexes(indexes)
+    return created_indexes
+
+
+def _plan_stages(plan):
+    yield plan["stage"]
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for input_stage in plan.get("inputStages", []):
+        yield from _plan_stages(input_stage)
+
+
+def explain_hot_queries(database):
+    """
+    Explains every hot query and returns a list of (name, stages, uses_collection_scan).
+
+    The winning plan is walked stage by stage, any COLLSCAN means a route would scan the
+    whole collection as it grows.
+    """
+    query_plans = []
+    for query in HOT_QUERIES:
+        cursor = database[query["collection"]].find(query["filter"])
+        if "sort" in query:
+            cursor = cursor.sort(query["sort"])
+        if "limit" in query:
+            cursor = cursor.limit(query["limit"])
+
+        query_planner = cursor.explain()["queryPlanner"]
+        winning_plan = query_planner["winningPlan"]
+        # The slot based execution engine nests the plan tree one level deeper
+        winning_plan = winning_plan.get("queryPlan", winning_plan)
+
+        stages = list(_plan_stages(winning_plan))
+        query_plans.append((query["name"], stages, "COLLSCAN" in stages))
+    return query_plans
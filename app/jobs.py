@@ -0,0 +1,269 @@
+# Durable job queue on Redis, the slow follow-up work of a request runs in worker processes
+
+import json
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+import redis
+
+
+JOBS_PREFIX = "inkbloom:jobs"
+QUEUE_KEY = f"{JOBS_PREFIX}:queue"
+PROCESSING_KEY = f"{JOBS_PREFIX}:processing"
+DELAYED_KEY = f"{JOBS_PREFIX}:delayed"
+WORKERS_KEY = f"{JOBS_PREFIX}:workers"
+
+JOB_MAX_ATTEMPTS = 5
+JOB_LEASE = 300
+JOB_RETENTION = 60 * 60 * 24 * 7
+JOB_BACKOFF_BASE = 2
+JOB_BACKOFF_MAX = 300
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
+# Every running worker refreshes its heartbeat, a worker silent for WORKER_HEARTBEAT_TTL seconds is gone
+
+WORKER_HEARTBEAT_INTERVAL = 10
+WORKER_HEARTBEAT_TTL = 60
+
+JOB_HANDLERS = {}
+
+
+def _job_key(job_id):
+    return f"{JOBS_PREFIX}:job:{job_id}"
+
+
+def _lease_key(job_id):
+    return f"{JOBS_PREFIX}:lease:{job_id}"
+
+
+def _idempotency_key(key):
+    return f"{JOBS_PREFIX}:idempotency:{key}"
+
+
+# Returns the job holding the idempotency key while it waits to run, otherwise enqueues a new one.
+# KEYS: job, queue[, idempotency]  ARGV: job_id, name, payload, max_attempts, now, key ttl, jobs prefix
+
+ENQUEUE_SCRIPT = """
+if #KEYS == 3 then
+    local existing_job_id = redis.call('GET', KEYS[3])
+    if existing_job_id then
+        local existing_status = redis.call('HGET', ARGV[7] .. ':job:' .. existing_job_id, 'status')
+        if existing_status == 'queued' or existing_status == 'retrying' then
+            return existing_job_id
+        end
+    end
+    redis.call('SET', KEYS[3], ARGV[1], 'EX', ARGV[6])
+end
+redis.call('HSET', KEYS[1], 'id', ARGV[1], 'name', ARGV[2], 'payload', ARGV[3], 'status', 'queued',
+    'attempts', 0, 'max_attempts', ARGV[4], 'created_at', ARGV[5], 'updated_at', ARGV[5])
+redis.call('LPUSH', KEYS[2], ARGV[1])
+return ARGV[1]
+"""
+
+# Moves the due retries to the queue, requeues the jobs of workers whose lease expired and
+# leases the next job, all atomically so a job is never run twice at once.
+# KEYS: queue, processing, delayed  ARGV: now, lease seconds, jobs prefix
+
+CLAIM_SCRIPT = """
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1], 'LIMIT', 0, 100)) do
+    redis.call('ZREM', KEYS[3], job_id)
+    redis.call('LPUSH', KEYS[1], job_id)
+end
+for _, job_id in ipairs(redis.call('LRANGE', KEYS[2], 0, -1)) do
+    if redis.call('EXISTS', ARGV[3] .. ':lease:' .. job_id) == 0 then
+        redis.call('LREM', KEYS[2], 1, job_id)
+        redis.call('RPUSH', KEYS[1], job_id)
+    end
+end
+local job_id = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+if not job_id then
+    return false
+end
+redis.call('SET', ARGV[3] .. ':lease:' .. job_id, ARGV[1], 'EX', ARGV[2])
+local job_key = ARGV[3] .. ':job:' .. job_id
+redis.call('HINCRBY', job_key, 'attempts', 1)
+redis.call('HSET', job_key, 'status', 'running', 'updated_at', ARGV[1])
+return job_id
+"""
+
+
+def job_handler(name):
+    """Registers the decorated function as the handler of the jobs named `name`."""
+
+    def decorator(function):
+        JOB_HANDLERS[name] = function
+        return function
+
+    return decorator
+
+
+def enqueue(redis_client, name, payload, idempotency_key=None, max_attempts=JOB_MAX_ATTEMPTS):
+    """
+    Queues a job and returns its id, the payload is passed to the handler as keyword arguments.
+
+    While a job holding the same idempotency key waits to run, its id is returned instead of
+    queueing another one, so repeated requests for the same work coalesce into one job.
+    """
+    job_id = str(uuid.uuid4())
+    keys = [_job_key(job_id), QUEUE_KEY]
+    if idempotency_key is not None:
+        keys.append(_idempotency_key(idempotency_key))
+    existing_job_id = redis_client.eval(
+        ENQUEUE_SCRIPT,
+        len(keys),
+        *keys,
+        job_id,
+        name,
+        json.dumps(payload),
+        max_attempts,
+        time.time(),
+        IDEMPOTENCY_KEY_TTL,
+        JOBS_PREFIX,
+    )
+    return existing_job_id.decode() if isinstance(existing_job_id, bytes) else existing_job_id
+
+
+def get_job(redis_client, job_id):
+    """Returns the status of a job, None once it is unknown or expired."""
+    job = {
+        field.decode(): value.decode()
+        for field, value in redis_client.hgetall(_job_key(job_id)).items()
+    }
+    if not job:
+        return None
+    return {
+        "id": job["id"],
+        "name": job["name"],
+        "status": job["status"],
+        "attempts": int(job["attempts"]),
+        "max_attempts": int(job["max_attempts"]),
+        "error": job.get("error") or None,
+        "run_at": float(job["run_at"]) if job["status"] == "retrying" else None,
+        "created_at": float(job["created_at"]),
+        "updated_at": float(job["updated_at"]),
+    }
+
+
+def retry_delay(attempts):
+    """Exponential backoff with full jitter, capped at JOB_BACKOFF_MAX seconds."""
+    return random.uniform(0, min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE ** attempts))
+
+
+def _finish(redis_client, job_id, fields, retry_at=None):
+    pipeline = redis_client.pipeline(transaction=True)
+    pipeline.hset(_job_key(job_id), mapping={**fields, "updated_at": time.time()})
+    if retry_at is None:
+        pipeline.expire(_job_key(job_id), JOB_RETENTION)
+    else:
+        pipeline.zadd(DELAYED_KEY, {job_id: retry_at})
+    pipeline.lrem(PROCESSING_KEY, 1, job_id)
+    pipeline.delete(_lease_key(job_id))
+    pipeline.execute()
+
+
+def run_next_job(redis_client, handlers=JOB_HANDLERS):
+    """Leases and runs the next due job, returns False when there is none."""
+    job_id = redis_client.eval(
+        CLAIM_SCRIPT, 3, QUEUE_KEY, PROCESSING_KEY, DELAYED_KEY, time.time(), JOB_LEASE, JOBS_PREFIX
+    )
+    if not job_id:
+        return False
+    job_id = job_id.decode()
+
+    job = redis_client.hmget(_job_key(job_id), "name", "payload", "attempts", "max_attempts")
+    if job[0] is None:
+        # The job expired while it sat in the queue
+        redis_client.lrem(PROCESSING_KEY, 1, job_id)
+        redis_client.delete(_lease_key(job_id))
+        return True
+    name, payload, attempts, max_attempts = job[0].decode(), job[1], int(job[2]), int(job[3])
+
+    if attempts > max_attempts:
+        # Only a job whose worker died on every attempt gets here
+        _finish(redis_client, job_id, {"status": "failed", "error": "The job exceeded its attempts"})
+        return True
+
+    handler = handlers.get(name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler is registered for the {name} jobs")
+        handler(**json.loads(payload))
+    except Exception as e:
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        if handler is not None and attempts < max_attempts:
+            retry_at = time.time() + retry_delay(attempts)
+            _finish(
+                redis_client,
+                job_id,
+                {"status": "retrying", "error": error, "run_at": retry_at},
+                retry_at=retry_at,
+            )
+        else:
+            _finish(redis_client, job_id, {"status": "failed", "error": error})
+        return True
+
+    _finish(redis_client, job_id, {"status": "succeeded", "error": ""})
+    return True
+
+
+def record_heartbeat(redis_client, worker_id):
+    now = time.time()
+    pipeline = redis_client.pipeline(transaction=False)
+    pipeline.zadd(WORKERS_KEY, {worker_id: now})
+    pipeline.zremrangebyscore(WORKERS_KEY, "-inf", now - WORKER_HEARTBEAT_TTL)
+    pipeline.execute()
+
+
+def has_live_workers(redis_client):
+    """Whether a worker sent a heartbeat within WORKER_HEARTBEAT_TTL seconds, queued jobs only run if so."""
+    return redis_client.zcount(WORKERS_KEY, time.time() - WORKER_HEARTBEAT_TTL, "+inf") > 0
+
+
+def run_worker(redis_client, handlers=JOB_HANDLERS, poll_interval=1.0, burst=False):
+    """
+    Runs jobs until interrupted, or in burst mode until no job is due.
+
+    A worker polls when the queue is empty, a job left by a worker that died is run again once
+    its lease of JOB_LEASE seconds expires, so handlers must be safe to run more than once.
+    The heartbeat is sent from a thread, so it keeps going while a long job runs. SIGTERM lets
+    the running job finish before the worker exits.
+    """
+    worker_id = f"{socket.gethostname()}:{uuid.uuid4().hex[:12]}"
+    stopped = threading.Event()
+
+    def send_heartbeats():
+        while not stopped.is_set():
+            try:
+                record_heartbeat(redis_client, worker_id)
+            except redis.RedisError:
+                pass
+            stopped.wait(WORKER_HEARTBEAT_INTERVAL)
+
+    if not burst:
+        threading.Thread(target=send_heartbeats, daemon=True).start()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    try:
+        while not stopped.is_set():
+            try:
+                ran_job = run_next_job(redis_client, handlers)
+            except redis.RedisError:
+                if burst:
+                    raise
+                ran_job = False
+            if not ran_job:
+                if burst:
+                    return
+                stopped.wait(poll_interval)
+    finally:
+        stopped.set()
+        if not burst:
+            try:
+                redis_client.zrem(WORKERS_KEY, worker_id)
+            except redis.RedisError:
+                pass
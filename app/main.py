@@ -3,17 +3,17 @@
 # Importing the required libraries
 
 import os
-import base64
-import re
 import urllib.parse
+import click
 import redis
-import utils
 import secrets
+import time
 from datetime import datetime, timezone
-import requests
 from dotenv import load_dotenv
 from flask import (
+    Blueprint,
     Flask,
+    Response,
     render_template,
     url_for,
     redirect,
@@ -22,19 +22,117 @@ from flask import (
     jsonify,
     make_response,
     abort,
+    g,
+    current_app,
+    send_file,
+    before_render_template,
+    template_rendered,
 )
 from flask_session import Session
+from werkzeug.middleware.proxy_fix import ProxyFix
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 import uuid
+from page_cache import (
+    blog_page_version,
+    cached_blog_id,
+    get_cached_blog_page,
+    invalidate_blog_page,
+    render_fragments,
+    store_blog_page,
+    store_compressed_blog_page,
+)
+from view_counter import (
+    flush_views,
+    is_view_flush_due,
+    record_view,
+    visitor_fingerprint,
+)
+from metrics import (
+    REQUEST_LATENCY,
+    RESPONSE_BYTES,
+    TEMPLATE_LATENCY,
+    InstrumentedRedis,
+    MongoCommandListener,
+    exposition,
+    record_request_timing,
+    server_timing_header,
+)
+from rate_limit import (
+    check_rate_limits,
+    limits_for,
+    rate_limit,
+    rate_limit_headers,
+)
+from profiler import (
+    PROFILE_HEADER_NAME,
+    PROFILE_ID_HEADER_NAME,
+    Profiler,
+    generate_profile_token,
+    profile_id,
+)
+from images import image_encoders
+from media import (
+    ImageTooLargeError,
+    ImageUploadError,
+    load_pending_media,
+    lookup_media_urls,
+    lookup_responsive_images,
+    publish_legacy_images,
+    publish_staged_media,
+    stage_content_images,
+    stage_media,
+)
+from jobs import JOB_HANDLERS, enqueue, get_job, has_live_workers, job_handler, run_worker
+from blog_changes import current_blogs_version, record_blog_change
+from facet_index import FacetIndex
+from query_cache import QueryCache
+from search_index import SearchIndex
+from authors import (
+    author_snapshot,
+    backfill_author_snapshots,
+    refresh_author_snapshots,
+)
+from indexes import ensure_indexes, explain_hot_queries
+from clients import http_session, lazy_client
+from syndication import load_artifact, regenerate_syndication
+from assets import (
+    ASSET_MAX_AGE,
+    ASSETS_FOLDER,
+    BUNDLES,
+    MIMETYPES,
+    STATIC_FOLDER,
+    build_assets,
+    bundle_source,
+    find_memory_bundle,
+    load_manifest,
+    memory_bundle,
+    precompressed_variant,
+)
+from compression import (
+    COMPRESSION_MIN_SIZE,
+    compress,
+    compress_response,
+    negotiate_encoding,
+    set_encoded_body,
+)
+from content_pipeline import content_metadata, process_content
+from csrf import csrf_protected, csrf_token, set_csrf_cookie
+from http_cache import cache_policy, compute_etag, policy_for
+from pagination import (
+    BLOG_CARD_PROJECTION,
+    fetch_blog_page,
+    fetch_comment_page,
+    parse_cursor,
+    parse_page_size,
+    serialize_blog_card,
+    serialize_comment,
+)
 
 
-# Loading the environment variables
-
-load_dotenv()
-
-# Initializing the application
+# The routes, hooks and commands of the application, registered on the app built by create_app
 
-app = Flask(__name__)
+site = Blueprint("site", __name__, cli_group=None)
 
 # Setting the service version
 
@@ -47,99 +145,359 @@ SITE_CONFIG = {
     "LANGUAGE": "en-us"
 }
 
-# App Configuration
+# Client Configuration, nothing connects at import, each process creates its clients on first use
+
+ENSURE_INDEXES_ON_BOOT = os.getenv("ENSURE_INDEXES_ON_BOOT", "false").lower() == "true"
+
+# Every client has a bounded pool and a timeout, a slow or unreachable service fails the requests
+# using it instead of holding every worker, which matters most under the gevent workers where one
+# process serves many requests at once
 
-app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_TIMEOUT = 5
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 50))
+MONGODB_TIMEOUT_MS = 5000
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", 20000))
 
-# Session Configuration
 
-redis_url = os.getenv("REDIS_URL")
-if not redis_url:
-    raise RuntimeError("Environment variable REDIS_URL not set")
+def connect_redis():
+    return InstrumentedRedis(
+        connection_pool=redis.BlockingConnectionPool.from_url(
+            os.getenv("REDIS_URL"),
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_TIMEOUT,
+            socket_connect_timeout=REDIS_TIMEOUT,
+            socket_timeout=REDIS_TIMEOUT,
+            health_check_interval=30,
+        )
+    )
 
-app.config["SESSION_TYPE"] = "redis"
-app.config["SESSION_REDIS"] = redis.from_url(redis_url)
-app.config["SESSION_COOKIE_SECURE"] = True
-app.config["SESSION_COOKIE_HTTPONLY"] = True
-app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
-app.config["SESSION_COOKIE_NAME"] = "inkbloom-session"
 
-# Database Configuration
+def connect_mongodb():
+    return MongoClient(
+        os.getenv("MONGODB_URL"),
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        waitQueueTimeoutMS=MONGODB_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGODB_TIMEOUT_MS,
+        connectTimeoutMS=MONGODB_TIMEOUT_MS,
+        socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+        event_listeners=[MongoCommandListener()],
+    )
 
-mongodb_url = os.getenv("MONGODB_URL")
-if not mongodb_url:
-    raise RuntimeError("Environment variable MONGODB_URL not set")
 
-MONOGDB_CLIENT = MongoClient(mongodb_url)
-DATABASE = MONOGDB_CLIENT["INKBLOOM"]
+def open_database():
+    database = MONOGDB_CLIENT["INKBLOOM"]
+    if ENSURE_INDEXES_ON_BOOT:
+        try:
+            ensure_indexes(database)
+        except PyMongoError as e:
+            current_app.logger.warning(f"The database indexes could not be ensured: {str(e)}")
+    return database
 
 
-# Session Initialization
+REDIS_CLIENT = lazy_client(connect_redis)
+MONOGDB_CLIENT = lazy_client(connect_mongodb)
+DATABASE = lazy_client(open_database)
 
-Session(app)
+# Accounts API Configuration
 
-def format_rfc822(dt):
-    """Formats a datetime object into RFC 822 format (required for RSS pubDate)."""
-    if dt.tzinfo is None:
-        return dt.strftime('%a, %d %b %Y %H:%M:%S GMT')
-    else:
-        # If timezone-aware, format accordingly (this example assumes UTC)
-        return dt.strftime('%a, %d %b %Y %H:%M:%S %Z').replace("UTC", "GMT")
+ACCOUNTS_API_URL = os.getenv(
+    "ACCOUNTS_API_URL", "https://accounts.om-mishra.com/api/v1/oauth2/user-info"
+)
+ACCOUNTS_API_TIMEOUT = (3.05, float(os.getenv("ACCOUNTS_API_TIMEOUT", 10)))
+ACCOUNTS_SESSION = lazy_client(lambda: http_session(10))
+
+# Search Index Configuration
 
+SEARCH_INDEX = SearchIndex()
+SEARCH_QUERY_CACHE = QueryCache(max_entries=2048, ttl=300)
+FACET_INDEX = FacetIndex()
 
-def calculate_read_time(html_content, words_per_minute=200, image_time_seconds=12):
-    text_content = re.sub(r"<[^>]*>", "", html_content)  # Remove HTML tags
-    word_count = len(re.findall(r"\w+", text_content))
+# Static Asset Configuration
 
-    text_read_time_minutes = word_count / words_per_minute
+ASSET_MANIFEST = load_manifest(STATIC_FOLDER)
 
-    image_count = len(re.findall(r"<img [^>]*>", html_content))
-    image_read_time_seconds = image_count * image_time_seconds
+# View Counter Configuration
 
-    total_read_time_minutes = text_read_time_minutes + (image_read_time_seconds / 60)
-    return int(total_read_time_minutes)
+VIEW_FLUSH_INTERVAL = int(os.getenv("VIEW_FLUSH_INTERVAL", 30))
+
+# Job Queue Configuration
+
+JOBS_RUN_INLINE = os.getenv("JOBS_RUN_INLINE", "false").lower() == "true"
 
 
 # Application Template Filters
 
 
-@app.template_filter("format_timestamp")
+@site.app_template_filter("format_timestamp")
 def format_timestamp(s):
     return datetime.strptime(s, "%Y-%m-%d %H:%M:%S.%f").strftime("%d %B %Y")
 
 
-@app.template_filter("rss_timestamp")
+@site.app_template_filter("rss_timestamp")
 def rss_timestamp(s):
+    import utils
+
     return utils.format_datetime(
         datetime.strptime(s, "%Y-%m-%d %H:%M:%S.%f").replace(tzinfo=timezone.utc)
     )
 
 
-@app.template_filter("sitemap_timestamp")
+@site.app_template_filter("sitemap_timestamp")
 def sitemap_timestamp(s):
     return s.strftime("%Y-%m-%d")
 
 
-@app.template_filter("url_encode")
+@site.app_template_filter("url_encode")
 def urlencode(s):
     return urllib.parse.quote(s)
 
 
-@app.context_processor
+@site.app_context_processor
 def app_version():
     return dict(service_version=service_version)
 
 
-@app.context_processor
-def csrf_token():
-    session["csrf_token"] = secrets.token_hex(16)
-    return dict(csrf_token=session["csrf_token"])
+site.add_app_template_global(csrf_token, "csrf_token")
+
+
+@site.app_template_global("asset_url")
+def asset_url(bundle):
+    """
+    Returns the fingerprinted URL of a bundle.
+
+    Without a build, like on Vercel, the bundle is built in memory instead. In debug mode its
+    unbuilt source is served, so edits show up on reload.
+    """
+    if bundle in ASSET_MANIFEST:
+        return url_for("site.asset", filename=ASSET_MANIFEST[bundle])
+    if bundle in BUNDLES and not current_app.debug:
+        return url_for("site.asset", filename=memory_bundle(bundle, current_app.static_folder)[0])
+    return url_for("site.asset", filename=bundle)
+
+
+# Instrumentation Configuration
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+
+@site.before_app_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+
+@site.after_app_request
+def record_request_metrics(response):
+    if "request_started_at" not in g:
+        return response
+    duration = time.perf_counter() - g.request_started_at
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_LATENCY.observe(duration, route, request.method, response.status_code)
+    # Registered first so it runs last, the length is the one of the compressed body
+    if response.content_length is not None:
+        RESPONSE_BYTES.observe(response.content_length, route, request.method)
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = server_timing_header(
+            duration, g.get("request_timings", {})
+        )
+    return response
+
+
+def start_template_timer(sender, template, context, **extra):
+    g.setdefault("template_started_at", []).append(time.perf_counter())
+
+
+def record_template_metrics(sender, template, context, **extra):
+    duration = time.perf_counter() - g.template_started_at.pop()
+    TEMPLATE_LATENCY.observe(duration, template.name)
+    record_request_timing("render", duration)
+
+
+
+# Profiling Configuration
+
+PROFILER = Profiler(
+    directory=os.getenv("PROFILE_DIR", "/tmp/inkbloom-profiles"),
+    sample_rate=int(os.getenv("PROFILE_SAMPLE_RATE", 0)),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000,
+    max_duration=float(os.getenv("PROFILE_MAX_SECONDS", 10)),
+    max_concurrent=int(os.getenv("PROFILE_MAX_CONCURRENT", 1)),
+    max_files=int(os.getenv("PROFILE_MAX_FILES", 200)),
+    max_bytes=int(os.getenv("PROFILE_MAX_MB", 50)) * 1024 * 1024,
+)
+
+
+# The profile lives in the WSGI environ, the nested request context of regenerate_feeds has its own
+
+PROFILE_ENVIRON_KEY = "inkbloom.profile"
+
+
+def profile_parameters():
+    return {**(request.view_args or {}), **request.args.to_dict()}
+
+
+@site.before_app_request
+def start_profiler():
+    """Samples the request when it carries a valid profile token, or once every PROFILE_SAMPLE_RATE requests."""
+    if not PROFILER.should_profile(
+        current_app.config["SECRET_KEY"], request.headers.get(PROFILE_HEADER_NAME)
+    ):
+        return
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    sampler = PROFILER.start(f"{request.method} {rule}")
+    if sampler is not None:
+        request.environ[PROFILE_ENVIRON_KEY] = (
+            sampler,
+            profile_id(request.endpoint or "unmatched", profile_parameters()),
+        )
+
+
+@site.after_app_request
+def send_profile_id(response):
+    if PROFILE_ENVIRON_KEY in request.environ:
+        response.headers[PROFILE_ID_HEADER_NAME] = request.environ[PROFILE_ENVIRON_KEY][1]
+    return response
+
+
+@site.teardown_app_request
+def write_profile(exception):
+    # Runs once the after-request hooks are done, so compression and caching are profiled too
+    profile = request.environ.pop(PROFILE_ENVIRON_KEY, None)
+    if profile is None:
+        return
+    sampler, request_profile_id = profile
+    PROFILER.finish(
+        sampler,
+        request_profile_id,
+        {
+            "endpoint": request.endpoint,
+            "method": request.method,
+            "path": request.path,
+            "parameters": profile_parameters(),
+            "error": repr(exception) if exception else None,
+            "timings": {
+                component: {"duration_ms": round(duration * 1000, 3), "calls": operations}
+                for component, (duration, operations) in g.get("request_timings", {}).items()
+            },
+        },
+    )
+
+
+# Response Compression Configuration
+
+
+@site.after_app_request
+def compress_body(response):
+    # Registered before the other hooks so it runs after them, on the final body and ETag
+    return compress_response(response, request.accept_encodings)
+
+
+# Rate Limit Configuration
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+
+
+@site.before_app_request
+def enforce_rate_limits():
+    """Refuses the requests over the limits of their route, before the view or the cache reach Mongo."""
+    limits = limits_for(current_app, request.endpoint)
+    if not RATE_LIMIT_ENABLED or not limits:
+        return
+    try:
+        g.rate_limit = check_rate_limits(REDIS_CLIENT, request.endpoint, limits)
+    except redis.RedisError:
+        # Without Redis the requests are served unlimited rather than refused
+        return
+    if g.rate_limit is not None and not g.rate_limit["allowed"]:
+        abort(429)
+
+
+@site.after_app_request
+def send_rate_limit_headers(response):
+    if g.get("rate_limit") is not None:
+        response.headers.update(rate_limit_headers(g.rate_limit))
+    return response
+
+
+# HTTP Cache Configuration
+
+
+def blogs_etag_version():
+    """ETag version of the pages listing blogs, bumped by every blog write but not by view flushes."""
+    try:
+        return current_blogs_version(REDIS_CLIENT)
+    except redis.RedisError:
+        return None
+
+
+def blog_page_etag_version():
+    return blog_page_version(REDIS_CLIENT, request.view_args["slug"])
+
+
+def record_revalidated_blog_view():
+    # A reader revalidating the page reads the blog again, the 304 counts as a view like a render
+    slug = request.view_args["slug"]
+    blog_id = cached_blog_id(REDIS_CLIENT, slug)
+    if blog_id is None:
+        blog_data = DATABASE["BLOGS"].find_one({"blog_metadata.slug": slug}, {"_id": 0, "blog_id": 1})
+        if blog_data is None:
+            return
+        blog_id = blog_data["blog_id"]
+    record_blog_view(blog_id)
+
+
+def is_personalized_request():
+    # Signed in users get per-user markup, and a response setting a cookie must not be shared
+    return session.get("user") is not None or session.modified or g.get("is_private_content", False)
+
+
+@site.before_app_request
+def short_circuit_not_modified():
+    """Answers a revalidation with 304 from the stored versions, before the view reads Mongo."""
+    g.etag = None
+    if request.method not in ("GET", "HEAD"):
+        return None
+    policy = policy_for(current_app, request.endpoint)
+    if policy is None:
+        return None
+
+    viewer = session.get("user") or {}
+    g.etag = compute_etag(
+        policy, current_app.config["SECRET_KEY"], service_version, request.full_path, viewer.get("user_id")
+    )
+    if g.etag is not None and request.if_none_match.contains_weak(g.etag):
+        if policy.not_modified is not None:
+            policy.not_modified()
+        return make_response("", 304)
+    return None
+
+
+@site.after_app_request
+def apply_cache_policy(response):
+    policy = policy_for(current_app, request.endpoint)
+    if policy is None or request.method not in ("GET", "HEAD"):
+        return response
+    if response.status_code not in (200, 304):
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    # Signed in readers get their own markup on the same URLs, Vary: Cookie keeps a shared cache
+    # from handing them the anonymous page. Anonymous readers are never sent a cookie, the
+    # session and the CSRF cookie are only set by the sign in and the forms of signed in users,
+    # so their requests carry no Cookie header and all share one cached copy.
+    response.vary.add("Cookie")
+    response.headers["Cache-Control"] = policy.cache_control(is_personalized_request())
+    if g.get("etag") is not None and response.get_etag()[0] is None:
+        # The same tag covers every encoding of the content, which only a weak tag may do
+        response.set_etag(g.etag, weak="Content-Encoding" in response.headers)
+    return response
 
 
 # After-request function for setting headers
 
 
-@app.after_request
+@site.after_app_request
 def add_header(response):
     response.headers["Access-Control-Allow-Origin"] = "*"
     # response.headers["Cache-Control"] = "public, max-age=3600"
@@ -154,98 +512,252 @@ def add_header(response):
     return response
 
 
+@site.after_app_request
+def send_csrf_cookie(response):
+    return set_csrf_cookie(response)
+
+
+# Application CLI Commands
+
+
+@site.cli.command("flush-views")
+def flush_views_command():
+    """Flushes the view counters accumulated in Redis to Mongo."""
+    print(f"Flushed the views of {flush_views(DATABASE, REDIS_CLIENT)} blogs")
+
+
+@site.cli.command("regenerate-feeds")
+def regenerate_feeds_command():
+    """Regenerates the pre-rendered RSS feed and sitemaps."""
+    regenerate_feeds()
+    print("Regenerated the RSS feed and sitemaps")
+
+
+@site.cli.command("process-content")
+def process_content_command():
+    """Runs the content pipeline over every stored blog."""
+    processed_blog_ids = []
+    for blog in DATABASE["BLOGS"].find(
+        {}, {"_id": 0, "blog_id": 1, "blog_content": 1, "blog_metadata.cover_url": 1}
+    ):
+        cover_url = blog["blog_metadata"].get("cover_url")
+        processed_content, cover_image = process_blog_content(blog["blog_content"], cover_url)
+        DATABASE["BLOGS"].update_one(
+            {"blog_id": blog["blog_id"]},
+            {"$set": processed_blog_fields(processed_content, cover_url, cover_image)},
+        )
+        processed_blog_ids.append(blog["blog_id"])
+    invalidate_blogs(processed_blog_ids)
+    print(f"Processed the content of {len(processed_blog_ids)} blogs")
+
+
+@site.cli.command("process-images")
+def process_images_command():
+    """Publishes the responsive variants of the images of blogs saved before them."""
+    if image_encoders() is None:
+        raise click.ClickException("Pillow is required to create the image variants")
+    published_images = {}
+    processed_blog_ids = []
+    for blog in DATABASE["BLOGS"].find(
+        {}, {"_id": 0, "blog_id": 1, "blog_content": 1, "blog_metadata.cover_url": 1}
+    ):
+        cover_url = blog["blog_metadata"].get("cover_url")
+        images = {}
+
+        def resolve_images(sources):
+            published, errors = publish_legacy_images(
+                DATABASE,
+                REDIS_CLIENT,
+                SITE_CONFIG["BASE_URL"],
+                [*sources, *([cover_url] if cover_url else [])],
+                published_images,
+            )
+            for source, error in errors.items():
+                print(f"Skipped {source} of blog {blog['blog_id']}: {error}")
+            images.update(published)
+            return images
+
+        processed_content = process_content(blog["blog_content"], resolve_images)
+        DATABASE["BLOGS"].update_one(
+            {"blog_id": blog["blog_id"]},
+            {"$set": processed_blog_fields(processed_content, cover_url, images.get(cover_url))},
+        )
+        processed_blog_ids.append(blog["blog_id"])
+    invalidate_blogs(processed_blog_ids)
+    print(
+        f"Processed the images of {len(processed_blog_ids)} blogs, "
+        f"{len([image for image in published_images.values() if image])} downloaded images have variants"
+    )
+
+
+@site.cli.command("recount-comments")
+def recount_comments_command():
+    """Recomputes the denormalized comment count of every blog."""
+    comment_counts = {
+        count["_id"]: count["number_of_comments"]
+        for count in DATABASE["COMMENTS"].aggregate(
+            [
+                {
+                    "$group": {
+                        "_id": "$comment_metadata.blog_id",
+                        "number_of_comments": {"$sum": 1},
+                    }
+                }
+            ]
+        )
+    }
+    blog_ids = [blog["blog_id"] for blog in DATABASE["BLOGS"].find({}, {"_id": 0, "blog_id": 1})]
+    for blog_id in blog_ids:
+        DATABASE["BLOGS"].update_one(
+            {"blog_id": blog_id},
+            {"$set": {"blog_metadata.number_of_comments": comment_counts.get(blog_id, 0)}},
+        )
+    invalidate_blogs(blog_ids)
+    print(f"Recounted the comments of {len(blog_ids)} blogs")
+
+
+@site.cli.command("build-assets")
+def build_assets_command():
+    """Bundles, minifies, fingerprints and precompresses the static assets."""
+    for bundle, filename in build_assets(current_app.static_folder).items():
+        print(f"{bundle} -> {ASSETS_FOLDER}/{filename}")
+
+
+@site.cli.command("run-worker")
+@click.option("--burst", is_flag=True, help="Exit once no job is due.")
+@click.option("--poll-interval", default=1.0, help="Seconds to wait when the queue is empty.")
+def run_worker_command(burst, poll_interval):
+    """Runs the queued jobs, start one process per worker."""
+    run_worker(REDIS_CLIENT, JOB_HANDLERS, poll_interval=poll_interval, burst=burst)
+
+
+@site.cli.command("profile-token")
+@click.option("--minutes", default=60, help="How long the token stays valid.")
+def profile_token_command(minutes):
+    """Prints a token that profiles the requests sending it in the X-Profile-Token header."""
+    print(generate_profile_token(current_app.config["SECRET_KEY"], minutes * 60))
+
+
+@site.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Creates the indexes every route relies on."""
+    for collection_name, index_names in ensure_indexes(DATABASE).items():
+        print(f"{collection_name}: {', '.join(index_names)}")
+
+
+@site.cli.command("verify-indexes")
+def verify_indexes_command():
+    """Explains the hot queries of the routes and fails if any of them scans a collection."""
+    collection_scans = 0
+    for name, stages, uses_collection_scan in explain_hot_queries(DATABASE):
+        collection_scans += uses_collection_scan
+        print(f"{'COLLSCAN' if uses_collection_scan else 'OK':<8} {name}: {' <- '.join(stages)}")
+    if collection_scans:
+        raise SystemExit(f"{collection_scans} hot queries are not served by an index")
+
+
+@site.cli.command("backfill-authors")
+def backfill_authors_command():
+    """Embeds author snapshots into the existing blogs and comments."""
+    touched_blog_ids = backfill_author_snapshots(DATABASE)
+    invalidate_blogs(touched_blog_ids)
+    print(f"Backfilled the author snapshots of {len(touched_blog_ids)} blogs")
+
+
 # Application Routes
 
 
-@app.route("/", methods=["GET"])
+@site.route("/", methods=["GET"])
+@cache_policy(max_age=60, stale_while_revalidate=300, version=blogs_etag_version)
 def index():
+    try:
+        before = parse_cursor(request.args.get("before"))
+        after = parse_cursor(request.args.get("after"))
+    except ValueError:
+        abort(400)
+
     if (
         session.get("user") is not None
         and session.get("user").get("username") == "om-mishra7"
     ):
-        blogs_pipeline = [
-            {"$sort": {"_id": -1}},
-            {
-                "$lookup": {
-                    "from": "USERS",
-                    "localField": "blog_author.user_id",
-                    "foreignField": "user_id",
-                    "as": "author_details",
-                }
-            },
-            {"$unwind": "$author_details"},
-        ]
-        featured_blogs_pipeline = [
-            {"$match": {"blog_metadata.featured": True}},
-            {"$sort": {"_id": -1}},
-            {"$limit": 5},
-            {
-                "$lookup": {
-                    "from": "USERS",
-                    "localField": "blog_author.user_id",
-                    "foreignField": "user_id",
-                    "as": "author_details",
-                }
-            },
-            {"$unwind": "$author_details"},
-        ]
+        blogs_match = {}
+        featured_blogs_match = {"blog_metadata.featured": True}
     else:
-        blogs_pipeline = [
-            {"$match": {"blog_metadata.visibility": "public"}},
-            {"$sort": {"_id": -1}},
-            {
-                "$lookup": {
-                    "from": "USERS",
-                    "localField": "blog_author.user_id",
-                    "foreignField": "user_id",
-                    "as": "author_details",
-                }
-            },
-            {"$unwind": "$author_details"},
-        ]
-        featured_blogs_pipeline = [
-            {
-                "$match": {
-                    "blog_metadata.visibility": "public",
-                    "blog_metadata.featured": True,
-                }
-            },
-            {"$sort": {"_id": -1}},
-            {"$limit": 5},
-            {
-                "$lookup": {
-                    "from": "USERS",
-                    "localField": "blog_author.user_id",
-                    "foreignField": "user_id",
-                    "as": "author_details",
-                }
-            },
-            {"$unwind": "$author_details"},
-        ]
+        blogs_match = {"blog_metadata.visibility": "public"}
+        featured_blogs_match = {
+            "blog_metadata.visibility": "public",
+            "blog_metadata.featured": True,
+        }
+
+    blogs_page = fetch_blog_page(
+        DATABASE["BLOGS"], blogs_match, before=before, after=after
+    )
+    featured_blogs = list(
+        DATABASE["BLOGS"]
+        .find(featured_blogs_match, BLOG_CARD_PROJECTION)
+        .sort("_id", -1)
+        .limit(5)
+    )
+
+    return render_template(
+        "index.html",
+        blogs=blogs_page["blogs"],
+        newer_cursor=blogs_page["newer_cursor"],
+        older_cursor=blogs_page["older_cursor"],
+        featured_blogs=featured_blogs,
+    )
+
 
-    blogs = list(DATABASE["BLOGS"].aggregate(blogs_pipeline))
-    featured_blogs = list(DATABASE["BLOGS"].aggregate(featured_blogs_pipeline))
+@site.route("/api/blogs", methods=["GET"])
+@cache_policy(max_age=60, stale_while_revalidate=300, version=blogs_etag_version)
+def blogs_api():
+    try:
+        before = parse_cursor(request.args.get("before"))
+        after = parse_cursor(request.args.get("after"))
+    except ValueError:
+        return jsonify(
+            {
+                "status": "error",
+                "message": "The pagination cursor is invalid!",
+            }
+        ), 400
+
+    blogs_page = fetch_blog_page(
+        DATABASE["BLOGS"],
+        {"blog_metadata.visibility": "public"},
+        before=before,
+        after=after,
+        limit=parse_page_size(request.args.get("limit")),
+    )
 
-    return render_template("index.html", blogs=blogs, featured_blogs=featured_blogs)
+    return jsonify(
+        {
+            "status": "success",
+            "results": [serialize_blog_card(blog) for blog in blogs_page["blogs"]],
+            "newer_cursor": blogs_page["newer_cursor"],
+            "older_cursor": blogs_page["older_cursor"],
+        }
+    )
 
 
-@app.route("/blog/new-blog", methods=["GET"])
+@site.route("/blog/new-blog", methods=["GET"])
 def new_blog():
     if (
         session.get("user") is None
         and session.get("user").get("username") != "om-mishra7"
     ):
-        return redirect(url_for("login"))
+        return redirect(url_for("site.login"))
     return render_template("create_blog.html")
 
 
-@app.route("/api/blog", methods=["POST"])
+@site.route("/api/blog", methods=["POST"])
+@csrf_protected
 def create_blog():
     if (
         session.get("user") is None
         and session.get("user").get("username") != "om-mishra7"
     ):
-        return redirect(url_for("login"))
+        return redirect(url_for("site.login"))
     blog_title = request.form.get("title")
     blog_description = request.form.get("description")
     blog_slug = request.form.get("slug").lower()
@@ -275,99 +787,25 @@ def create_blog():
             }
         )
 
-    # All images in the content are base64 encoded, so we need to extract them and upload them to the CDN and replace the base64 encoded images with the CDN URLs
-
-    image_urls = []
-
-    # Find all base64-encoded images in the blog content
-    base64_images = re.findall(
-        r'<img src="data:image/([^;]+);base64,([^"]+)"', blog_content
-    )
-
-    # Loop through each base64-encoded image found
-    for image_type, image_data in base64_images:
-        # Decode the base64 image data
-        try:
-            image = base64.b64decode(image_data)
-        except base64.binascii.Error:
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": "Invalid base64 image data found!",
-                }
-            )
-
-        # Send a POST request to upload the image to the CDN
-        try:
-            image_upload_response = requests.post(
-                "https://api.cdn.om-mishra.com/v1/upload-file",
-                headers={
-                    "X-Authorization": os.getenv("CDN_API_KEY"),
-                },
-                files={
-                    "file": base64.b64decode(image_data),
-                },
-                data={
-                    # Hashing the image content to generate a unique object path
-                    "object_path": f"blogs/media/{str(hash(image))[1:8]}.png",
-                },
-                timeout=5,
-            )
-
-            # Check if the image upload was successful
-            if image_upload_response.status_code != 200:
-                return jsonify(
-                    {
-                        "status": "error",
-                        "message": "The blog creation failed, due to an invalid response from the Image Upload API!",
-                    }
-                )
-
-            # Append the URL of the uploaded image to the image_urls list
-            image_urls.append(image_upload_response.json().get("file_url"))
-
-        except Exception as e:
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": f"Image upload failed: {str(e)}",
-                }
-            )
-
-    # Replace base64-encoded images in the blog content with their respective uploaded URLs
-    for index, (image_type, image_data) in enumerate(base64_images):
-        if index < len(image_urls):
-            blog_content = blog_content.replace(
-                f"data:image/{image_type};base64,{image_data}",
-                f"https://wsrv.nl/?url={image_urls[index]}&output=webp&quality=80&q=80&maxage=30d",
-            )
-
-    # Calculate the read time of the blog
-    blog_read_time = calculate_read_time(blog_content)
-
-    # Upload the cover image to the CDN
-    cover_upload_response = requests.post(
-        "https://api.cdn.om-mishra.com/v1/upload-file",
-        headers={
-            "X-Authorization": os.getenv("CDN_API_KEY"),
-        },
-        files={
-            "file": blog_cover,
-        },
-        data={
-            "object_path": f"blogs/covers/{str(uuid.uuid4())}.png",
-        },
-        timeout=5,
-    )
-
-    # Check if the cover image upload was successful
-    if cover_upload_response.status_code != 200:
-        return jsonify(
-            {
-                "status": "error",
-                "message": "The blog creation failed, due to an invalid response from the Cover Image Upload API!",
-            }
+    # All images in the content are base64 encoded, they are staged and served by the app until the publish-blog-media job uploads them to the CDN
+    # The cover image is staged with them and uploaded with the content images
+    try:
+        blog_content = stage_content_images(
+            blog_content, DATABASE, REDIS_CLIENT, SITE_CONFIG["BASE_URL"]
+        )
+        blog_cover_url = stage_media(
+            DATABASE,
+            REDIS_CLIENT,
+            blog_cover.read(),
+            blog_cover.mimetype,
+            "covers",
+            SITE_CONFIG["BASE_URL"],
         )
+    except ImageUploadError as e:
+        return image_error_response(e)
+
+    # Derive the read time, excerpt, outline and image manifest once, the read paths never parse the content
+    processed_content, cover_image = process_blog_content(blog_content, blog_cover_url)
 
     # Insert the blog into the database
     data = {
@@ -380,31 +818,236 @@ def create_blog():
             "category": blog_category,
             "visibility": blog_visibility,
             "featured": True if blog_featured else False,
-            "cover_url": cover_upload_response.json()["file_url"],
-            "read_time": blog_read_time,
+            "cover_url": cover_image["src"] if cover_image else blog_cover_url,
+            "cover_image": cover_image,
+            **content_metadata(processed_content),
             "number_of_views": 0,
+            "number_of_comments": 0,
             "created_at": datetime.now(),
             "updated_at": datetime.now(),
         },
-        "blog_content": blog_content,
-        "blog_author": {
-            "user_id": session.get("user").get("user_id"),
-        },
+        "blog_content": processed_content["html"],
+        "blog_author": author_snapshot(
+            session.get("user").get("user_id"),
+            session.get("user").get("username"),
+            session.get("user").get("name"),
+            session.get("user").get("avatar_url"),
+        ),
     }
 
     DATABASE["BLOGS"].insert_one(data)
 
+    invalidate_blog_page(REDIS_CLIENT, data["blog_metadata"]["slug"])
+    record_blog_change(REDIS_CLIENT, data["blog_id"])
+
     return jsonify(
         {
             "status": "success",
             "slug": data["blog_metadata"]["slug"],
+            "job_id": enqueue_job(
+                "publish-blog-media",
+                {"blog_id": data["blog_id"]},
+                idempotency_key=f"publish-blog-media:{data['blog_id']}",
+            ),
             "message": "The blog has been successfully created!",
         }
     )
 
 
-@app.route("/blog/<slug>", methods=["GET"])
+def image_error_response(error):
+    """The response of a blog write whose images can't be staged."""
+    return jsonify(
+        {
+            "status": "error",
+            "message": str(error),
+        }
+    ), 413 if isinstance(error, ImageTooLargeError) else 400
+
+
+def process_blog_content(blog_content, cover_url):
+    """
+    Runs the content pipeline with the responsive images of the blog's media.
+
+    Returns the processed content and the responsive image of the cover, which is None
+    until the cover has variants.
+    """
+    images = {}
+
+    def resolve_images(sources):
+        # The cover is looked up with the sources the content parse collected, in one query
+        images.update(
+            lookup_responsive_images(DATABASE, SITE_CONFIG["BASE_URL"], [*sources, cover_url])
+        )
+        return images
+
+    return process_content(blog_content, resolve_images), images.get(cover_url)
+
+
+def processed_blog_fields(processed_content, cover_url, cover_image):
+    """The $set of a blog whose content or cover was processed again."""
+    return {
+        "blog_content": processed_content["html"],
+        "blog_metadata.cover_url": cover_image["src"] if cover_image else cover_url,
+        "blog_metadata.cover_image": cover_image,
+        **{
+            f"blog_metadata.{field}": value
+            for field, value in content_metadata(processed_content).items()
+        },
+    }
+
+
+def invalidate_blogs(blog_ids):
+    """Drops the cached pages of the given blogs, publishes them on the change feed and queues the feeds."""
+    blog_ids = list(blog_ids)
+    if not blog_ids:
+        return
+    slugs = [
+        blog["blog_metadata"]["slug"]
+        for blog in DATABASE["BLOGS"].find(
+            {"blog_id": {"$in": blog_ids}}, {"_id": 0, "blog_metadata.slug": 1}
+        )
+    ]
+    invalidate_blog_page(REDIS_CLIENT, *slugs)
+    record_blog_change(REDIS_CLIENT, *blog_ids)
+    # Rendering the feed and every sitemap is slow, the blog writes and sign ins only queue it
+    enqueue_job("regenerate-feeds", {}, idempotency_key="regenerate-feeds")
+
+
+def enqueue_job(name, payload, idempotency_key=None):
+    """
+    Queues a job for the workers and returns its id.
+
+    The job runs in the request instead when JOBS_RUN_INLINE is set, for deployments without
+    workers, when no worker sent a heartbeat lately, so nothing would run it, or when Redis is
+    unavailable, then None is returned.
+    """
+    if not JOBS_RUN_INLINE:
+        try:
+            if has_live_workers(REDIS_CLIENT):
+                return enqueue(REDIS_CLIENT, name, payload, idempotency_key)
+        except redis.RedisError:
+            pass
+    try:
+        JOB_HANDLERS[name](**payload)
+    except Exception as e:
+        current_app.logger.warning(f"The {name} job failed: {str(e)}")
+    return None
+
+
+@job_handler("publish-blog-media")
+def publish_blog_media(blog_id):
+    """
+    Uploads the staged images of a blog to the CDN as responsive variants, then rewrites the
+    blog to their markup and refreshes its cached pages and the feeds.
+    """
+    blog_data = DATABASE["BLOGS"].find_one(
+        {"blog_id": blog_id},
+        {
+            "_id": 0,
+            "blog_content": 1,
+            "blog_metadata.cover_url": 1,
+            "blog_metadata.cover_image": 1,
+            "blog_metadata.content_hash": 1,
+        },
+    )
+    if blog_data is None:
+        return
+
+    blog_content, cover_url = publish_staged_media(
+        DATABASE,
+        REDIS_CLIENT,
+        SITE_CONFIG["BASE_URL"],
+        blog_data["blog_content"],
+        blog_data["blog_metadata"]["cover_url"],
+    )
+    processed_content, cover_image = process_blog_content(blog_content, cover_url)
+    if (
+        processed_content["html"] != blog_data["blog_content"]
+        or cover_image != blog_data["blog_metadata"].get("cover_image")
+        or cover_url != blog_data["blog_metadata"]["cover_url"]
+    ):
+        # A save made in the meantime queued its own job, which publishes that version
+        DATABASE["BLOGS"].update_one(
+            {
+                "blog_id": blog_id,
+                "blog_metadata.content_hash": blog_data["blog_metadata"].get("content_hash"),
+                "blog_metadata.cover_url": blog_data["blog_metadata"]["cover_url"],
+            },
+            {"$set": processed_blog_fields(processed_content, cover_url, cover_image)},
+        )
+    invalidate_blogs([blog_id])
+
+
+def record_blog_view(blog_id):
+    viewer = session.get("user") or {}
+    record_view(
+        REDIS_CLIENT,
+        blog_id,
+        visitor_fingerprint(
+            request.remote_addr, request.user_agent.string, viewer.get("user_id")
+        ),
+    )
+    # Without workers the flush runs in this request, once per VIEW_FLUSH_INTERVAL across processes
+    if is_view_flush_due(REDIS_CLIENT, VIEW_FLUSH_INTERVAL):
+        enqueue_job("flush-views", {}, idempotency_key="flush-views")
+
+
+@job_handler("flush-views")
+def flush_pending_views():
+    flush_views(DATABASE, REDIS_CLIENT)
+
+
+def blog_page_fragments():
+    return {
+        "navbar_user": render_template("partials/navbar_user.html"),
+        "comment_form": render_template("partials/comment_form.html"),
+    }
+
+
+def signed_out_blog_page(slug, page_version, cached_page):
+    """
+    Serves the page every signed out reader gets, compressed once per page version.
+
+    The fragments render the same markup for all signed out readers, so the stitched page can
+    be cached in its compressed form next to the shared render.
+    """
+    encoding = negotiate_encoding(request.accept_encodings)
+    compressed_page = cached_page["compressed"].get(encoding)
+    if compressed_page is None:
+        html = render_fragments(cached_page["html"], blog_page_fragments())
+        if encoding is None or len(html) < COMPRESSION_MIN_SIZE:
+            return html
+        compressed_page = compress(html.encode("utf-8"), encoding)
+        store_compressed_blog_page(
+            REDIS_CLIENT, slug, page_version, encoding, compressed_page
+        )
+    return set_encoded_body(make_response(""), compressed_page, encoding)
+
+
+@site.route("/blog/<slug>", methods=["GET"])
+@cache_policy(
+    max_age=300,
+    stale_while_revalidate=3600,
+    version=blog_page_etag_version,
+    not_modified=record_revalidated_blog_view,
+)
 def blog(slug):
+    # Readers without any per-user controls on the page share one cached render
+
+    viewer = session.get("user")
+    is_shared_view = viewer is None or viewer.get("username") != "om-mishra7"
+    page_version = None
+
+    if is_shared_view:
+        page_version, cached_page = get_cached_blog_page(REDIS_CLIENT, slug)
+        if cached_page is not None and (
+            viewer is None or viewer.get("user_id") != cached_page["author_id"]
+        ):
+            record_blog_view(cached_page["blog_id"])
+            if viewer is None:
+                return signed_out_blog_page(slug, page_version, cached_page)
+            return render_fragments(cached_page["html"], blog_page_fragments())
+
     blog_data = DATABASE["BLOGS"].find_one({"blog_metadata.slug": slug})
     if blog_data is None:
         abort(404)
@@ -414,40 +1057,54 @@ def blog(slug):
             or session.get("user").get("user_id") != blog_data["blog_author"]["user_id"]
         ):
             abort(401)
-    author_data = DATABASE["USERS"].find_one(
-        {"user_id": blog_data["blog_author"]["user_id"]}
-    )
-    comments = list(
-        DATABASE["COMMENTS"].aggregate(
-            [
-                {"$match": {"comment_metadata.blog_id": blog_data["blog_id"]}},
-                {"$sort": {"_id": -1}},
-                {
-                    "$lookup": {
-                        "from": "USERS",
-                        "localField": "comment_author.user_id",
-                        "foreignField": "user_id",
-                        "as": "author_details",
-                    }
-                },
-                {"$unwind": "$author_details"},
-            ]
+    author_data = blog_data["blog_author"]
+    # Only the newest comments are rendered, older pages are loaded from the comments API
+    comments_page = fetch_comment_page(DATABASE["COMMENTS"], blog_data["blog_id"])
+    record_blog_view(blog_data["blog_id"])
+
+    if (
+        is_shared_view
+        and blog_data["blog_metadata"]["visibility"] == "public"
+        and (viewer is None or viewer.get("user_id") != blog_data["blog_author"]["user_id"])
+    ):
+        shared_html = render_template(
+            "blog.html",
+            blog=blog_data,
+            author=author_data,
+            comments=comments_page["comments"],
+            older_comments_cursor=comments_page["older_cursor"],
+            cache_fragments=True,
         )
+        store_blog_page(
+            REDIS_CLIENT,
+            slug,
+            page_version,
+            blog_data["blog_id"],
+            blog_data["blog_author"]["user_id"],
+            shared_html,
+        )
+        if viewer is None:
+            return signed_out_blog_page(
+                slug, page_version, {"html": shared_html, "compressed": {}}
+            )
+        return render_fragments(shared_html, blog_page_fragments())
+
+    return render_template(
+        "blog.html",
+        blog=blog_data,
+        author=author_data,
+        comments=comments_page["comments"],
+        older_comments_cursor=comments_page["older_cursor"],
     )
-    DATABASE["BLOGS"].update_one(
-        {"blog_id": blog_data["blog_id"]},
-        {"$set": {"blog_metadata.number_of_views": blog_data["blog_metadata"]["number_of_views"] + 1}},
-    )
-    return render_template("blog.html", blog=blog_data, author=author_data, comments=comments)
 
 
-@app.route("/blog/<id>/edit", methods=["GET"])
+@site.route("/blog/<id>/edit", methods=["GET"])
 def edit_blog(id):
     if (
         session.get("user") is None
         and session.get("user").get("username") != "om-mishra7"
     ):
-        return redirect(url_for("login"))
+        return redirect(url_for("site.login"))
     blog_data = DATABASE["BLOGS"].find_one({"blog_id": id})
     if blog_data is None:
         abort(404)
@@ -458,14 +1115,19 @@ def edit_blog(id):
     return render_template("edit_blog.html", blog=blog_data)
 
 
-@app.route("/api/blog/<id>", methods=["PUT"])
+@site.route("/api/blog/<id>", methods=["PUT"])
+@csrf_protected
 def update_blog(id):
     if (
         session.get("user") is None
         and session.get("user").get("username") != "om-mishra7"
     ):
-        return redirect(url_for("login"))
-    blog_data = DATABASE["BLOGS"].find_one({"blog_id": id})
+        return redirect(url_for("site.login"))
+    # Only the fields the edit needs, the counters are $inc'ed by the view flushes and comments meanwhile
+    blog_data = DATABASE["BLOGS"].find_one(
+        {"blog_id": id},
+        {"_id": 0, "blog_metadata.slug": 1, "blog_metadata.cover_url": 1},
+    )
     if blog_data is None:
         abort(404)
     blog_title = request.form.get("title")
@@ -496,132 +1158,69 @@ def update_blog(id):
             }
         )
 
-    # All images in the content are base64 encoded, so we need to extract them and upload them to the CDN and replace the base64 encoded images with the CDN URLs
-
-    image_urls = []
-
-    # Find all base64-encoded images in the blog content
-    base64_images = re.findall(
-        r'<img src="data:image/([^;]+);base64,([^"]+)"', blog_content
-    )
-
-    # Loop through each base64-encoded image found
-    for image_type, image_data in base64_images:
-        # Decode the base64 image data
-        try:
-            image = base64.b64decode(image_data)
-        except base64.binascii.Error:
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": "Invalid base64 image data found!",
-                }
-            )
-
-        # Send a POST request to upload the image to the CDN
-        try:
-            image_upload_response = requests.post(
-                "https://api.cdn.om-mishra.com/v1/upload-file",
-                headers={
-                    "X-Authorization": os.getenv("CDN_API_KEY"),
-                },
-                files={
-                    "file": base64.b64decode(image_data),
-                },
-                data={
-                    # Hashing the image content to generate a unique object path
-                    "object_path": f"blogs/media/{str(hash(image))[1:8]}.png",
-                },
-                timeout=5,
-            )
-
-            # Check if the image upload was successful
-            if image_upload_response.status_code != 200:
-                return jsonify(
-                    {
-                        "status": "error",
-                        "message": "The blog update failed, due to an invalid response from the Image Upload API!",
-                    }
-                )
-
-            # Append the URL of the uploaded image to the image_urls list
-            image_urls.append(image_upload_response.json().get("file_url"))
-
-        except Exception as e:
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": f"Image upload failed: {str(e)}",
-                }
-            )
-
-    # Replace base64-encoded images in the blog content with their respective uploaded URLs
-
-    for index, (image_type, image_data) in enumerate(base64_images):
-        if index < len(image_urls):
-            blog_content = blog_content.replace(
-                f"data:image/{image_type};base64,{image_data}",
-                f"https://wsrv.nl/?url={image_urls[index]}&output=webp&quality=80&q=80&maxage=30d",
-            )
-
-    # Calculate the read time of the blog
-    blog_read_time = calculate_read_time(blog_content)
-
-    # Upload the cover image to the CDN
-    if blog_cover:
-        cover_upload_response = requests.post(
-            "https://api.cdn.om-mishra.com/v1/upload-file",
-            headers={
-                "X-Authorization": os.getenv("CDN_API_KEY"),
-            },
-            files={
-                "file": blog_cover,
-            },
-            data={
-                "object_path": f"blogs/covers/{str(uuid.uuid4())}.png",
-            },
-            timeout=5,
+    # All images in the content are base64 encoded, they are staged and served by the app until the publish-blog-media job uploads them to the CDN
+    # A new cover image is staged with them and uploaded with the content images
+    cover_url = blog_data["blog_metadata"].get("cover_url")
+    try:
+        blog_content = stage_content_images(
+            blog_content, DATABASE, REDIS_CLIENT, SITE_CONFIG["BASE_URL"]
         )
-
-        # Check if the cover image upload was successful
-        if cover_upload_response.status_code != 200:
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": "The blog update failed, due to an invalid response from the Cover Image Upload API!",
-                }
+        if blog_cover:
+            cover_url = stage_media(
+                DATABASE,
+                REDIS_CLIENT,
+                blog_cover.read(),
+                blog_cover.mimetype,
+                "covers",
+                SITE_CONFIG["BASE_URL"],
             )
+    except ImageUploadError as e:
+        return image_error_response(e)
 
-        # Update the blog cover URL
-        blog_data["blog_metadata"]["cover_url"] = cover_upload_response.json()[
-            "file_url"
-        ]
+    # Derive the read time, excerpt, outline and image manifest once, the read paths never parse the content
+    processed_content, cover_image = process_blog_content(blog_content, cover_url)
 
-    # Update the blog data
-    blog_data["blog_metadata"]["title"] = blog_title
-    blog_data["blog_metadata"]["description"] = blog_description
-    blog_data["blog_metadata"]["slug"] = f"{blog_category}:-{blog_slug}"
-    blog_data["blog_metadata"]["tags"] = [
-        tag.strip() for tag in request.form.get("tags").lower().strip().split(",")
-    ]
-    blog_data["blog_metadata"]["category"] = blog_category
-    blog_data["blog_metadata"]["visibility"] = blog_visibility
-    blog_data["blog_metadata"]["featured"] = True if blog_featured else False
-    blog_data["blog_metadata"]["read_time"] = blog_read_time
-    blog_data["blog_metadata"]["updated_at"] = datetime.now()
-    blog_data["blog_content"] = blog_content
+    # Update only the edited fields
+    previous_slug = blog_data["blog_metadata"]["slug"]
+    slug = f"{blog_category}:-{blog_slug}"
+    DATABASE["BLOGS"].update_one(
+        {"blog_id": id},
+        {
+            "$set": {
+                "blog_metadata.title": blog_title,
+                "blog_metadata.description": blog_description,
+                "blog_metadata.slug": slug,
+                "blog_metadata.tags": blog_tags,
+                "blog_metadata.category": blog_category,
+                "blog_metadata.visibility": blog_visibility,
+                "blog_metadata.featured": True if blog_featured else False,
+                "blog_metadata.updated_at": datetime.now(),
+                **processed_blog_fields(processed_content, cover_url, cover_image),
+            }
+        },
+    )
 
-    DATABASE["BLOGS"].update_one({"blog_id": id}, {"$set": blog_data})
+    invalidate_blog_page(REDIS_CLIENT, previous_slug, slug)
+    record_blog_change(REDIS_CLIENT, id)
 
     return jsonify(
         {
             "status": "success",
             "message": "The blog has been successfully updated!",
-            "slug": blog_data["blog_metadata"]["slug"],
+            "slug": slug,
+            # Saves made before the job runs are published by the same job
+            "job_id": enqueue_job(
+                "publish-blog-media",
+                {"blog_id": id},
+                idempotency_key=f"publish-blog-media:{id}",
+            ),
         }
     )
 
-@app.route("/api/blog/<id>/comment", methods=["POST"])
+@site.route("/api/blog/<id>/comment", methods=["POST"])
+@rate_limit(limit=5, period=60, per="user")
+@rate_limit(limit=20, period=60, per="ip")
+@csrf_protected
 def create_comment(id):
     blog_data = DATABASE["BLOGS"].find_one({"blog_id": id})
     if blog_data is None:
@@ -637,15 +1236,24 @@ def create_comment(id):
     comment_data = {
         "comment_id": str(uuid.uuid4()),
         "comment_content": comment_content,
-        "comment_author": {
-            "user_id": session.get("user").get("user_id"),
-        },
+        "comment_author": author_snapshot(
+            session.get("user").get("user_id"),
+            session.get("user").get("username"),
+            session.get("user").get("name"),
+            session.get("user").get("avatar_url"),
+        ),
         "comment_metadata": {
             "created_at": datetime.now(),
             "blog_id": blog_data["blog_id"],
         },
     }
     DATABASE["COMMENTS"].insert_one(comment_data)
+    DATABASE["BLOGS"].update_one(
+        {"blog_id": blog_data["blog_id"]},
+        {"$inc": {"blog_metadata.number_of_comments": 1}},
+    )
+
+    invalidate_blog_page(REDIS_CLIENT, blog_data["blog_metadata"]["slug"])
 
     return jsonify(
         {
@@ -654,94 +1262,213 @@ def create_comment(id):
         }
     )
 
-@app.route("/api/blog/<id>/comment/<comment_id>/delete", methods=["GET"])
+@site.route("/api/blog/<id>/comments", methods=["GET"])
+@cache_policy(max_age=30)
+def blog_comments_api(id):
+    blog_data = DATABASE["BLOGS"].find_one(
+        {"blog_id": id},
+        {"_id": 0, "blog_metadata.visibility": 1, "blog_author.user_id": 1},
+    )
+    if blog_data is None:
+        abort(404)
+    if blog_data["blog_metadata"]["visibility"] == "private":
+        if (
+            session.get("user") is None
+            or session.get("user").get("user_id") != blog_data["blog_author"]["user_id"]
+        ):
+            abort(401)
+        # Only the author may read these, no shared cache may keep them
+        g.is_private_content = True
+
+    try:
+        before = parse_cursor(request.args.get("cursor"))
+    except ValueError:
+        return jsonify(
+            {
+                "status": "error",
+                "message": "The pagination cursor is invalid!",
+            }
+        ), 400
+
+    comments_page = fetch_comment_page(DATABASE["COMMENTS"], id, before=before)
+
+    return jsonify(
+        {
+            "status": "success",
+            "results": [serialize_comment(comment) for comment in comments_page["comments"]],
+            "html": "".join(
+                render_template("partials/comment.html", comment=comment)
+                for comment in comments_page["comments"]
+            ),
+            "older_cursor": comments_page["older_cursor"],
+        }
+    )
+
+@site.route("/api/blog/<id>/comment/<comment_id>/delete", methods=["GET"])
 def delete_comment(id, comment_id):
     comment_data = DATABASE["COMMENTS"].find_one({"comment_id": comment_id})
     if comment_data is None:
         abort(404)
     if session.get("user").get("user_id") != comment_data["comment_author"]["user_id"]:
         abort(401)
-    DATABASE["COMMENTS"].delete_one({"comment_id": comment_id})
+    if DATABASE["COMMENTS"].delete_one({"comment_id": comment_id}).deleted_count:
+        DATABASE["BLOGS"].update_one(
+            {"blog_id": comment_data["comment_metadata"]["blog_id"]},
+            {"$inc": {"blog_metadata.number_of_comments": -1}},
+        )
+
+    blog_slug = DATABASE["BLOGS"].find_one({"blog_id": id})["blog_metadata"]["slug"]
+    invalidate_blog_page(REDIS_CLIENT, blog_slug)
 
-    return redirect((f"/blog/{DATABASE['BLOGS'].find_one({'blog_id': id})['blog_metadata']['slug']}"))
+    return redirect(f"/blog/{blog_slug}")
 
-@app.route("/rss", methods=["GET"])
+@job_handler("regenerate-feeds")
+def regenerate_feeds():
+    # Feed URLs are built against the canonical site URL, not the host of the current request
+    with current_app.test_request_context(base_url=SITE_CONFIG["BASE_URL"]):
+        regenerate_syndication(DATABASE, REDIS_CLIENT, SITE_CONFIG)
+
+
+def serve_artifact(name):
+    artifact = load_artifact(REDIS_CLIENT, name)
+    if artifact is None and name in ("rss", "sitemap"):
+        regenerate_feeds()
+        artifact = load_artifact(REDIS_CLIENT, name)
+    if artifact is None:
+        abort(404)
+
+    encoding = negotiate_encoding(request.accept_encodings, artifact["encoded"])
+    response = make_response(artifact["encoded"][encoding] if encoding else artifact["body"])
+    response.headers["Content-Type"] = artifact["content_type"]
+    response.vary.add("Accept-Encoding")
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.set_etag(f"{artifact['etag']}-{encoding}" if encoding else artifact["etag"])
+    response.last_modified = artifact["last_modified"]
+    return response.make_conditional(request)
+
+
+@site.route("/rss", methods=["GET"])
+@cache_policy(max_age=900, stale_while_revalidate=3600)
 def rss_feed():
-    blogs_pipeline = [
-        {"$match": {"blog_metadata.visibility": "public"}},
-        {"$sort": {"blog_metadata.created_at": -1}}, # Sort by creation date descending
-        {
-            "$lookup": {
-                "from": "USERS", # Use your actual users collection name
-                "localField": "blog_author.user_id",
-                "foreignField": "user_id",
-                "as": "author_details",
-            }
-        },
-        {"$unwind": {"path": "$author_details", "preserveNullAndEmptyArrays": True}}, # Keep blogs even if author lookup fails
-        {"$limit": 20} # Limit the number of items in the feed
-    ]
-    blogs = list(DATABASE["BLOGS"].aggregate(blogs_pipeline)) #
-
-    # Pre-format dates if not using a Jinja filter
-    for blog in blogs:
-        if 'created_at' in blog.get('blog_metadata', {}):
-             blog['blog_metadata']['pubDate'] = format_rfc822(blog['blog_metadata']['created_at'])
-
-    # Use make_response to set the correct Content-Type
-    response = make_response(render_template(
-        "rss.xml",
-        blogs=blogs,
-        site=SITE_CONFIG,
-        last_build_date=format_rfc822(datetime.now(timezone.utc)) # Or use latest blog post date
-    ))
-    response.headers['Content-Type'] = 'application/rss+xml; charset=utf-8'
-    return response
+    return serve_artifact("rss")
 
-@app.route("/sitemap", methods=["GET"])
+@site.route("/sitemap", methods=["GET"])
+@cache_policy(max_age=3600, stale_while_revalidate=86400)
 def sitemap():
-    blogs_pipeline = [
-        {"$match": {"blog_metadata.visibility": "public"}},
-        {"$sort": {"blog_metadata.updated_at": -1}}, # Sort by update date for sitemap
-        # No need for author lookup in sitemap
-    ]
-    blogs = list(DATABASE["BLOGS"].aggregate(blogs_pipeline + [
-        {"$project": {
-            "_id": 0, # Exclude Mongo ID
-            "slug": "$blog_metadata.slug",
-            "lastmod": "$blog_metadata.updated_at"
-        }}
-    ]))
-
-    response = make_response(render_template(
-        "sitemap.xml",
-        blogs=blogs,
-        site=SITE_CONFIG
-    ))
-    response.headers['Content-Type'] = 'application/xml; charset=utf-8'
+    return serve_artifact("sitemap")
+
+@site.route("/sitemap/<int:part_number>", methods=["GET"])
+@cache_policy(max_age=3600, stale_while_revalidate=86400)
+def sitemap_part(part_number):
+    return serve_artifact(f"sitemap:{part_number}")
+
+# Application Metrics Routes
+
+
+@site.route("/metrics", methods=["GET"])
+def metrics():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        abort(401)
+    return Response(exposition(), mimetype="text/plain; version=0.0.4")
+
+
+# Application Job Routes
+
+
+@site.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    if session.get("user") is None:
+        abort(401)
+    job = get_job(REDIS_CLIENT, job_id)
+    if job is None:
+        abort(404)
+    return jsonify({"status": "success", "job": job})
+
+
+# Application Static Asset Routes
+
+
+@site.route("/assets/<path:filename>", methods=["GET"])
+def asset(filename):
+    mimetype = MIMETYPES.get(os.path.splitext(filename)[1])
+    if mimetype is None:
+        abort(404)
+
+    if filename in ASSET_MANIFEST.values():
+        asset_path, content_encoding = precompressed_variant(
+            os.path.join(current_app.static_folder, ASSETS_FOLDER, filename),
+            request.accept_encodings,
+        )
+        response = send_file(asset_path, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+        if content_encoding is not None:
+            response.headers["Content-Encoding"] = content_encoding
+        response.vary.add("Accept-Encoding")
+        # The filename changes with the content, browsers never have to revalidate it
+        response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+        return response
+
+    # Built in memory, compressed by the compress_body hook
+    memory_content = find_memory_bundle(filename, current_app.static_folder)
+    if memory_content is not None:
+        response = make_response(memory_content)
+        response.mimetype = mimetype
+        response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+        return response
+
+    # Unbuilt bundles are concatenated on the fly, for development
+    if filename not in BUNDLES:
+        abort(404)
+    response = make_response(bundle_source(filename, current_app.static_folder))
+    response.mimetype = mimetype
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@site.route("/media/<digest>", methods=["GET"])
+def staged_media(digest):
+    # A published image redirects to the CDN, so pages rendered while it was staged keep working
+    media_url = lookup_media_urls(DATABASE, REDIS_CLIENT, [digest]).get(digest)
+    if media_url is not None:
+        return redirect(media_url, 301)
+    pending_media = load_pending_media(DATABASE, digest)
+    if pending_media is None:
+        abort(404)
+
+    response = make_response(bytes(pending_media["data"]))
+    content_type = pending_media["content_type"] or ""
+    # The type comes from the upload, only raster images are served as such
+    if content_type.startswith("image/") and "svg" not in content_type:
+        response.mimetype = content_type
+    else:
+        response.mimetype = "application/octet-stream"
+    # The URL is the digest of the bytes, they never change
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
     return response
 
+
 # Application Auth Routes
 
 
-@app.route("/auth/login", methods=["GET"])
+@site.route("/auth/login", methods=["GET"])
 def login():
     session["auth_state"] = secrets.token_hex(16)
     return redirect(f'https://accounts.om-mishra.com/api/v1/oauth2/authorize?client_id=ebbf4742-7ad2-4ecc-a9a0-8d3c3c1da164&state={session["auth_state"]}')
 
-@app.route("/auth/logout", methods=["GET"])
+@site.route("/auth/logout", methods=["GET"])
 def logout():
     session.clear()
-    return redirect(url_for("index"))
+    return redirect(url_for("site.index"))
 
 
-@app.route("/oauth/_handler", methods=["GET"])
+@site.route("/oauth/_handler", methods=["GET"])
+@rate_limit(limit=10, period=60, per="ip")
 def github_callback():
     code = request.args.get("code")
     if not code:
         return redirect(
             url_for(
-                "index",
+                "site.index",
                 message="The authentication attempt failed, due to missing code parameter!",
             )
         )
@@ -749,28 +1476,40 @@ def github_callback():
     if request.args.get("state") != session.get("auth_state"):
         return redirect(
             url_for(
-                "index",
+                "site.index",
                 message="The authentication attempt failed, due to mismatched state parameter!",
             )
         )
 
-    oauth_response = requests.post(
-        "https://accounts.om-mishra.com/api/v1/oauth2/user-info",
-        headers={
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-        },
-        json={
-            "client_id": 'ebbf4742-7ad2-4ecc-a9a0-8d3c3c1da164',
-            "client_secret": os.getenv("OM_MISHRA_ACCOUNTS_CLIENT_SECRET"),
-            "code": code,
-        },
-    )
+    # Only the sign in talks to the accounts API, importing requests is left out of the cold start
+    import requests
+
+    try:
+        oauth_response = ACCOUNTS_SESSION.post(
+            ACCOUNTS_API_URL,
+            headers={
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+            },
+            json={
+                "client_id": 'ebbf4742-7ad2-4ecc-a9a0-8d3c3c1da164',
+                "client_secret": os.getenv("OM_MISHRA_ACCOUNTS_CLIENT_SECRET"),
+                "code": code,
+            },
+            timeout=ACCOUNTS_API_TIMEOUT,
+        )
+    except requests.RequestException:
+        return redirect(
+            url_for(
+                "site.index",
+                message="The authentication attempt failed, the accounts service did not respond!",
+            )
+        )
 
     if oauth_response.status_code != 200:
         return redirect(
             url_for(
-                "index",
+                "site.index",
                 message="The authentication attempt failed, due to invalid response from GitHub!",
             )
         )
@@ -809,6 +1548,9 @@ def github_callback():
 
     user_info = DATABASE["USERS"].find_one({"user_id": user_data["user_public_id"]})
 
+    # Keep the author snapshots embedded in blogs and comments in sync with the profile
+    invalidate_blogs(refresh_author_snapshots(DATABASE, user_info))
+
     session["user"] = {
         "user_id": user_info["user_id"],
         "username": user_info["user_info"]["username"],
@@ -818,12 +1560,14 @@ def github_callback():
 
     session["is_authenticated"] = True
 
-    return redirect(url_for("index"))
+    return redirect(url_for("site.index"))
 
 
 # Application Search Routes
 
-@app.route("/api/search", methods=["GET"])
+@site.route("/api/search", methods=["GET"])
+@rate_limit(limit=60, period=60, per="ip")
+@cache_policy(max_age=60, stale_while_revalidate=300, version=blogs_etag_version)
 def search_api():
     query = request.args.get("query")
     limit = 5
@@ -835,41 +1579,20 @@ def search_api():
             }
         )
 
-    # Escape special characters in the query
-    escaped_query = re.escape(query.strip().replace("%20", " "))
-    fuzzy_query = f".*{escaped_query}.*"
+    normalized_query = " ".join(query.replace("%20", " ").lower().split())
 
-    pipeline = [
-        {
-            "$match": {
-                "$or": [
-                    {"blog_metadata.title": {"$regex": fuzzy_query, "$options": "i"}},
-                    {"blog_metadata.description": {"$regex": fuzzy_query, "$options": "i"}},
-                    {"blog_metadata.tags.tag_name": {"$regex": fuzzy_query, "$options": "i"}},
-                    {"blog_metadata.category": {"$regex": fuzzy_query, "$options": "i"}},
-                ]
-            }
-        },
-        {
-            "$group": {
-                "_id": "$blog_id",
-                "blog_id": {"$first": "$blog_id"},
-                "blog_metadata": {"$first": "$blog_metadata"},
-            }
-        },
-        {
-            "$limit": limit
-        },
-        {
-            "$project": {
-                "_id": 0,
-                "blog_id": 1,
-                "blog_metadata": 1,
-            }
-        }
-    ]
+    def run_search():
+        SEARCH_INDEX.refresh(DATABASE, REDIS_CLIENT)
+        return SEARCH_INDEX.search(normalized_query, limit)
 
-    search_results = list(DATABASE["BLOGS"].aggregate(pipeline))
+    try:
+        blogs_version = current_blogs_version(REDIS_CLIENT)
+    except redis.RedisError:
+        search_results = run_search()
+    else:
+        search_results = SEARCH_QUERY_CACHE.get_or_compute(
+            blogs_version, normalized_query, run_search
+        )
 
     return jsonify(
         {
@@ -878,15 +1601,16 @@ def search_api():
         }
     )
 
-@app.route("/tags/<tag>", methods=["GET"])
+@site.route("/tags/<tag>", methods=["GET"])
 def tags(tag):
-    return redirect(url_for("search", tags=tag))
+    return redirect(url_for("site.search", tags=tag))
 
-@app.route("/category/<category>", methods=["GET"])
+@site.route("/category/<category>", methods=["GET"])
 def category(category):
-    return redirect(url_for("search", category=category))
+    return redirect(url_for("site.search", category=category))
 
-@app.route("/search", methods=["GET"])
+@site.route("/search", methods=["GET"])
+@cache_policy(max_age=300, stale_while_revalidate=600, version=blogs_etag_version)
 def search():
     tags = request.args.getlist("tags")
     category = request.args.get("category")
@@ -902,136 +1626,45 @@ def search():
     if tags == [] and not category and not publish_date_lt and not publish_date_gt and not publish_date_lte and not publish_date_gte and views_lt is None and views_gt is None and views_lte is None and views_gte is None:
         return abort(400)
 
-    # Building the match stage
-    match_stage = {"$match": {"blog_metadata.visibility": "public"}}  # Consider only public blog posts
-    
-    if tags:
-        match_stage["$match"]["blog_metadata.tags"] = {"$in": tags}
-    
-    if category:
-        match_stage["$match"]["blog_metadata.category"] = category
-    
-    if publish_date_lt:
-        if "blog_metadata.publish_date" not in match_stage["$match"]:
-            match_stage["$match"]["blog_metadata.created_at"] = {}
-        match_stage["$match"]["blog_metadata.created_at"]["$lt"] = datetime.strptime(publish_date_lt, "%Y-%m-%d")
-    
-    if publish_date_gt:
-        if "blog_metadata.publish_date" not in match_stage["$match"]:
-            match_stage["$match"]["blog_metadata.created_at"] = {}
-        match_stage["$match"]["blog_metadata.created_at"]["$gt"] = datetime.strptime(publish_date_gt, "%Y-%m-%d")
-    
-    if publish_date_lte:
-        if "blog_metadata.publish_date" not in match_stage["$match"]:
-            match_stage["$match"]["blog_metadata.created_at"] = {}
-        match_stage["$match"]["blog_metadata.created_at"]["$lte"] = datetime.strptime(publish_date_lte, "%Y-%m-%d")
-    
-    if publish_date_gte:
-        if "blog_metadata.publish_date" not in match_stage["$match"]:
-            match_stage["$match"]["blog_metadata.created_at"] = {}
-        match_stage["$match"]["blog_metadata.created_at"]["$gte"] = datetime.strptime(publish_date_gte, "%Y-%m-%d")
-    
-    if views_lt is not None:
-        if "blog_metadata.views" not in match_stage["$match"]:
-            match_stage["$match"]["blog_metadata.number_of_views"] = {}
-        match_stage["$match"]["blog_metadata.number_of_views"]["$lt"] = views_lt
-    
-    if views_gt is not None:
-        if "blog_metadata.views" not in match_stage["$match"]:
-            match_stage["$match"]["blog_metadata.number_of_views"] = {}
-        match_stage["$match"]["blog_metadata.number_of_views"]["$gt"] = views_gt
-    
-    if views_lte is not None:
-        if "blog_metadata.views" not in match_stage["$match"]:
-            match_stage["$match"]["blog_metadata.number_of_views"] = {}
-        match_stage["$match"]["blog_metadata.number_of_views"]["$lte"] = views_lte
-    
-    if views_gte is not None:
-        if "blog_metadata.views" not in match_stage["$match"]:
-            match_stage["$match"]["blog_metadata.number_of_views"] = {}
-        match_stage["$match"]["blog_metadata.number_of_views"]["$gte"] = views_gte
-
-    # Building the group stage
-    lookup_stage = {
-        "$lookup": {
-            "from": "USERS",
-            "localField": "blog_author.user_id",
-            "foreignField": "user_id",
-            "as": "author_details"
-        }
-    }
-
-    # Unwind the author_details array
-    unwind_stage = {
-        "$unwind": "$author_details"
-    }
-
-    # Add author details into each blog record
-    add_fields_stage = {
-        "$addFields": {
-            "author_details": "$author_details"
-        }
-    }
-
-    # Building the group stage
-    group_stage = {
-        "$group": {
-            "_id": "$blog_metadata.category",
-            "averageViews": {"$avg": "$blog_metadata.number_of_views"},
-            "totalBlogs": {"$sum": 1},
-            "blogs": {"$push": "$$ROOT"}
-        }
-    }
-
-    # Building the sort stage
-    sort_stage = {
-        "$sort": {"averageViews": -1}  # Sort by average views in descending order
+    created_at_range = {
+        bound: datetime.strptime(value, "%Y-%m-%d")
+        for bound, value in (
+            ("lt", publish_date_lt),
+            ("gt", publish_date_gt),
+            ("lte", publish_date_lte),
+            ("gte", publish_date_gte),
+        )
+        if value
     }
-
-    # Projecting the final output
-    projection_stage = {
-        "$project": {
-            "_id": 0,
-            "category": "$_id",
-            "averageViews": 1,
-            "totalBlogs": 1,
-            "blogs": {
-                "$map": {
-                    "input": "$blogs",
-                    "as": "blog",
-                    "in": {
-                        "blog_id": "$$blog.blog_id",
-                        "blog_metadata": "$$blog.blog_metadata",
-                        "author_details": "$$blog.author_details"
-                    }
-                }
-            }
-        }
+    views_range = {
+        bound: value
+        for bound, value in (
+            ("lt", views_lt),
+            ("gt", views_gt),
+            ("lte", views_lte),
+            ("gte", views_gte),
+        )
+        if value is not None
     }
 
-    # Constructing the pipeline
-    pipeline = [
-        match_stage,
-        lookup_stage,
-        unwind_stage,
-        add_fields_stage,
-        group_stage,
-        sort_stage,
-        projection_stage
-    ]
-
-    # Running the aggregation pipeline
-    search_results = list(DATABASE["BLOGS"].aggregate(pipeline))
+    # Filtering is a set intersection over the facet index, Mongo is only read for new writes
+    FACET_INDEX.refresh(DATABASE, REDIS_CLIENT)
+    search_results = FACET_INDEX.search(
+        tags=tags,
+        category=category,
+        created_at_range=created_at_range,
+        views_range=views_range,
+    )
 
     return render_template("search.html", search_results=search_results, tags=tags, category=category, publish_date_lt=publish_date_lt, publish_date_gt=publish_date_gt, publish_date_lte=publish_date_lte, publish_date_gte=publish_date_gte, views_lt=views_lt, views_gt=views_gt, views_lte=views_lte, views_gte=views_gte)
 
 
 
-@app.errorhandler(429)
-@app.errorhandler(404)
-@app.errorhandler(401)
-@app.errorhandler(400)
-@app.errorhandler(500)
+@site.app_errorhandler(429)
+@site.app_errorhandler(404)
+@site.app_errorhandler(401)
+@site.app_errorhandler(400)
+@site.app_errorhandler(500)
 def handle_errors(e):
     error_messages = {
         429: "Too many requests, please try again later!",
@@ -1047,5 +1680,54 @@ def handle_errors(e):
     }, status_code
 
 
+# Application Factory
+
+
+def create_app():
+    """
+    Builds the application from the environment and returns it, gunicorn serves main:create_app().
+
+    Importing this module only declares the routes, the app is built by the process serving it,
+    after the gevent patching of the workers. Nothing connects here either, the session store
+    gets the Redis client of the process, which opens its connections on first use.
+    """
+    # The module settings are read at import, `flask` and gunicorn.conf.py load .env before that
+    load_dotenv()
+
+    for variable in ("REDIS_URL", "MONGODB_URL"):
+        if not os.getenv(variable):
+            raise RuntimeError(f"Environment variable {variable} not set")
+
+    app = Flask(__name__)
+    app.register_blueprint(site)
+    app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
+
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(record_template_metrics, app)
+
+    # Behind proxies the client address, which the rate limits and view counts key on, is the
+    # one the last TRUSTED_PROXY_COUNT proxies appended to X-Forwarded-For
+
+    trusted_proxy_count = int(os.getenv("TRUSTED_PROXY_COUNT", 0))
+    if trusted_proxy_count:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxy_count)
+
+    # Session Configuration
+
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = REDIS_CLIENT
+    app.config["SESSION_COOKIE_SECURE"] = True
+    app.config["SESSION_COOKIE_HTTPONLY"] = True
+    app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+    app.config["SESSION_COOKIE_NAME"] = "inkbloom-session"
+
+    # Sessions are only written when they change, anonymous readers never reach the session store
+
+    app.config["SESSION_REFRESH_EACH_REQUEST"] = False
+
+    Session(app)
+    return app
+
+
 if __name__ == "__main__":
-    app.run(port=5000, debug=True)
\ No newline at end of file
+    create_app().run(port=5000, debug=True)
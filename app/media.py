@@ -0,0 +1,460 @@
+# Upload pipeline for the blog media, new images are staged in Mongo and sent to the CDN out of band,
+# as responsive variants when Pillow is installed
+
+import os
+import re
+import base64
+import binascii
+import hashlib
+import struct
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+
+from clients import http_session, lazy_client
+from images import fallback_variant, image_variants, responsive_image
+
+
+CDN_UPLOAD_URL = os.getenv(
+    "CDN_UPLOAD_URL", "https://api.cdn.om-mishra.com/v1/upload-file"
+)
+# (connect, read) seconds, a CDN that accepts the connection but stalls can't hold a job for long
+
+CDN_UPLOAD_TIMEOUT = (3.05, float(os.getenv("CDN_UPLOAD_TIMEOUT", 10)))
+CDN_UPLOAD_WORKERS = int(os.getenv("CDN_UPLOAD_WORKERS", 8))
+
+BASE64_IMAGE_PATTERN = re.compile(r'<img src="data:image/([^;]+);base64,([^"]+)"')
+
+# Blogs saved before the variants wrapped their images in the wsrv.nl proxy
+
+LEGACY_PROXY_PATTERN = re.compile(r"^(?:https?:)?//wsrv\.nl/?\?url=([^&]+)")
+
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+# A staged image is stored in one MongoDB document, which can't exceed 16 MB
+
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_MB", 10)) * 1024 * 1024
+
+# Digest -> CDN URL lookups are served from Redis, the MEDIA collection is the source of truth
+
+MEDIA_URLS_KEY = "inkbloom:media:urls"
+
+
+class ImageUploadError(Exception):
+    pass
+
+
+class ImageTooLargeError(ImageUploadError):
+    pass
+
+
+def _check_image_size(image):
+    if len(image) > MAX_IMAGE_BYTES:
+        raise ImageTooLargeError(
+            f"Images can be at most {MAX_IMAGE_BYTES // (1024 * 1024)} MB, this one is {len(image) / (1024 * 1024):.1f} MB!"
+        )
+
+
+# The process wide CDN session, its keep-alive pool is sized for the upload workers
+
+CDN_SESSION = lazy_client(lambda: http_session(CDN_UPLOAD_WORKERS))
+
+
+def upload_file(file, object_path):
+    """Uploads a file (bytes or file object) to the CDN and returns its public URL."""
+    import requests
+
+    try:
+        upload_response = CDN_SESSION.post(
+            CDN_UPLOAD_URL,
+            headers={
+                "X-Authorization": os.getenv("CDN_API_KEY"),
+            },
+            files={
+                "file": file,
+            },
+            data={
+                "object_path": object_path,
+            },
+            timeout=CDN_UPLOAD_TIMEOUT,
+        )
+    except requests.RequestException as e:
+        raise ImageUploadError(f"Image upload failed: {str(e)}")
+
+    if upload_response.status_code != 200:
+        raise ImageUploadError(
+            "The image upload failed, due to an invalid response from the Image Upload API!"
+        )
+
+    return upload_response.json().get("file_url")
+
+
+def download_image(url):
+    """Downloads an image already on the CDN, returns (bytes, content type)."""
+    import requests
+
+    try:
+        with CDN_SESSION.get(url, timeout=CDN_UPLOAD_TIMEOUT, stream=True) as download_response:
+            if download_response.status_code != 200:
+                raise ImageUploadError(f"Image download failed with status {download_response.status_code}")
+            image = download_response.raw.read(MAX_DOWNLOAD_BYTES + 1, decode_content=True)
+            content_type = download_response.headers.get("Content-Type", "").split(";")[0]
+    except requests.RequestException as e:
+        raise ImageUploadError(f"Image download failed: {str(e)}")
+    if len(image) > MAX_DOWNLOAD_BYTES:
+        raise ImageUploadError("Image download failed, the image is too large")
+    return image, content_type
+
+
+def media_digest(image):
+    return hashlib.sha256(image).hexdigest()
+
+
+def image_dimensions(image):
+    """
+    Reads (width, height) from the header of a PNG, GIF, JPEG or WebP image, None otherwise.
+
+    Only the header is parsed, the dimensions are written into the <img> tags so the page
+    reserves the space of each image before it loads.
+    """
+    try:
+        if image.startswith(b"\x89PNG\r\n\x1a\n"):
+            return struct.unpack(">II", image[16:24])
+        if image[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", image[6:10])
+        if image[:4] == b"RIFF" and image[8:12] == b"WEBP":
+            chunk = image[12:16]
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", image[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L":
+                bits = int.from_bytes(image[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                return (
+                    int.from_bytes(image[24:27], "little") + 1,
+                    int.from_bytes(image[27:30], "little") + 1,
+                )
+        if image[:2] == b"\xff\xd8":
+            offset = 2
+            while offset < len(image):
+                marker, segment_length = struct.unpack(">xBH", image[offset:offset + 4])
+                # Start of frame markers, except the DHT, JPG and DAC markers sharing the range
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">HH", image[offset + 5:offset + 9])
+                    return width, height
+                offset += 2 + segment_length
+    except struct.error:
+        return None
+    return None
+
+
+def media_extension(content_type):
+    if not content_type or not content_type.startswith("image/"):
+        return "png"
+    extension = re.sub(r"[^a-z0-9]", "", content_type[6:].lower().split("+")[0])
+    return "jpg" if extension == "jpeg" else extension or "png"
+
+
+def lookup_media_urls(database, redis_client, digests):
+    """Returns the CDN URLs already known for the given digests, Redis first and Mongo for the rest."""
+    digests = list(digests)
+    if not digests:
+        return {}
+
+    try:
+        cached_urls = redis_client.hmget(MEDIA_URLS_KEY, digests)
+    except redis.RedisError:
+        cached_urls = [None] * len(digests)
+
+    known_urls = {
+        digest: url.decode()
+        for digest, url in zip(digests, cached_urls)
+        if url is not None
+    }
+
+    missing_digests = [digest for digest in digests if digest not in known_urls]
+    if missing_digests:
+        stored_urls = {
+            media["digest"]: media["file_url"]
+            for media in database["MEDIA"].find(
+                {"digest": {"$in": missing_digests}},
+                {"_id": 0, "digest": 1, "file_url": 1},
+            )
+        }
+        if stored_urls:
+            try:
+                redis_client.hset(MEDIA_URLS_KEY, mapping=stored_urls)
+            except redis.RedisError:
+                pass
+        known_urls.update(stored_urls)
+
+    return known_urls
+
+
+def record_media(database, redis_client, digest, media):
+    """Records a published image, `media` as returned by publish_image, a record without variants is replaced."""
+    database["MEDIA"].update_one(
+        {"digest": digest},
+        {
+            "$set": media,
+            "$setOnInsert": {"digest": digest, "created_at": datetime.now()},
+        },
+        upsert=True,
+    )
+    try:
+        redis_client.hset(MEDIA_URLS_KEY, digest, media["file_url"])
+    except redis.RedisError:
+        pass
+
+
+def publish_image(image, content_type, folder, digest):
+    """
+    Uploads the variants of an image to the CDN, or the image itself when it has none.
+
+    Returns the media record, its file_url is the widest variant of the fallback format.
+    Variants are named after the digest, their width and format, so publishing an image
+    twice overwrites the same objects.
+    """
+    processed_image = image_variants(image)
+    if processed_image is None:
+        dimensions = image_dimensions(image) or (None, None)
+        return {
+            "file_url": upload_file(image, f"blogs/{folder}/{digest}.{media_extension(content_type)}"),
+            "content_type": content_type,
+            "size": len(image),
+            "width": dimensions[0],
+            "height": dimensions[1],
+            "variants": [],
+        }
+
+    width, height, variants = processed_image
+    published_variants = [
+        {
+            "format": variant["format"],
+            "content_type": variant["content_type"],
+            "width": variant["width"],
+            "height": variant["height"],
+            "size": len(variant["data"]),
+            "url": upload_file(
+                variant["data"],
+                f"blogs/{folder}/{digest}-{variant['width']}.{variant['format']}",
+            ),
+        }
+        for variant in variants
+    ]
+    return {
+        "file_url": fallback_variant(published_variants)["url"],
+        "content_type": content_type,
+        "size": len(image),
+        "width": width,
+        "height": height,
+        "variants": published_variants,
+    }
+
+
+def lookup_responsive_images(database, base_url, sources):
+    """
+    Returns the responsive image of every source whose media has variants, keyed by the source.
+
+    A source is a staged URL, a CDN URL, or a CDN URL wrapped in the legacy wsrv.nl proxy.
+    """
+    staged_pattern = staged_media_pattern(base_url)
+    digests = {}
+    file_urls = {}
+    for source in set(sources):
+        staged_match = staged_pattern.fullmatch(source)
+        if staged_match is not None:
+            digests.setdefault(staged_match.group(1), []).append(source)
+            continue
+        legacy_match = LEGACY_PROXY_PATTERN.match(source)
+        file_urls.setdefault(legacy_match.group(1) if legacy_match else source, []).append(source)
+    if not digests and not file_urls:
+        return {}
+
+    images = {}
+    for media in database["MEDIA"].find(
+        {"$or": [{"digest": {"$in": list(digests)}}, {"file_url": {"$in": list(file_urls)}}]},
+        {"_id": 0, "digest": 1, "file_url": 1, "width": 1, "height": 1, "variants": 1},
+    ):
+        image = responsive_image(media)
+        if image is None:
+            continue
+        for source in digests.get(media["digest"], []) + file_urls.get(media["file_url"], []):
+            images[source] = image
+    return images
+
+
+def _store_pending_media(database, digest, content_type, image, folder):
+    database["PENDING_MEDIA"].update_one(
+        {"digest": digest},
+        {
+            "$setOnInsert": {
+                "digest": digest,
+                "content_type": content_type,
+                "folder": folder,
+                "data": image,
+                "size": len(image),
+                "created_at": datetime.now(),
+            }
+        },
+        upsert=True,
+    )
+
+
+def staged_media_url(base_url, digest):
+    return f"{base_url}/media/{digest}"
+
+
+def staged_media_pattern(base_url):
+    return re.compile(re.escape(f"{base_url}/media/") + r"([0-9a-f]{64})")
+
+
+def stage_media(database, redis_client, image, content_type, folder, base_url):
+    """Returns the CDN URL of an image uploaded before, otherwise stages it and returns its staged URL."""
+    _check_image_size(image)
+    digest = media_digest(image)
+    known_url = lookup_media_urls(database, redis_client, [digest]).get(digest)
+    if known_url is not None:
+        return known_url
+    _store_pending_media(database, digest, content_type, image, folder)
+    return staged_media_url(base_url, digest)
+
+
+def stage_content_images(blog_content, database, redis_client, base_url):
+    """
+    Replaces every base64 encoded <img> in the content with the URL of the image.
+
+    Images are content addressed, so digests known to the media index get their CDN URL right
+    away. Each new image is decoded once and staged in Mongo, the app serves it from its staged
+    URL until publish_staged_media uploads it, outside the request.
+    """
+    images = {}
+    dimensions = {}
+    for match in BASE64_IMAGE_PATTERN.finditer(blog_content):
+        image_type, image_data = match.groups()
+        if image_data in images:
+            continue
+        try:
+            image = base64.b64decode(image_data, validate=True)
+        except binascii.Error:
+            raise ImageUploadError("Invalid base64 image data found!")
+        _check_image_size(image)
+        images[image_data] = (media_digest(image), f"image/{image_type}", image)
+        dimensions[image_data] = image_dimensions(image)
+
+    if not images:
+        return blog_content
+
+    media_urls = lookup_media_urls(
+        database, redis_client, {digest for digest, _, _ in images.values()}
+    )
+    for digest, content_type, image in images.values():
+        if digest not in media_urls:
+            _store_pending_media(database, digest, content_type, image, "media")
+            media_urls[digest] = staged_media_url(base_url, digest)
+
+    def image_tag(match):
+        # The responsive markup is added by the content pipeline once the image has variants
+        image_tag = f'<img src="{media_urls[images[match.group(2)][0]]}"'
+        if dimensions[match.group(2)] is not None:
+            image_tag += ' width="{}" height="{}"'.format(*dimensions[match.group(2)])
+        return image_tag
+
+    return BASE64_IMAGE_PATTERN.sub(image_tag, blog_content)
+
+
+def publish_staged_media(database, redis_client, base_url, *texts):
+    """
+    Uploads the staged images referenced by the texts, returns the texts with their CDN URLs.
+
+    New images are processed and uploaded once each on a bounded pool, then recorded in the
+    media index before they are unstaged, so a staged URL always resolves to one or the other.
+    """
+    pattern = staged_media_pattern(base_url)
+    digests = {digest for text in texts for digest in pattern.findall(text)}
+    if not digests:
+        return list(texts)
+
+    media_urls = lookup_media_urls(database, redis_client, digests)
+    pending_media = {
+        media["digest"]: media
+        for media in database["PENDING_MEDIA"].find(
+            {"digest": {"$in": [digest for digest in digests if digest not in media_urls]}}
+        )
+    }
+    missing_digests = digests - set(media_urls) - set(pending_media)
+    if missing_digests:
+        # Published by a concurrent job between the two lookups
+        media_urls.update(lookup_media_urls(database, redis_client, missing_digests))
+        missing_digests -= set(media_urls)
+    if missing_digests:
+        raise ImageUploadError(f"Staged images not found: {', '.join(sorted(missing_digests))}")
+
+    if pending_media:
+        with ThreadPoolExecutor(
+            max_workers=min(CDN_UPLOAD_WORKERS, len(pending_media))
+        ) as upload_pool:
+            publish_futures = {
+                digest: upload_pool.submit(
+                    publish_image,
+                    bytes(media["data"]),
+                    media["content_type"],
+                    media["folder"],
+                    digest,
+                )
+                for digest, media in pending_media.items()
+            }
+            published_media = {digest: future.result() for digest, future in publish_futures.items()}
+
+        for digest, media in published_media.items():
+            record_media(database, redis_client, digest, media)
+            media_urls[digest] = media["file_url"]
+        database["PENDING_MEDIA"].delete_many({"digest": {"$in": list(pending_media)}})
+
+    return [pattern.sub(lambda match: media_urls[match.group(1)], text) for text in texts]
+
+
+def load_pending_media(database, digest):
+    return database["PENDING_MEDIA"].find_one(
+        {"digest": digest}, {"_id": 0, "content_type": 1, "data": 1}
+    )
+
+
+def publish_legacy_images(database, redis_client, base_url, sources, published_images=None):
+    """
+    Publishes the variants of images uploaded before them, returns their responsive images by source.
+
+    Sources without variants are downloaded from the CDN, sources that fail are reported in
+    the second value. `published_images` caches the images by URL across calls.
+    """
+    if published_images is None:
+        published_images = {}
+    staged_pattern = staged_media_pattern(base_url)
+    images = lookup_responsive_images(database, base_url, sources)
+    errors = {}
+    for source in sources:
+        if source in images or staged_pattern.fullmatch(source):
+            continue
+        legacy_match = LEGACY_PROXY_PATTERN.match(source)
+        url = legacy_match.group(1) if legacy_match else source
+        if not url.startswith(("http://", "https://")):
+            continue
+        if url not in published_images:
+            try:
+                image, content_type = download_image(url)
+                digest = media_digest(image)
+                media = database["MEDIA"].find_one(
+                    {"digest": digest}, {"_id": 0, "file_url": 1, "width": 1, "height": 1, "variants": 1}
+                )
+                if media is None or not media.get("variants"):
+                    media = publish_image(image, content_type, "media", digest)
+                    record_media(database, redis_client, digest, media)
+            except ImageUploadError as e:
+                errors[source] = str(e)
+                continue
+            published_images[url] = responsive_image(media)
+        if published_images[url] is not None:
+            images[source] = published_images[url]
+    return images, errors
@@ -0,0 +1,205 @@
+# Request, Mongo, Redis and template instrumentation, exposed in the Prometheus text format
+
+import bisect
+import threading
+import time
+
+import redis
+from flask import g, has_app_context
+from pymongo import monitoring
+from redis.client import Pipeline
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10000)
+BYTE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Commands whose replies carry documents in a cursor batch
+
+CURSOR_BATCH_FIELDS = {"find": "firstBatch", "aggregate": "firstBatch", "getMore": "nextBatch"}
+
+
+class Histogram:
+    """A labelled, thread safe histogram with fixed buckets, like a Prometheus client histogram."""
+
+    def __init__(self, name, description, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            bucket_index = bisect.bisect_left(self.buckets, value)
+            if bucket_index < len(self.buckets):
+                series[0][bucket_index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def _labels(self, label_values, **extra_labels):
+        labels = list(zip(self.label_names, label_values)) + list(extra_labels.items())
+        return ",".join(
+            '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in labels
+        )
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, (bucket_counts, count, total) in series:
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{{{self._labels(label_values, le=upper_bound)}}} {cumulative_count}"
+                )
+            lines.append(f"{self.name}_bucket{{{self._labels(label_values, le='+Inf')}}} {count}")
+            lines.append(f"{self.name}_count{{{self._labels(label_values)}}} {count}")
+            lines.append(f"{self.name}_sum{{{self._labels(label_values)}}} {total}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "inkbloom_request_duration_seconds",
+    "Time spent handling a request, by route.",
+    ("route", "method", "status"),
+)
+# The size of a response is the Content-Length it already carries, nothing is encoded to measure it
+
+RESPONSE_BYTES = Histogram(
+    "inkbloom_response_bytes",
+    "Size of the response body sent, after compression, by route.",
+    ("route", "method"),
+    buckets=BYTE_BUCKETS,
+)
+TEMPLATE_LATENCY = Histogram(
+    "inkbloom_template_render_duration_seconds",
+    "Time spent rendering a template, by template.",
+    ("template",),
+)
+MONGO_LATENCY = Histogram(
+    "inkbloom_mongo_command_duration_seconds",
+    "Time spent in a MongoDB command, by collection and command.",
+    ("collection", "command", "outcome"),
+)
+MONGO_DOCUMENTS = Histogram(
+    "inkbloom_mongo_documents_returned",
+    "Documents returned or affected by a MongoDB command.",
+    ("collection", "command"),
+    buckets=SIZE_BUCKETS,
+)
+REDIS_LATENCY = Histogram(
+    "inkbloom_redis_command_duration_seconds",
+    "Time spent in a Redis command or pipeline.",
+    ("command",),
+)
+
+METRICS = (
+    REQUEST_LATENCY,
+    RESPONSE_BYTES,
+    TEMPLATE_LATENCY,
+    MONGO_LATENCY,
+    MONGO_DOCUMENTS,
+    REDIS_LATENCY,
+)
+
+
+def exposition():
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.exposition())
+    return "\n".join(lines) + "\n"
+
+
+def record_request_timing(component, duration, operations=1):
+    """Adds to the per-request totals reported in the Server-Timing header."""
+    if not has_app_context():
+        return
+    timings = g.setdefault("request_timings", {})
+    total_duration, total_operations = timings.get(component, (0.0, 0))
+    timings[component] = (total_duration + duration, total_operations + operations)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every command of the client, the collection is taken from the started event."""
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else ""
+            )
+
+    def _collection(self, event):
+        with self._lock:
+            return self._collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        collection = self._collection(event)
+        duration = event.duration_micros / 1e6
+        MONGO_LATENCY.observe(duration, collection, event.command_name, "success")
+        record_request_timing("mongo", duration)
+
+        reply = event.reply
+        if event.command_name in CURSOR_BATCH_FIELDS:
+            documents = len(reply.get("cursor", {}).get(CURSOR_BATCH_FIELDS[event.command_name], []))
+        else:
+            documents = reply.get("n", 0)
+        # The reply is not re-encoded to measure its size, that would double the BSON work of every command
+        MONGO_DOCUMENTS.observe(documents, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._collection(event)
+        duration = event.duration_micros / 1e6
+        MONGO_LATENCY.observe(duration, collection, event.command_name, "failure")
+        record_request_timing("mongo", duration)
+
+
+class InstrumentedPipeline(Pipeline):
+    def execute(self, raise_on_error=True):
+        started_at = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            duration = time.perf_counter() - started_at
+            REDIS_LATENCY.observe(duration, "PIPELINE")
+            record_request_timing("redis", duration)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client timing every command and pipeline, create it with InstrumentedRedis.from_url."""
+
+    def execute_command(self, *args, **options):
+        started_at = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            duration = time.perf_counter() - started_at
+            REDIS_LATENCY.observe(duration, str(args[0]).upper())
+            record_request_timing("redis", duration)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+def server_timing_header(total_duration, timings):
+    """Formats the request totals as a Server-Timing header, durations in milliseconds."""
+    metrics = [f"app;dur={total_duration * 1000:.1f}"]
+    for component, (duration, operations) in sorted(timings.items()):
+        metrics.append(f'{component};dur={duration * 1000:.1f};desc="{operations} calls"')
+    return ", ".join(metrics)
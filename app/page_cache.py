@@ -0,0 +1,122 @@
+# Rendered page cache for the blog pages, stored in the Redis instance that backs the sessions
+
+import redis
+
+
+PAGE_CACHE_PREFIX = "inkbloom:page"
+PAGE_CACHE_TTL = 60 * 60 * 24
+
+# Per-user markup is cut out of the shared page and stitched back in on every request
+
+FRAGMENT_MARKER = "<!--inkbloom-fragment:{}-->"
+
+# Pages of signed out readers are identical, their compressed bytes are kept next to the render
+
+COMPRESSED_FIELD_PREFIX = "compressed:"
+
+# Only fills in a page that still exists, an expired page must not come back without its html
+
+STORE_COMPRESSED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+"""
+
+
+def _version_key(slug):
+    return f"{PAGE_CACHE_PREFIX}:blog:{slug}:version"
+
+
+def _page_key(slug, version):
+    return f"{PAGE_CACHE_PREFIX}:blog:{slug}:{version}"
+
+
+def blog_page_version(redis_client, slug):
+    """Returns the content version of the slug, None when Redis is unavailable."""
+    try:
+        return int(redis_client.get(_version_key(slug)) or 0)
+    except redis.RedisError:
+        return None
+
+
+def get_cached_blog_page(redis_client, slug):
+    """
+    Returns a (version, page) tuple for the slug, page is None on a cache miss.
+
+    The version has to be read before the blog is loaded from Mongo and handed back to
+    store_blog_page, so a render that races an invalidation is stored under a stale key.
+    """
+    try:
+        version = int(redis_client.get(_version_key(slug)) or 0)
+        page = redis_client.hgetall(_page_key(slug, version))
+    except redis.RedisError:
+        return None, None
+    if not page:
+        return version, None
+    cached_page = {"compressed": {}}
+    for key, value in page.items():
+        key = key.decode()
+        if key.startswith(COMPRESSED_FIELD_PREFIX):
+            cached_page["compressed"][key[len(COMPRESSED_FIELD_PREFIX):]] = value
+        else:
+            cached_page[key] = value.decode()
+    return version, cached_page
+
+
+def cached_blog_id(redis_client, slug):
+    """Returns the blog id of the cached page of the slug without reading the page, None on a miss."""
+    try:
+        version = int(redis_client.get(_version_key(slug)) or 0)
+        blog_id = redis_client.hget(_page_key(slug, version), "blog_id")
+    except redis.RedisError:
+        return None
+    return blog_id.decode() if blog_id else None
+
+
+def store_blog_page(redis_client, slug, version, blog_id, author_id, html):
+    if version is None:
+        return
+    key = _page_key(slug, version)
+    try:
+        pipeline = redis_client.pipeline()
+        pipeline.hset(
+            key,
+            mapping={"blog_id": blog_id, "author_id": author_id, "html": html},
+        )
+        pipeline.expire(key, PAGE_CACHE_TTL)
+        pipeline.execute()
+    except redis.RedisError:
+        pass
+
+
+def store_compressed_blog_page(redis_client, slug, version, encoding, body):
+    if version is None:
+        return
+    try:
+        redis_client.eval(
+            STORE_COMPRESSED_SCRIPT,
+            1,
+            _page_key(slug, version),
+            f"{COMPRESSED_FIELD_PREFIX}{encoding}",
+            body,
+        )
+    except redis.RedisError:
+        pass
+
+
+def invalidate_blog_page(redis_client, *slugs):
+    """Bumps the content version of every given slug, orphaned pages expire with their TTL."""
+    try:
+        pipeline = redis_client.pipeline()
+        for slug in set(slugs):
+            if slug:
+                pipeline.incr(_version_key(slug))
+        pipeline.execute()
+    except redis.RedisError:
+        pass
+
+
+def render_fragments(html, fragments):
+    for name, fragment in fragments.items():
+        html = html.replace(FRAGMENT_MARKER.format(name), fragment, 1)
+    return html
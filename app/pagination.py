@@ -0,0 +1,132 @@
+# Keyset (cursor) pagination for the blog listings
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+FEED_PAGE_SIZE = 10
+FEED_MAX_PAGE_SIZE = 50
+COMMENTS_PAGE_SIZE = 20
+
+# Only the fields the blog cards actually render, the article HTML never leaves Mongo
+
+BLOG_CARD_PROJECTION = {
+    "_id": 1,
+    "blog_id": 1,
+    "blog_metadata.title": 1,
+    "blog_metadata.description": 1,
+    "blog_metadata.slug": 1,
+    "blog_metadata.tags": 1,
+    "blog_metadata.category": 1,
+    "blog_metadata.cover_url": 1,
+    "blog_metadata.cover_image": 1,
+    "blog_metadata.read_time": 1,
+    "blog_metadata.word_count": 1,
+    "blog_metadata.excerpt": 1,
+    "blog_metadata.number_of_views": 1,
+    "blog_metadata.created_at": 1,
+    "blog_author": 1,
+}
+
+COMMENT_PROJECTION = {
+    "_id": 1,
+    "comment_id": 1,
+    "comment_content": 1,
+    "comment_author": 1,
+    "comment_metadata": 1,
+}
+
+
+def parse_cursor(value):
+    """Returns the ObjectId encoded in a ?before= / ?after= cursor, None when absent, raises ValueError when malformed."""
+    if not value:
+        return None
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ValueError(f"Invalid cursor: {value}")
+
+
+def parse_page_size(value, default=FEED_PAGE_SIZE):
+    try:
+        page_size = int(value) if value else default
+    except ValueError:
+        page_size = default
+    return max(1, min(page_size, FEED_MAX_PAGE_SIZE))
+
+
+def fetch_keyset_page(collection, match, projection, before=None, after=None, limit=FEED_PAGE_SIZE):
+    """
+    Fetches one page of documents, newest first, using the _id as the keyset.
+
+    `before` returns the documents older than the given _id, `after` the documents newer than it.
+    One extra document is read to know whether another page exists in that direction.
+    Returns the documents with the cursors of the neighbouring pages.
+    """
+    query = dict(match)
+    if before is not None:
+        query["_id"] = {"$lt": before}
+        sort_direction = -1
+    elif after is not None:
+        query["_id"] = {"$gt": after}
+        sort_direction = 1
+    else:
+        sort_direction = -1
+
+    documents = list(
+        collection.find(query, projection)
+        .sort("_id", sort_direction)
+        .limit(limit + 1)
+    )
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+
+    if sort_direction == 1:
+        documents.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = before is not None, has_more
+
+    return (
+        documents,
+        str(documents[0]["_id"]) if documents and has_newer else None,
+        str(documents[-1]["_id"]) if documents and has_older else None,
+    )
+
+
+def fetch_blog_page(collection, match, before=None, after=None, limit=FEED_PAGE_SIZE):
+    """Fetches one page of blog cards, see fetch_keyset_page."""
+    blogs, newer_cursor, older_cursor = fetch_keyset_page(
+        collection, match, BLOG_CARD_PROJECTION, before=before, after=after, limit=limit
+    )
+    return {"blogs": blogs, "newer_cursor": newer_cursor, "older_cursor": older_cursor}
+
+
+def fetch_comment_page(collection, blog_id, before=None, limit=COMMENTS_PAGE_SIZE):
+    """Fetches the comments of a blog older than the `before` cursor, newest first."""
+    comments, _, older_cursor = fetch_keyset_page(
+        collection,
+        {"comment_metadata.blog_id": blog_id},
+        COMMENT_PROJECTION,
+        before=before,
+        limit=limit,
+    )
+    return {"comments": comments, "older_cursor": older_cursor}
+
+
+def serialize_blog_card(blog):
+    """Converts a card document into a JSON friendly dictionary for the feed API."""
+    card = dict(blog)
+    card["_id"] = str(card["_id"])
+    return card
+
+
+def serialize_comment(comment):
+    """Converts a comment document into a JSON friendly dictionary for the comments API."""
+    comment = dict(comment)
+    comment["_id"] = str(comment["_id"])
+    comment["comment_metadata"] = dict(
+        comment["comment_metadata"],
+        created_at=comment["comment_metadata"]["created_at"].isoformat(),
+    )
+    return comment
@@ -0,0 +1,231 @@
+# Opt-in request profiling, a wall clock stack sampler writing collapsed stacks for flamegraphs
+
+import _thread
+import collections
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+
+
+PROFILE_HEADER_NAME = "X-Profile-Token"
+PROFILE_ID_HEADER_NAME = "X-Profile-Id"
+PROFILE_MAX_DEPTH = 128
+
+# Jinja compiles every template into code whose file name is the template's
+
+TEMPLATE_EXTENSIONS = (".html", ".xml", ".txt")
+
+
+def _signature(secret_key, expires_at):
+    return hmac.new(
+        secret_key.encode(), f"profile|{expires_at}".encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def generate_profile_token(secret_key, lifetime):
+    """Returns a token enabling profiling for `lifetime` seconds, sent in the X-Profile-Token header."""
+    expires_at = int(time.time() + lifetime)
+    return f"{expires_at}.{_signature(secret_key, expires_at)}"
+
+
+def is_valid_profile_token(secret_key, token):
+    try:
+        expires_at, signature = token.split(".")
+        expires_at = int(expires_at)
+    except (AttributeError, ValueError):
+        return False
+    if expires_at < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(secret_key, expires_at))
+
+
+def frame_label(frame):
+    code = frame.f_code
+    if code.co_filename.endswith(TEMPLATE_EXTENSIONS):
+        return f"template:{os.path.basename(code.co_filename)}:{code.co_name}"
+    module = frame.f_globals.get("__name__") or os.path.basename(code.co_filename)
+    return f"{module}:{code.co_name}"
+
+
+def collapse_stack(frame, root):
+    """Returns the stack of `frame` in the collapsed format, outermost frame first."""
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.append(root)
+    return ";".join(reversed(labels))
+
+
+def native_threading():
+    """
+    Returns (start_new_thread, get_ident, allocate_lock, sleep, current_greenlet) of the OS.
+
+    Under gevent workers a patched thread is a greenlet, which would only sample while the
+    request waits, so the sampler takes the originals. current_greenlet is None without gevent.
+    """
+    if "gevent" in sys.modules:
+        from gevent import getcurrent, monkey
+
+        if monkey.is_module_patched("threading"):
+            return (
+                monkey.get_original("_thread", "start_new_thread"),
+                monkey.get_original("_thread", "get_ident"),
+                monkey.get_original("_thread", "allocate_lock"),
+                monkey.get_original("time", "sleep"),
+                getcurrent,
+            )
+    return _thread.start_new_thread, _thread.get_ident, _thread.allocate_lock, time.sleep, None
+
+
+class StackSampler:
+    """
+    Samples the stack of the calling thread, or greenlet, every `interval` seconds from an OS thread.
+
+    The request runs unmodified, its cost is one stack walk per sample, and sampling stops
+    after `max_duration` so a stuck request can't keep the sampler running.
+    """
+
+    def __init__(self, root, interval, max_duration):
+        start_new_thread, get_ident, allocate_lock, sleep, current_greenlet = native_threading()
+        self.root = root
+        self.interval = interval
+        self.max_duration = max_duration
+        self.stacks = collections.Counter()
+        self.truncated = False
+        self.duration = None
+        self.thread_id = get_ident()
+        self.greenlet = current_greenlet() if current_greenlet is not None else None
+        self._start_new_thread = start_new_thread
+        self._sleep = sleep
+        self._stopped = False
+        self._done = allocate_lock()
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        self._done.acquire()
+        self._start_new_thread(self._run, ())
+
+    def _frame(self):
+        # A waiting greenlet keeps its frame, a running one is the current frame of its thread
+        if self.greenlet is not None and self.greenlet.gr_frame is not None:
+            return self.greenlet.gr_frame
+        return sys._current_frames().get(self.thread_id)
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_duration
+        try:
+            while not self._stopped:
+                self._sleep(self.interval)
+                if self._stopped:
+                    return
+                if time.monotonic() > deadline:
+                    self.truncated = True
+                    return
+                frame = self._frame()
+                if frame is None:
+                    return
+                self.stacks[collapse_stack(frame, self.root)] += 1
+        finally:
+            self._done.release()
+
+    def stop(self):
+        # Waits at most one interval for the sampler to see the flag
+        self._stopped = True
+        self._done.acquire()
+        self.duration = time.perf_counter() - self._started_at
+
+
+class Profiler:
+    """
+    Decides which requests are profiled and stores their profiles, with bounded cost.
+
+    At most `max_concurrent` requests of the process are sampled at once, further triggers
+    are ignored, and the oldest profiles are deleted once the directory holds more than
+    `max_files` profiles or `max_bytes` bytes.
+    """
+
+    def __init__(self, directory, sample_rate, interval, max_duration, max_concurrent, max_files, max_bytes):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_duration = max_duration
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._prune_lock = threading.Lock()
+
+    def should_profile(self, secret_key, token):
+        if token is not None:
+            return bool(secret_key) and is_valid_profile_token(secret_key, token)
+        return self.sample_rate > 0 and secrets.randbelow(self.sample_rate) == 0
+
+    def start(self, root):
+        """Starts sampling the calling thread, returns None when every slot is taken."""
+        if not self._slots.acquire(blocking=False):
+            return None
+        sampler = StackSampler(root, self.interval, self.max_duration)
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler, profile_id, metadata):
+        """Stops the sampler and writes <profile_id>.folded and <profile_id>.json."""
+        try:
+            sampler.stop()
+        finally:
+            self._slots.release()
+
+        os.makedirs(self.directory, exist_ok=True)
+        profile_path = os.path.join(self.directory, profile_id)
+        with open(f"{profile_path}.folded", "w") as profile_file:
+            for stack, samples in sampler.stacks.most_common():
+                profile_file.write(f"{stack} {samples}\n")
+        with open(f"{profile_path}.json", "w") as metadata_file:
+            json.dump(
+                {
+                    **metadata,
+                    "duration_ms": round(sampler.duration * 1000, 3),
+                    "interval_ms": self.interval * 1000,
+                    "samples": sum(sampler.stacks.values()),
+                    "truncated": sampler.truncated,
+                },
+                metadata_file,
+                indent=2,
+                default=str,
+            )
+        self.prune()
+
+    def prune(self):
+        with self._prune_lock:
+            try:
+                profiles = [
+                    entry for entry in os.scandir(self.directory) if entry.name.endswith(".folded")
+                ]
+                profiles.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+            except FileNotFoundError:
+                return
+            total_bytes = 0
+            for profile_number, entry in enumerate(profiles):
+                try:
+                    total_bytes += entry.stat().st_size
+                except FileNotFoundError:
+                    continue
+                if profile_number >= self.max_files or total_bytes > self.max_bytes:
+                    for path in (entry.path, entry.path[: -len(".folded")] + ".json"):
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+
+
+def profile_id(endpoint, parameters):
+    """Names a profile after the time, the route and its parameters, e.g. 20240101T120000-blog-my-post-1a2b3c."""
+    tag = "-".join(str(value) for value in parameters.values())
+    tag = re.sub(r"[^A-Za-z0-9_-]+", "-", f"{endpoint}-{tag}").strip("-")[:64]
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{tag}-{secrets.token_hex(3)}"
@@ -0,0 +1,65 @@
+# In-process result cache with TTL, LRU eviction and single-flight computation
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class QueryCache:
+    """
+    Caches results by (version, key), bumping the version invalidates every older entry.
+
+    Concurrent misses for the same key are coalesced, the first caller computes the result and
+    the others wait for it instead of running the same query again.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, version, key, compute):
+        cache_key = (version, key)
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(cache_key)
+                return entry[1]
+
+            flight = self._flights.get(cache_key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[cache_key] = _Flight()
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[cache_key]
+                if flight.error is None:
+                    self._entries[cache_key] = (time.monotonic() + self.ttl, flight.result)
+                    self._entries.move_to_end(cache_key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            flight.done.set()
+
+        return flight.result
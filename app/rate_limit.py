@@ -0,0 +1,146 @@
+# Per-route rate limits, token buckets kept in Redis and shared by every worker
+
+import math
+import time
+
+from flask import request, session
+
+
+RATE_LIMIT_PREFIX = "inkbloom:ratelimit"
+
+# Refills every bucket of the request and takes one token from each, or none when any is empty,
+# so a request refused by one limit does not use up the others.
+# KEYS: buckets  ARGV: now, cost, then capacity and refill rate per second of every bucket
+
+RATE_LIMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local buckets = {}
+local allowed = 1
+for index, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[index * 2 + 1])
+    local refill_rate = tonumber(ARGV[index * 2 + 2])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * refill_rate)
+    if tokens < cost then
+        allowed = 0
+    end
+    buckets[index] = {capacity, refill_rate, tokens}
+end
+local result = {allowed}
+for index, key in ipairs(KEYS) do
+    local capacity, refill_rate, tokens = buckets[index][1], buckets[index][2], buckets[index][3]
+    if allowed == 1 then
+        tokens = tokens - cost
+    end
+    local full_in = math.ceil((capacity - tokens) / refill_rate * 1000)
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('PEXPIRE', key, full_in + 1000)
+    local retry_after = 0
+    if tokens < cost then
+        retry_after = math.ceil((cost - tokens) / refill_rate * 1000)
+    end
+    table.insert(result, math.floor(tokens))
+    table.insert(result, retry_after)
+    table.insert(result, full_in)
+end
+return result
+"""
+
+
+class RateLimit:
+    """
+    Allows bursts of `limit` requests per client, refilled evenly over `period` seconds.
+
+    `per` is "ip" to count the requests of each client address, or "user" to count those of
+    each signed in user, which signed out requests skip.
+    """
+
+    def __init__(self, limit, period, per="ip"):
+        if per not in ("ip", "user"):
+            raise ValueError(f"Unknown rate limit scope {per}")
+        self.limit = limit
+        self.period = period
+        self.per = per
+
+    @property
+    def refill_rate(self):
+        return self.limit / self.period
+
+    def policy(self):
+        return f"{self.limit};w={self.period}"
+
+    def identity(self):
+        if self.per == "user":
+            return (session.get("user") or {}).get("user_id")
+        return request.remote_addr
+
+
+def rate_limit(limit, period, per="ip"):
+    """Adds a RateLimit to a view function, the decorators stack and have to sit below @app.route."""
+
+    def decorator(view):
+        view.rate_limits = [RateLimit(limit, period, per), *getattr(view, "rate_limits", [])]
+        return view
+
+    return decorator
+
+
+def limits_for(app, endpoint):
+    return getattr(app.view_functions.get(endpoint), "rate_limits", None)
+
+
+def check_rate_limits(redis_client, endpoint, limits):
+    """
+    Takes a token from every bucket of the request, returns the state of the most restrictive.
+
+    The state is a dict of allowed, limit, policy, remaining, reset and retry_after, the times
+    being seconds, or None when no limit applies to the request.
+    """
+    buckets = []
+    for limit in limits:
+        identity = limit.identity()
+        if identity:
+            buckets.append((limit, f"{RATE_LIMIT_PREFIX}:{endpoint}:{limit.per}:{identity}"))
+    if not buckets:
+        return None
+
+    arguments = [time.time(), 1]
+    for limit, _ in buckets:
+        arguments.extend([limit.limit, limit.refill_rate])
+    result = redis_client.eval(
+        RATE_LIMIT_SCRIPT, len(buckets), *[key for _, key in buckets], *arguments
+    )
+
+    allowed = result[0] == 1
+    states = [
+        {
+            "allowed": allowed,
+            "limit": limit.limit,
+            "policy": limit.policy(),
+            "remaining": max(0, remaining),
+            "reset": math.ceil(full_in / 1000),
+            "retry_after": math.ceil(retry_after / 1000),
+        }
+        for (limit, _), remaining, retry_after, full_in in zip(
+            buckets, result[1::3], result[2::3], result[3::3]
+        )
+    ]
+    if allowed:
+        return min(states, key=lambda state: state["remaining"])
+    return max(states, key=lambda state: state["retry_after"])
+
+
+def rate_limit_headers(state):
+    """RateLimit-* headers of the IETF draft, with Retry-After on a refused request."""
+    headers = {
+        "RateLimit-Limit": str(state["limit"]),
+        "RateLimit-Remaining": str(state["remaining"]),
+        "RateLimit-Reset": str(state["reset"]),
+        "RateLimit-Policy": state["policy"],
+    }
+    if not state["allowed"]:
+        headers["Retry-After"] = str(max(1, state["retry_after"]))
+    return headers
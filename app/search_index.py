@@ -0,0 +1,168 @@
+# In-process inverted index with BM25 ranking for the type-ahead search
+
+import re
+import math
+import heapq
+import bisect
+from collections import defaultdict
+
+from blog_changes import ChangeFeedIndex
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Matches in the title weigh more than matches in the description
+
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "tags": 2.0,
+    "category": 2.0,
+    "description": 1.0,
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_PREFIX_EXPANSIONS = 50
+
+SEARCH_DOCUMENT_PROJECTION = {
+    "_id": 0,
+    "blog_id": 1,
+    "blog_metadata.title": 1,
+    "blog_metadata.description": 1,
+    "blog_metadata.slug": 1,
+    "blog_metadata.tags": 1,
+    "blog_metadata.category": 1,
+    "blog_metadata.visibility": 1,
+    "blog_metadata.cover_url": 1,
+    "blog_metadata.cover_image": 1,
+    "blog_metadata.created_at": 1,
+}
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class SearchIndex(ChangeFeedIndex):
+    def _clear(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.document_terms = {}
+        self.document_lengths = {}
+        self.total_length = 0.0
+        self._sorted_terms = None
+
+    def add(self, blog):
+        """Indexes a public blog, replacing any earlier version of it, other blogs are only removed."""
+        with self._lock:
+            self.remove(blog["blog_id"])
+
+            blog_metadata = blog.get("blog_metadata", {})
+            # The results are served to anonymous readers and cached publicly
+            if blog_metadata.get("visibility") != "public":
+                return
+
+            term_frequencies = defaultdict(float)
+            for field, weight in FIELD_WEIGHTS.items():
+                value = blog_metadata.get(field)
+                text = " ".join(value) if isinstance(value, list) else value
+                for token in tokenize(text):
+                    term_frequencies[token] += weight
+
+            for term, frequency in term_frequencies.items():
+                if term not in self.postings:
+                    self._sorted_terms = None
+                self.postings[term][blog["blog_id"]] = frequency
+
+            document_length = sum(term_frequencies.values())
+            self.documents[blog["blog_id"]] = blog
+            self.document_terms[blog["blog_id"]] = list(term_frequencies)
+            self.document_lengths[blog["blog_id"]] = document_length
+            self.total_length += document_length
+
+    def remove(self, blog_id):
+        with self._lock:
+            if blog_id not in self.documents:
+                return
+            for term in self.document_terms.pop(blog_id):
+                posting = self.postings[term]
+                del posting[blog_id]
+                if not posting:
+                    del self.postings[term]
+                    self._sorted_terms = None
+            self.total_length -= self.document_lengths.pop(blog_id)
+            del self.documents[blog_id]
+
+    def is_empty(self):
+        return not self.documents
+
+    def load_blogs(self, database, match):
+        return database["BLOGS"].find(match, SEARCH_DOCUMENT_PROJECTION)
+
+    def _expand_prefix(self, prefix):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        end = bisect.bisect_left(self._sorted_terms, prefix + "\uffff")
+        return self._sorted_terms[start:min(end, start + MAX_PREFIX_EXPANSIONS)]
+
+    def _bm25(self, term, document_count, average_length):
+        posting = self.postings.get(term, {})
+        inverse_frequency = math.log(
+            1 + (document_count - len(posting) + 0.5) / (len(posting) + 0.5)
+        )
+        return {
+            blog_id: inverse_frequency
+            * frequency
+            * (BM25_K1 + 1)
+            / (
+                frequency
+                + BM25_K1
+                * (1 - BM25_B + BM25_B * self.document_lengths[blog_id] / average_length)
+            )
+            for blog_id, frequency in posting.items()
+        }
+
+    def search(self, query, limit=5):
+        """
+        Returns the best matching blogs for the query, ranked by BM25.
+
+        Every query term has to match, the last one as a prefix so results show up while typing.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            document_count = len(self.documents)
+            if document_count == 0:
+                return []
+            average_length = self.total_length / document_count or 1.0
+
+            scores = None
+            for position, token in enumerate(tokens):
+                if position == len(tokens) - 1:
+                    terms = self._expand_prefix(token)
+                else:
+                    terms = [token] if token in self.postings else []
+
+                token_scores = defaultdict(float)
+                for term in terms:
+                    for blog_id, score in self._bm25(
+                        term, document_count, average_length
+                    ).items():
+                        token_scores[blog_id] = max(token_scores[blog_id], score)
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        blog_id: score + token_scores[blog_id]
+                        for blog_id, score in scores.items()
+                        if blog_id in token_scores
+                    }
+                if not scores:
+                    return []
+
+            ranked_blog_ids = heapq.nlargest(limit, scores, key=scores.get)
+            return [self.documents[blog_id] for blog_id in ranked_blog_ids]
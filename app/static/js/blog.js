@@ -1,6 +1,7 @@
 hljs.highlightAll();
 
-function submitComment(blogID) {
+function submitComment() {
+    let blogID = document.getElementById('blog-comments').dataset.blogId;
     let commentContent = document.getElementById('comment-content').value;
 
     if (commentContent === '') {
@@ -13,6 +14,9 @@ function submitComment(blogID) {
 
     fetch(`/api/blog/${blogID}/comment`, {
         method: 'POST',
+        headers: {
+            'X-CSRF-Token': document.getElementById('csrf_token').value,
+        },
         body: formData,
     }).then(response => {
         if (response.status === 200) {
@@ -29,3 +33,28 @@ function submitComment(blogID) {
     }
     );
 }
+
+function loadMoreComments() {
+    let blogID = document.getElementById('blog-comments').dataset.blogId;
+    let loadMoreButton = document.getElementById('load-more-comments');
+
+    loadMoreButton.disabled = true;
+
+    fetch(`/api/blog/${blogID}/comments?cursor=${encodeURIComponent(loadMoreButton.dataset.cursor)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.status !== 'success') {
+                throw new Error(data.message);
+            }
+            document.querySelector('.blog-comments-list').insertAdjacentHTML('beforeend', data.html);
+            if (data.older_cursor) {
+                loadMoreButton.dataset.cursor = data.older_cursor;
+                loadMoreButton.disabled = false;
+            } else {
+                loadMoreButton.remove();
+            }
+        }).catch(error => {
+            loadMoreButton.disabled = false;
+            createAlert('danger', 'An error occurred while loading the comments. Please try again.');
+        });
+}
@@ -49,6 +49,9 @@ function submitBlog() {
 
   fetch('/api/blog', {
     method: 'POST',
+    headers: {
+      'X-CSRF-Token': document.getElementById('csrf_token').value,
+    },
     body: formData,
   })
     .then((response) => response.json())
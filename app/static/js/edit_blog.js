@@ -54,6 +54,9 @@ function updateBlog(blogID) {
 
     fetch(`/api/blog/${blogID}`, {
         method: 'PUT',
+        headers: {
+            'X-CSRF-Token': document.getElementById('csrf_token').value,
+        },
         body: formData,
     })
         .then((response) => response.json())
@@ -16,9 +16,25 @@ function toggleDropdown() {
 const searchBar = document.getElementById("search-bar");
 const searchResults = document.getElementById("search-results");
 
+// Only query once the user pauses typing, and skip keys that do not change the query
+const SEARCH_DEBOUNCE_MS = 250;
+let searchDebounceTimer = null;
+let lastSearchQuery = "";
+
 searchBar.addEventListener("keyup", function (event) {
-  if (searchBar.value.length > 2) {
-    fetch("/api/search?query=" + encodeURIComponent(searchBar.value))
+  clearTimeout(searchDebounceTimer);
+  searchDebounceTimer = setTimeout(runSearch, SEARCH_DEBOUNCE_MS);
+});
+
+function runSearch() {
+  const searchQuery = searchBar.value.trim().toLowerCase();
+  if (searchQuery === lastSearchQuery) {
+    return;
+  }
+  lastSearchQuery = searchQuery;
+
+  if (searchQuery.length > 2) {
+    fetch("/api/search?query=" + encodeURIComponent(searchQuery))
       .then((response) => {
         if (response.status == 404) {
           console.log("No results found for search query");
@@ -62,7 +78,7 @@ searchBar.addEventListener("keyup", function (event) {
     searchResults.innerHTML = "";
     searchResults.style.display = "none";
   }
-});
+}
 
 document.addEventListener("click", function (event) {
   if (!searchResults.contains(event.target) && event.target !== searchBar) {
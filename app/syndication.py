@@ -0,0 +1,186 @@
+# Pre-rendered, pre-compressed RSS feed and sitemaps, regenerated only when blogs are written
+
+import hashlib
+from datetime import datetime, timezone
+
+import redis
+from flask import render_template, url_for
+
+from compression import ENCODERS, compress
+
+
+ARTIFACT_PREFIX = "inkbloom:artifact"
+ENCODED_FIELD_PREFIX = "encoded:"
+RSS_FEED_SIZE = 20
+
+# The sitemap protocol allows at most 50,000 URLs per file, larger archives get a sitemap index
+
+SITEMAP_MAX_URLS = 50000
+
+
+def format_rfc822(dt):
+    """Formats a datetime object into RFC 822 format (required for RSS pubDate)."""
+    if dt.tzinfo is None:
+        return dt.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    else:
+        # If timezone-aware, format accordingly (this example assumes UTC)
+        return dt.strftime('%a, %d %b %Y %H:%M:%S %Z').replace("UTC", "GMT")
+
+
+def _artifact_key(name):
+    return f"{ARTIFACT_PREFIX}:{name}"
+
+
+def store_artifact(redis_client, name, body, content_type, generated_at):
+    """Stores the body with a variant per available encoding and validators, so requests only copy bytes."""
+    body = body.encode("utf-8")
+    artifact = {
+        "body": body,
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+        "content_type": content_type,
+        "last_modified": generated_at.timestamp(),
+    }
+    for encoding in ENCODERS:
+        artifact[f"{ENCODED_FIELD_PREFIX}{encoding}"] = compress(body, encoding)
+
+    pipeline = redis_client.pipeline()
+    pipeline.delete(_artifact_key(name))
+    pipeline.hset(_artifact_key(name), mapping=artifact)
+    pipeline.execute()
+
+
+def load_artifact(redis_client, name):
+    try:
+        artifact = redis_client.hgetall(_artifact_key(name))
+    except redis.RedisError:
+        return None
+    if not artifact:
+        return None
+    return {
+        "body": artifact[b"body"],
+        "encoded": {
+            key.decode()[len(ENCODED_FIELD_PREFIX):]: value
+            for key, value in artifact.items()
+            if key.decode().startswith(ENCODED_FIELD_PREFIX)
+        },
+        "etag": artifact[b"etag"].decode(),
+        "content_type": artifact[b"content_type"].decode(),
+        "last_modified": datetime.fromtimestamp(
+            float(artifact[b"last_modified"]), timezone.utc
+        ),
+    }
+
+
+def generate_rss_feed(database, redis_client, site):
+    generated_at = datetime.now(timezone.utc)
+    blogs = list(
+        database["BLOGS"]
+        .find({"blog_metadata.visibility": "public"})
+        .sort("blog_metadata.created_at", -1)
+        .limit(RSS_FEED_SIZE)
+    )
+
+    for blog in blogs:
+        if 'created_at' in blog.get('blog_metadata', {}):
+            blog['blog_metadata']['pubDate'] = format_rfc822(blog['blog_metadata']['created_at'])
+
+    store_artifact(
+        redis_client,
+        "rss",
+        render_template(
+            "rss.xml",
+            blogs=blogs,
+            site=site,
+            last_build_date=format_rfc822(generated_at),
+        ),
+        "application/rss+xml; charset=utf-8",
+        generated_at,
+    )
+
+
+def _delete_artifacts_after(redis_client, prefix, last_number):
+    """Deletes the numbered artifacts `prefix:N` above last_number, they are numbered from 1 without gaps."""
+    number = last_number + 1
+    while redis_client.delete(_artifact_key(f"{prefix}:{number}")):
+        number += 1
+
+
+def generate_sitemaps(database, redis_client, site):
+    """
+    Renders the sitemap, split into numbered parts behind a sitemap index past SITEMAP_MAX_URLS.
+
+    The blogs are streamed from a slug/updated_at projection and every part is stored as soon
+    as it is full, so one part is in memory at a time. Parts left over from a larger archive
+    are deleted.
+    """
+    generated_at = datetime.now(timezone.utc)
+    blogs_cursor = (
+        database["BLOGS"]
+        .find(
+            {"blog_metadata.visibility": "public"},
+            {"_id": 0, "blog_metadata.slug": 1, "blog_metadata.updated_at": 1},
+        )
+        .sort("blog_metadata.updated_at", -1)
+        .batch_size(1000)
+    )
+
+    def store_part(part_number, blogs):
+        store_artifact(
+            redis_client,
+            f"sitemap:{part_number}",
+            render_template("sitemap.xml", blogs=blogs, site=site),
+            "application/xml; charset=utf-8",
+            generated_at,
+        )
+
+    part_count = 0
+    blogs = []
+    for blog in blogs_cursor:
+        # A full part is only stored once another blog follows, an archive of exactly
+        # SITEMAP_MAX_URLS blogs still gets a single sitemap
+        if len(blogs) == SITEMAP_MAX_URLS:
+            part_count += 1
+            store_part(part_count, blogs)
+            blogs = []
+        blogs.append(
+            {
+                "slug": blog["blog_metadata"]["slug"],
+                "lastmod": blog["blog_metadata"]["updated_at"],
+            }
+        )
+
+    if part_count == 0:
+        store_artifact(
+            redis_client,
+            "sitemap",
+            render_template("sitemap.xml", blogs=blogs, site=site),
+            "application/xml; charset=utf-8",
+            generated_at,
+        )
+    else:
+        part_count += 1
+        store_part(part_count, blogs)
+        store_artifact(
+            redis_client,
+            "sitemap",
+            render_template(
+                "sitemap_index.xml",
+                sitemaps=[
+                    url_for("site.sitemap_part", part_number=part_number, _external=True)
+                    for part_number in range(1, part_count + 1)
+                ],
+                lastmod=generated_at,
+            ),
+            "application/xml; charset=utf-8",
+            generated_at,
+        )
+    _delete_artifacts_after(redis_client, "sitemap", part_count)
+
+
+def regenerate_syndication(database, redis_client, site):
+    """Regenerates every feed artifact, a Redis failure leaves the previous artifacts in place."""
+    try:
+        generate_rss_feed(database, redis_client, site)
+        generate_sitemaps(database, redis_client, site)
+    except redis.RedisError:
+        pass
@@ -0,0 +1,112 @@
+# Batched view counting, hits are accumulated in Redis and flushed to Mongo in bulk
+
+import hashlib
+import uuid
+
+import redis
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from blog_changes import record_views_change
+
+
+VIEWS_PREFIX = "inkbloom:views"
+PENDING_VIEWS_KEY = f"{VIEWS_PREFIX}:pending"
+FLUSHING_VIEWS_KEY = f"{VIEWS_PREFIX}:flushing"
+FLUSHING_BATCH_KEY = f"{VIEWS_PREFIX}:flushing-batch"
+FLUSH_LOCK_KEY = f"{VIEWS_PREFIX}:flush-lock"
+
+
+def _unique_views_key(blog_id):
+    return f"{VIEWS_PREFIX}:unique:{blog_id}"
+
+
+def visitor_fingerprint(remote_addr, user_agent, user_id=None):
+    """Returns a short, non reversible visitor id used for the unique view estimate."""
+    raw_identity = user_id or f"{remote_addr}|{user_agent}"
+    return hashlib.sha256(raw_identity.encode()).hexdigest()[:16]
+
+
+def record_view(redis_client, blog_id, visitor_id):
+    """Counts a page view without touching Mongo, a Redis failure only loses the hit."""
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.hincrby(PENDING_VIEWS_KEY, blog_id, 1)
+        pipeline.pfadd(_unique_views_key(blog_id), visitor_id)
+        pipeline.execute()
+    except redis.RedisError:
+        pass
+
+
+def _flushing_batch_id(redis_client):
+    """Returns the id of the batch in the flushing key, set by the first flush that reads it."""
+    redis_client.set(FLUSHING_BATCH_KEY, uuid.uuid4().hex, nx=True)
+    return redis_client.get(FLUSHING_BATCH_KEY).decode()
+
+
+def flush_views(database, redis_client):
+    """
+    Moves the pending counters to Mongo with one bulk $inc, returns the number of blogs updated.
+
+    The pending hash is renamed before it is read, so hits recorded during the flush land in a
+    fresh hash. A batch left behind by a failed flush is retried before a new one is taken, and
+    every blog records the id of the last batch applied to it, so a retry, or two workers
+    flushing the same batch, only counts the views of each blog once.
+    """
+    if not redis_client.exists(FLUSHING_VIEWS_KEY):
+        try:
+            redis_client.rename(PENDING_VIEWS_KEY, FLUSHING_VIEWS_KEY)
+        except redis.ResponseError:
+            # Nothing has been viewed since the last flush
+            return 0
+    batch_id = _flushing_batch_id(redis_client)
+
+    pending_views = {
+        blog_id.decode(): int(views)
+        for blog_id, views in redis_client.hgetall(FLUSHING_VIEWS_KEY).items()
+    }
+    if not pending_views:
+        redis_client.delete(FLUSHING_VIEWS_KEY, FLUSHING_BATCH_KEY)
+        return 0
+
+    pipeline = redis_client.pipeline(transaction=False)
+    for blog_id in pending_views:
+        pipeline.pfcount(_unique_views_key(blog_id))
+    unique_views = dict(zip(pending_views, pipeline.execute()))
+
+    operations = [
+        UpdateOne(
+            {"blog_id": blog_id, "view_batch_id": {"$ne": batch_id}},
+            {
+                "$inc": {"blog_metadata.number_of_views": views},
+                "$max": {"blog_metadata.number_of_unique_views": unique_views[blog_id]},
+                "$set": {"view_batch_id": batch_id},
+            },
+        )
+        for blog_id, views in pending_views.items()
+    ]
+
+    try:
+        database["BLOGS"].bulk_write(operations, ordered=False)
+    except PyMongoError:
+        # Keep the batch in the flushing key so the next flush retries the blogs it missed
+        return 0
+
+    redis_client.delete(FLUSHING_VIEWS_KEY, FLUSHING_BATCH_KEY)
+
+    # Only the view facets follow the counts, the content caches and ETags stay valid
+    record_views_change(redis_client, *pending_views)
+    return len(operations)
+
+
+def is_view_flush_due(redis_client, interval):
+    """
+    Returns True to one caller every `interval` seconds, which then flushes the views.
+
+    The blog view asks, only after counting a view, so a process serving no blog pages never
+    pays for the check and there are always views to flush when it passes.
+    """
+    try:
+        return bool(redis_client.set(FLUSH_LOCK_KEY, 1, nx=True, ex=interval))
+    except redis.RedisError:
+        return False
@@ -0,0 +1,6 @@
+# Entry point of the platforms that import a WSGI app instead of calling create_app, like Vercel
+
+from main import create_app
+
+
+app = create_app()
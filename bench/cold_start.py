@@ -0,0 +1,136 @@
+# Cold start benchmark, times the import of the app and its first requests in fresh interpreters
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+
+from run import APP_FOLDER, git_revision
+
+
+# Runs in every fresh interpreter, prints the timings as one JSON line
+
+COLD_START_PROBE = """
+import json, sys, time
+started_at = time.perf_counter()
+import main
+imported_at = time.perf_counter()
+app = main.create_app()
+timings = {"import_ms": (imported_at - started_at) * 1000, "create_app_ms": (time.perf_counter() - imported_at) * 1000}
+paths = [path for path in sys.argv[1:] if path]
+if paths:
+    client = app.test_client()
+    for request_number, path in enumerate(paths * 2):
+        request_started_at = time.perf_counter()
+        status_code = client.get(path).status_code
+        label = "first" if request_number < len(paths) else "warm"
+        timings[f"{label} {path} ms"] = (time.perf_counter() - request_started_at) * 1000
+        timings[f"{label} {path} status"] = status_code
+    timings["ready_ms"] = (time.perf_counter() - started_at) * 1000
+print(json.dumps(timings))
+"""
+
+IMPORT_TIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def probe_environment(arguments):
+    return {
+        **os.environ,
+        "REDIS_URL": arguments.redis_url,
+        "MONGODB_URL": arguments.mongodb_url,
+        "SECRET_KEY": "inkbloom-benchmark",
+    }
+
+
+def run_probe(arguments, paths):
+    probe = subprocess.run(
+        [sys.executable, "-c", COLD_START_PROBE, *paths],
+        cwd=APP_FOLDER,
+        env=probe_environment(arguments),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(probe.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(arguments, count):
+    """Returns the imports made directly by main, or by the interpreter startup, that take longest."""
+    probe = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=APP_FOLDER,
+        env=probe_environment(arguments),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for match in IMPORT_TIME_PATTERN.finditer(probe.stderr):
+        _, cumulative_us, indent, module = match.groups()
+        # One level below the top, the top level being main itself and site
+        if len(indent) == 3:
+            imports.append((module, int(cumulative_us) / 1000))
+    imports.sort(key=lambda item: item[1], reverse=True)
+    return [{"module": module, "cumulative_ms": round(duration, 1)} for module, duration in imports[:count]]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Times the import of the app and its first requests in fresh interpreters."
+    )
+    parser.add_argument("--mongodb-url", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/15")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--paths",
+        default="",
+        help="comma separated paths requested after the import, needs MongoDB and Redis",
+    )
+    parser.add_argument("--imports", type=int, default=15, help="slowest imports to report")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    paths = [path for path in arguments.paths.split(",") if path]
+
+    runs = [run_probe(arguments, paths) for _ in range(arguments.runs)]
+    summary = {}
+    for metric in runs[0]:
+        values = [run[metric] for run in runs]
+        if metric.endswith(" status"):
+            summary[metric] = sorted(set(values))
+            continue
+        summary[metric] = {
+            "median": round(statistics.median(values), 1),
+            "min": round(min(values), 1),
+            "max": round(max(values), 1),
+        }
+
+    report = json.dumps(
+        {
+            "config": {
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "runs": arguments.runs,
+                "paths": paths,
+            },
+            "cold_start": summary,
+            "slowest_imports": slowest_imports(arguments, arguments.imports),
+        },
+        indent=2,
+    )
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
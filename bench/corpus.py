@@ -0,0 +1,191 @@
+# Deterministic synthetic corpus for the benchmarks, built with the app's own write-time helpers
+
+import base64
+import os
+import random
+import struct
+import sys
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from authors import author_snapshot  # noqa: E402
+from content_pipeline import content_metadata, process_content  # noqa: E402
+from indexes import ensure_indexes  # noqa: E402
+
+
+VOCABULARY = (
+    "flask redis mongo python cache latency index query template render cursor page "
+    "session cookie token worker thread process queue feed sitemap search facet tag "
+    "category blog comment author image upload deploy docker gunicorn server client "
+    "request response header stream buffer memory disk network socket timeout retry"
+).split()
+CATEGORIES = ["dev-logs", "tutorial", "project"]
+CORPUS_EPOCH = datetime(2024, 1, 1, 0, 0, 0, 5000)
+ADMIN_USERNAME = "om-mishra7"
+
+
+def png_image(rng, width, height):
+    """Returns a small valid PNG of the given size, with random pixels so every image is unique."""
+
+    def chunk(chunk_type, data):
+        return (
+            struct.pack(">I", len(data))
+            + chunk_type
+            + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+        )
+
+    rows = b"".join(b"\x00" + bytes(rng.getrandbits(8) for _ in range(width * 3)) for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def blog_content(rng, words, images, inline_images=False):
+    """
+    Returns article HTML of roughly `words` words split into sections, with `images` images.
+
+    Inline images are base64 data URLs, as the editor submits them, otherwise CDN URLs.
+    """
+    paragraphs = []
+    section = 0
+    while words > 0:
+        if len(paragraphs) % 6 == 0:
+            section += 1
+            paragraphs.append(f"<h2>Section {section} {rng.choice(VOCABULARY)}</h2>")
+        paragraph_words = min(words, rng.randint(40, 120))
+        words -= paragraph_words
+        paragraphs.append(f"<p>{' '.join(rng.choice(VOCABULARY) for _ in range(paragraph_words))}</p>")
+
+    for image_number in range(images):
+        if inline_images:
+            image = base64.b64encode(png_image(rng, 8, 8)).decode()
+            image_tag = f'<img src="data:image/png;base64,{image}">'
+        else:
+            image_tag = f'<img src="https://cdn.example.com/bench/{rng.getrandbits(64):016x}.png" width="800" height="600">'
+        paragraphs.insert(rng.randint(0, len(paragraphs)), image_tag)
+    return "".join(paragraphs)
+
+
+def generate_users(rng, count):
+    users = []
+    for user_number in range(count):
+        username = ADMIN_USERNAME if user_number == 0 else f"bench-user-{user_number}"
+        users.append(
+            {
+                "user_id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "user_info": {
+                    "username": username,
+                    "name": f"Bench User {user_number}",
+                    "avatar_url": f"https://cdn.example.com/avatars/{user_number}.png",
+                },
+                "account_info": {
+                    "oauth_provider": "om-mishra",
+                    "oauth_id": f"bench-oauth-{user_number}",
+                    "created_at": CORPUS_EPOCH,
+                    "last_login": CORPUS_EPOCH,
+                    "is_active": True,
+                },
+            }
+        )
+    return users
+
+
+def generate_blogs(rng, count, words, images, admin):
+    blogs = []
+    for blog_number in range(count):
+        category = CATEGORIES[blog_number % len(CATEGORIES)]
+        processed_content = process_content(blog_content(rng, words, images))
+        created_at = CORPUS_EPOCH + timedelta(hours=blog_number)
+        blogs.append(
+            {
+                "blog_id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "blog_metadata": {
+                    "title": " ".join(rng.choice(VOCABULARY) for _ in range(6)).title(),
+                    "description": " ".join(rng.choice(VOCABULARY) for _ in range(24)),
+                    "slug": f"{category}:-bench-{blog_number}",
+                    "tags": rng.sample(VOCABULARY, 3),
+                    "category": category,
+                    "visibility": "public",
+                    "featured": blog_number % 10 == 0,
+                    "cover_url": f"https://cdn.example.com/covers/{blog_number}.png",
+                    **content_metadata(processed_content),
+                    "number_of_views": rng.randint(0, 5000),
+                    "number_of_comments": 0,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                },
+                "blog_content": processed_content["html"],
+                "blog_author": author_snapshot(
+                    admin["user_id"],
+                    admin["user_info"]["username"],
+                    admin["user_info"]["name"],
+                    admin["user_info"]["avatar_url"],
+                ),
+            }
+        )
+    return blogs
+
+
+def generate_comments(rng, count, blogs, users):
+    comments = []
+    for comment_number in range(count):
+        # Comments are skewed towards the first blogs, like they are towards popular posts
+        blog = blogs[min(int(rng.paretovariate(1.2)) - 1, len(blogs) - 1)]
+        user = rng.choice(users)
+        blog["blog_metadata"]["number_of_comments"] += 1
+        comments.append(
+            {
+                "comment_id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "comment_content": " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(5, 60))),
+                "comment_author": author_snapshot(
+                    user["user_id"],
+                    user["user_info"]["username"],
+                    user["user_info"]["name"],
+                    user["user_info"]["avatar_url"],
+                ),
+                "comment_metadata": {
+                    "created_at": CORPUS_EPOCH + timedelta(minutes=comment_number),
+                    "blog_id": blog["blog_id"],
+                },
+            }
+        )
+    return comments
+
+
+def seed_corpus(database, redis_client, blogs, words, images, comments, users, seed):
+    """
+    Replaces the benchmark database with a corpus generated from `seed`, returns its summary.
+
+    The same arguments always produce the same documents, so runs stay comparable. Every
+    inkbloom:* key and session in Redis is dropped, so no cache survives from a previous run.
+    """
+    rng = random.Random(seed)
+    user_documents = generate_users(rng, max(users, 1))
+    blog_documents = generate_blogs(rng, blogs, words, images, user_documents[0])
+    comment_documents = generate_comments(rng, comments, blog_documents, user_documents) if blog_documents else []
+
+    for collection_name in ("USERS", "BLOGS", "COMMENTS", "MEDIA", "PENDING_MEDIA"):
+        database[collection_name].drop()
+    ensure_indexes(database)
+    database["USERS"].insert_many(user_documents)
+    if blog_documents:
+        database["BLOGS"].insert_many(blog_documents)
+    if comment_documents:
+        database["COMMENTS"].insert_many(comment_documents)
+
+    for pattern in ("inkbloom:*", "session:*"):
+        for key in redis_client.scan_iter(match=pattern, count=1000):
+            redis_client.delete(key)
+
+    return {
+        "users": user_documents,
+        "slugs": [blog["blog_metadata"]["slug"] for blog in blog_documents],
+        "tags": sorted({tag for blog in blog_documents for tag in blog["blog_metadata"]["tags"]}),
+    }
@@ -0,0 +1,365 @@
+# Benchmark of every public route, seeded from a synthetic corpus and reported as JSON
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+import requests
+from pymongo import MongoClient
+
+from corpus import ADMIN_USERNAME, VOCABULARY, blog_content, png_image, seed_corpus
+from stub_cdn import start_stub_cdn
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP_FOLDER = os.path.join(REPOSITORY_ROOT, "app")
+
+ROUTES = ["index", "blog", "search", "api_search", "rss_feed", "sitemap", "create_blog"]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round((len(latencies) + errors) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+
+
+def load_app(arguments):
+    """Imports the app in this process, configured like the server under test."""
+    os.environ.update(app_environment(arguments))
+    if APP_FOLDER not in sys.path:
+        sys.path.insert(0, APP_FOLDER)
+    import main
+
+    return main
+
+
+def session_cookie(arguments, values):
+    """Stores `values` in a new session through the app's own session interface, returns its cookie value."""
+    app = load_app(arguments).create_app()
+    with app.test_client() as client:
+        with client.session_transaction() as session:
+            session.update(values)
+        return client.get_cookie(app.config["SESSION_COOKIE_NAME"]).value
+
+
+def admin_session_cookie(arguments):
+    """Signs the admin in, returns the session cookie value."""
+    user = load_app(arguments).DATABASE["USERS"].find_one({"user_info.username": ADMIN_USERNAME})
+    return session_cookie(
+        arguments,
+        {
+            "user": {
+                "user_id": user["user_id"],
+                "username": user["user_info"]["username"],
+                "name": user["user_info"]["name"],
+                "avatar_url": user["user_info"]["avatar_url"],
+            },
+            "is_authenticated": True,
+        },
+    )
+
+
+def app_environment(arguments):
+    return {
+        "REDIS_URL": arguments.redis_url,
+        "MONGODB_URL": arguments.mongodb_url,
+        "SECRET_KEY": "inkbloom-benchmark",
+        "CDN_UPLOAD_URL": arguments.cdn_upload_url,
+        "ENSURE_INDEXES_ON_BOOT": "false",
+        # Every benchmark client shares one address
+        "RATE_LIMIT_ENABLED": "false",
+    }
+
+
+def start_job_workers(arguments):
+    """Starts the job workers, the blog writes leave their CDN uploads and feed regeneration to them."""
+    return [
+        subprocess.Popen(
+            [sys.executable, "-m", "flask", "--app", "main", "run-worker", "--poll-interval", "0.1"],
+            cwd=APP_FOLDER,
+            env={**os.environ, **app_environment(arguments)},
+        )
+        for _ in range(arguments.job_workers)
+    ]
+
+
+def start_server(arguments, environment=None):
+    """Starts gunicorn from the app folder, so it loads the app's gunicorn.conf.py like production."""
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "--bind", f"127.0.0.1:{arguments.port}",
+            "--workers", str(arguments.workers),
+            "--worker-class", arguments.worker_class,
+            "--log-level", "warning",
+            "main:create_app()",
+        ],
+        cwd=APP_FOLDER,
+        env={**os.environ, **app_environment(arguments), **(environment or {})},
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{arguments.base_url}/rss", timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("The application server did not start within 30 seconds")
+
+
+class RouteDriver:
+    """Builds the requests of one route, every URL is drawn from a generator seeded per route."""
+
+    def __init__(self, route, arguments, corpus, session_cookie):
+        self.route = route
+        self.arguments = arguments
+        self.corpus = corpus
+        self.session_cookie = session_cookie
+        self.rng = random.Random(f"{arguments.seed}:{route}")
+        self.rng_lock = threading.Lock()
+        self.csrf_token = None
+
+    def prepare(self, http):
+        if self.route != "create_blog":
+            return
+        editor = http.get(
+            f"{self.arguments.base_url}/blog/new-blog",
+            headers={"Cookie": f"inkbloom-session={self.session_cookie}"},
+        )
+        # The token is also the double-submit cookie value
+        self.csrf_token = re.search(r'id="csrf_token" value="([^"]+)"', editor.text).group(1)
+
+    def draw(self):
+        """Returns (method, url, options) of the next request, only this is serialized between the clients."""
+        base_url = self.arguments.base_url
+        with self.rng_lock:
+            if self.route == "index":
+                return "GET", f"{base_url}/", {}
+            if self.route == "blog":
+                return "GET", f"{base_url}/blog/{self.rng.choice(self.corpus['slugs'])}", {}
+            if self.route == "search":
+                return "GET", f"{base_url}/search", {"params": {"tags": self.rng.choice(self.corpus["tags"])}}
+            if self.route == "api_search":
+                word = self.rng.choice(VOCABULARY)
+                return "GET", f"{base_url}/api/search", {"params": {"query": word[: self.rng.randint(3, len(word))]}}
+            if self.route == "rss_feed":
+                return "GET", f"{base_url}/rss", {}
+            if self.route == "sitemap":
+                return "GET", f"{base_url}/sitemap", {}
+
+            content = blog_content(self.rng, self.arguments.words, self.arguments.images, inline_images=True)
+            cover = png_image(self.rng, 16, 9)
+            slug = f"bench-created-{self.rng.getrandbits(32):08x}"
+        return "POST", f"{base_url}/api/blog", {
+            "headers": {
+                "Cookie": f"inkbloom-session={self.session_cookie}; inkbloom-csrf={self.csrf_token}",
+                "X-CSRF-Token": self.csrf_token,
+            },
+            "data": {
+                "title": "Benchmark Blog",
+                "description": "Created by the benchmark",
+                "slug": slug,
+                "tags": "bench,load",
+                "category": "dev-logs",
+                "visibility": "public",
+                "content": content,
+            },
+            "files": {"cover": ("cover.png", cover, "image/png")},
+        }
+
+    def request(self, http):
+        method, url, options = self.draw()
+        return http.request(method, url, **options)
+
+
+def run_route(driver, arguments):
+    """Sends arguments.requests requests from arguments.concurrency clients, returns the summary."""
+    local = threading.local()
+
+    def http_session():
+        if not hasattr(local, "http"):
+            local.http = requests.Session()
+        return local.http
+
+    def timed_request(_):
+        http = http_session()
+        # Generating the request, e.g. the images of a new blog, is not part of the latency
+        method, url, options = driver.draw()
+        started_at = time.perf_counter()
+        try:
+            response = http.request(method, url, **options)
+            response.content
+            failed = response.status_code != 200 or (
+                driver.route == "create_blog" and response.json().get("status") != "success"
+            )
+        except requests.RequestException:
+            failed = True
+        return time.perf_counter() - started_at, failed
+
+    with requests.Session() as http:
+        driver.prepare(http)
+        for _ in range(arguments.warmup):
+            driver.request(http)
+
+    latencies = []
+    errors = 0
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=arguments.concurrency) as pool:
+        for latency, failed in pool.map(timed_request, range(arguments.requests)):
+            if failed:
+                errors += 1
+            else:
+                latencies.append(latency)
+    return summarize(latencies, errors, time.perf_counter() - started_at)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=REPOSITORY_ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, max_regression):
+    """Returns the routes whose p95 regressed by more than max_regression against the baseline."""
+    regressions = []
+    for route, summary in results["routes"].items():
+        baseline_p95 = baseline.get("routes", {}).get(route, {}).get("p95_ms")
+        if baseline_p95 and summary["p95_ms"] and summary["p95_ms"] > baseline_p95 * (1 + max_regression):
+            regressions.append(f"{route}: p95 {baseline_p95} ms -> {summary['p95_ms']} ms")
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Seeds a synthetic corpus and benchmarks the routes, the database and Redis are wiped."
+    )
+    parser.add_argument("--mongodb-url", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/15")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--worker-class", default="gevent", help="gunicorn worker class, gevent or sync")
+    parser.add_argument("--job-workers", type=int, default=1, help="job worker processes")
+    parser.add_argument("--base-url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--blogs", type=int, default=500)
+    parser.add_argument("--words", type=int, default=1200, help="words per blog")
+    parser.add_argument("--images", type=int, default=3, help="images per blog")
+    parser.add_argument("--comments", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400, help="requests per route")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per route")
+    parser.add_argument("--cdn-latency-ms", type=float, default=50)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 increase")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    routes = [route for route in arguments.routes.split(",") if route]
+    unknown_routes = set(routes) - set(ROUTES)
+    if unknown_routes:
+        raise SystemExit(f"Unknown routes: {', '.join(sorted(unknown_routes))}")
+
+    stub_cdn = start_stub_cdn(latency=arguments.cdn_latency_ms / 1000)
+    arguments.cdn_upload_url = stub_cdn.upload_url
+
+    corpus = seed_corpus(
+        MongoClient(arguments.mongodb_url)["INKBLOOM"],
+        redis.from_url(arguments.redis_url),
+        arguments.blogs,
+        arguments.words,
+        arguments.images,
+        arguments.comments,
+        arguments.users,
+        arguments.seed,
+    )
+    session_cookie = admin_session_cookie(arguments)
+
+    server = None
+    job_workers = []
+    if arguments.base_url is None:
+        arguments.base_url = f"http://127.0.0.1:{arguments.port}"
+        server = start_server(arguments)
+        job_workers = start_job_workers(arguments)
+
+    try:
+        results = {
+            "config": {
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "workers": arguments.workers if server else None,
+                "worker_class": arguments.worker_class if server else None,
+                "job_workers": arguments.job_workers if server else None,
+                "blogs": arguments.blogs,
+                "words": arguments.words,
+                "images": arguments.images,
+                "comments": arguments.comments,
+                "users": arguments.users,
+                "seed": arguments.seed,
+                "concurrency": arguments.concurrency,
+                "requests": arguments.requests,
+                "warmup": arguments.warmup,
+                "cdn_latency_ms": arguments.cdn_latency_ms,
+            },
+            "routes": {},
+        }
+        # create_blog runs last, the blogs it adds would change what the read routes serve
+        for route in sorted(routes, key=lambda route: route == "create_blog"):
+            driver = RouteDriver(route, arguments, corpus, session_cookie)
+            results["routes"][route] = run_route(driver, arguments)
+            print(f"{route}: {json.dumps(results['routes'][route])}", file=sys.stderr)
+    finally:
+        for process in [server, *job_workers]:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(report + "\n")
+    else:
+        print(report)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), arguments.max_regression)
+        if regressions:
+            raise SystemExit("Regressions against the baseline:\n" + "\n".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
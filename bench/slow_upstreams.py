@@ -0,0 +1,182 @@
+# Load test of the serving modes, readers keep reading while sign ins wait on a slow accounts API
+
+import argparse
+import json
+import platform
+import random
+import sys
+import threading
+import time
+
+import redis
+import requests
+from pymongo import MongoClient
+
+from corpus import seed_corpus
+from run import git_revision, session_cookie, start_server, summarize
+from stub_accounts import start_stub_accounts
+from stub_cdn import start_stub_cdn
+
+
+SIGN_IN_STATE = "bench-sign-in-state"
+
+
+def sign_in_client(arguments, cookie, deadline, results):
+    """Completes the OAuth callback in a loop, every request waits on the stub accounts API."""
+    with requests.Session() as http:
+        while time.monotonic() < deadline:
+            started_at = time.perf_counter()
+            try:
+                response = http.get(
+                    f"{arguments.base_url}/oauth/_handler",
+                    params={"code": "bench", "state": SIGN_IN_STATE},
+                    headers={"Cookie": f"inkbloom-session={cookie}"},
+                    allow_redirects=False,
+                    timeout=arguments.request_timeout,
+                )
+                failed = response.status_code != 302 or "failed" in response.headers.get("Location", "")
+            except requests.RequestException:
+                failed = True
+            results.append((time.perf_counter() - started_at, failed))
+
+
+def reader_client(arguments, corpus, reader_number, deadline, results):
+    """Reads blogs and the feed in a loop, like a visitor who never signs in."""
+    rng = random.Random(f"{arguments.seed}:reader:{reader_number}")
+    with requests.Session() as http:
+        while time.monotonic() < deadline:
+            if rng.random() < 0.5:
+                url = f"{arguments.base_url}/blog/{rng.choice(corpus['slugs'])}"
+            else:
+                url = f"{arguments.base_url}/rss"
+            started_at = time.perf_counter()
+            try:
+                response = http.get(url, timeout=arguments.request_timeout)
+                response.content
+                failed = response.status_code != 200
+            except requests.RequestException:
+                failed = True
+            results.append((time.perf_counter() - started_at, failed))
+
+
+def summarize_results(results, elapsed):
+    return summarize(
+        [latency for latency, failed in results if not failed],
+        sum(failed for _, failed in results),
+        elapsed,
+    )
+
+
+def run_mode(arguments, worker_class, accounts_api_url):
+    """Serves the app with `worker_class` and returns the summaries of the readers and the sign ins."""
+    corpus = seed_corpus(
+        MongoClient(arguments.mongodb_url)["INKBLOOM"],
+        redis.from_url(arguments.redis_url),
+        arguments.blogs,
+        arguments.words,
+        arguments.images,
+        arguments.comments,
+        arguments.users,
+        arguments.seed,
+    )
+    cookies = [
+        session_cookie(arguments, {"auth_state": SIGN_IN_STATE}) for _ in range(arguments.sign_in_clients)
+    ]
+
+    arguments.worker_class = worker_class
+    server = start_server(arguments, {"ACCOUNTS_API_URL": accounts_api_url})
+    try:
+        sign_in_results = []
+        reader_results = []
+        started_at = time.perf_counter()
+        deadline = time.monotonic() + arguments.duration
+        clients = [
+            threading.Thread(target=sign_in_client, args=(arguments, cookie, deadline, sign_in_results))
+            for cookie in cookies
+        ]
+        # The sign ins start first, so the readers arrive while they wait on the accounts API
+        for client in clients:
+            client.start()
+        time.sleep(0.2)
+        readers = [
+            threading.Thread(
+                target=reader_client, args=(arguments, corpus, reader_number, deadline, reader_results)
+            )
+            for reader_number in range(arguments.readers)
+        ]
+        for reader in readers:
+            reader.start()
+        for client in [*clients, *readers]:
+            client.join()
+        elapsed = time.perf_counter() - started_at
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "readers": summarize_results(reader_results, elapsed),
+        "sign_ins": summarize_results(sign_in_results, elapsed),
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compares the gunicorn worker classes while sign ins wait on a slow stub accounts API, "
+            "the database and Redis are wiped."
+        )
+    )
+    parser.add_argument("--mongodb-url", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/15")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers of every mode")
+    parser.add_argument("--worker-classes", default="sync,gevent")
+    parser.add_argument("--accounts-latency-ms", type=float, default=2000)
+    parser.add_argument("--sign-in-clients", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20, help="seconds per mode")
+    parser.add_argument("--request-timeout", type=float, default=30)
+    parser.add_argument("--blogs", type=int, default=100)
+    parser.add_argument("--words", type=int, default=800, help="words per blog")
+    parser.add_argument("--images", type=int, default=2, help="images per blog")
+    parser.add_argument("--comments", type=int, default=500)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    arguments.base_url = f"http://127.0.0.1:{arguments.port}"
+    arguments.cdn_upload_url = start_stub_cdn().upload_url
+    stub_accounts = start_stub_accounts(latency=arguments.accounts_latency_ms / 1000)
+
+    results = {
+        "config": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "workers": arguments.workers,
+            "accounts_latency_ms": arguments.accounts_latency_ms,
+            "sign_in_clients": arguments.sign_in_clients,
+            "readers": arguments.readers,
+            "duration": arguments.duration,
+            "blogs": arguments.blogs,
+            "seed": arguments.seed,
+        },
+        "modes": {},
+    }
+    for worker_class in [worker_class for worker_class in arguments.worker_classes.split(",") if worker_class]:
+        results["modes"][worker_class] = run_mode(arguments, worker_class, stub_accounts.user_info_url)
+        print(f"{worker_class}: {json.dumps(results['modes'][worker_class])}", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
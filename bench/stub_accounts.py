@@ -0,0 +1,62 @@
+# Stub of the accounts user-info API, so the sign in can be load tested against a slow upstream
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+BENCH_ACCOUNT = {
+    "user_public_id": "bench-account",
+    "user_profile": {
+        "user_name": "bench-account",
+        "user_display_name": "Bench Account",
+        "user_profile_picture": "https://avatars.example.com/bench-account.png",
+    },
+}
+
+
+class StubAccountsHandler(BaseHTTPRequestHandler):
+    """Answers every user-info request with the bench account after the configured latency."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency)
+
+        body = json.dumps({"user": BENCH_ACCOUNT}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_accounts(host="127.0.0.1", port=0, latency=0.0):
+    """Starts the stub in a daemon thread and returns the server, its API URL is server.user_info_url."""
+    server = ThreadingHTTPServer((host, port), StubAccountsHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.user_info_url = f"http://{host}:{server.server_address[1]}/api/v1/oauth2/user-info"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the stub accounts user-info API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay added to every request")
+    arguments = parser.parse_args()
+
+    stub_server = start_stub_accounts(arguments.host, arguments.port, arguments.latency_ms / 1000)
+    print(f"Stub accounts API listening, set ACCOUNTS_API_URL={stub_server.user_info_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,72 @@
+# Stub of the CDN upload API, so create_blog can be benchmarked without touching the real CDN
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+OBJECT_PATH_PATTERN = re.compile(rb'name="object_path"\r\n\r\n([^\r]*)\r\n')
+
+
+class StubCDNHandler(BaseHTTPRequestHandler):
+    """
+    Accepts any upload after the configured latency and answers like the CDN upload API.
+
+    The object path of every upload is appended to server.uploads, and uploads are refused with
+    server.status when it isn't 200.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        upload = self.rfile.read(int(self.headers["Content-Length"]))
+        object_path_match = OBJECT_PATH_PATTERN.search(upload)
+        object_path = object_path_match.group(1).decode() if object_path_match else "upload"
+        time.sleep(self.server.latency)
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.server.uploads.append(object_path)
+
+        host, port = self.server.server_address[:2]
+        body = json.dumps({"file_url": f"http://{host}:{port}/{object_path}"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_cdn(host="127.0.0.1", port=0, latency=0.0):
+    """Starts the stub in a daemon thread and returns the server, its upload URL is server.upload_url."""
+    server = ThreadingHTTPServer((host, port), StubCDNHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.status = 200
+    server.uploads = []
+    server.upload_url = f"http://{host}:{server.server_address[1]}/v1/upload-file"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the stub CDN upload API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay added to every upload")
+    arguments = parser.parse_args()
+
+    stub_server = start_stub_cdn(arguments.host, arguments.port, arguments.latency_ms / 1000)
+    print(f"Stub CDN listening, set CDN_UPLOAD_URL={stub_server.upload_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
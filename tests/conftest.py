@@ -0,0 +1,34 @@
+# Shared fixtures, the app modules are imported from app/ as gunicorn does and run against fakeredis and mongomock
+
+import os
+import sys
+
+import fakeredis
+import mongomock
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient()["INKBLOOM"]
+
+
+@pytest.fixture
+def app(monkeypatch, redis_client, database):
+    """The app with its Redis and MongoDB clients replaced by fakeredis and mongomock."""
+    import main
+
+    monkeypatch.setenv("REDIS_URL", "redis://127.0.0.1:1/0")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://127.0.0.1:1")
+    monkeypatch.setenv("SECRET_KEY", "inkbloom-test")
+    monkeypatch.setattr(main, "REDIS_CLIENT", redis_client)
+    monkeypatch.setattr(main, "DATABASE", database)
+    monkeypatch.setattr(main, "JOBS_RUN_INLINE", True)
+    return main.create_app()
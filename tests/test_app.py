@@ -0,0 +1,31 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    monkeypatch.setenv("REDIS_URL", "redis://127.0.0.1:1/0")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://127.0.0.1:1")
+    monkeypatch.setenv("SECRET_KEY", "inkbloom-test")
+
+
+def test_importing_the_app_module_builds_no_app():
+    assert not hasattr(main, "app")
+
+
+def test_create_app_builds_independent_apps(environment):
+    first_app, second_app = main.create_app(), main.create_app()
+
+    assert first_app is not second_app
+    assert first_app.config["SECRET_KEY"] == "inkbloom-test"
+    with first_app.test_request_context():
+        assert main.url_for("site.blog", slug="first-blog") == "/blog/first-blog"
+    assert "run-worker" in first_app.cli.commands
+
+
+def test_create_app_requires_the_service_urls(environment, monkeypatch):
+    monkeypatch.delenv("MONGODB_URL")
+    monkeypatch.setattr(main, "load_dotenv", lambda: None)
+    with pytest.raises(RuntimeError):
+        main.create_app()
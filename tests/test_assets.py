@@ -0,0 +1,76 @@
+import pytest
+
+import assets
+import main
+
+
+@pytest.fixture
+def unbuilt_app(app, monkeypatch):
+    monkeypatch.setattr(main, "ASSET_MANIFEST", {})
+    return app
+
+
+def test_unbuilt_bundles_are_built_in_memory_and_cached(unbuilt_app):
+    with unbuilt_app.test_request_context():
+        url = main.asset_url("blog.css")
+    filename = url.rsplit("/", 1)[1]
+    assert filename == assets.memory_bundle("blog.css")[0] != "blog.css"
+
+    response = unbuilt_app.test_client().get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/css"
+    assert response.headers["Cache-Control"] == f"public, max-age={assets.ASSET_MAX_AGE}, immutable"
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_stale_fingerprint_of_a_bundle_is_not_found(unbuilt_app):
+    assert unbuilt_app.test_client().get("/assets/blog.000000000000.css").status_code == 404
+
+
+def test_debug_mode_serves_the_unbuilt_sources(unbuilt_app):
+    unbuilt_app.debug = True
+    with unbuilt_app.test_request_context():
+        url = main.asset_url("blog.js")
+    assert url.endswith("/blog.js")
+
+    response = unbuilt_app.test_client().get(url)
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert response.get_data(as_text=True) == assets.bundle_source("blog.js")
+
+
+def test_build_names_the_bundles_like_the_memory_build(tmp_path):
+    static_folder = tmp_path / "static"
+    for source_path in {source_path for sources in assets.BUNDLES.values() for source_path in sources}:
+        (static_folder / source_path).parent.mkdir(parents=True, exist_ok=True)
+        (static_folder / source_path).write_text(f"/* {source_path} */ body {{ color: red; }}\n")
+
+    manifest = assets.build_assets(str(static_folder))
+
+    assert manifest == {bundle: assets.memory_bundle(bundle, str(static_folder))[0] for bundle in assets.BUNDLES}
+    assert assets.load_manifest(str(static_folder)) == manifest
+
+
+@pytest.mark.parametrize(
+    "source, minified",
+    [
+        ("  let a = 1; // the first\n\n\n    let b = 2;\n", "let a = 1;\nlet b = 2;"),
+        # A comment spanning lines still ends the line, for the automatic semicolon insertion
+        ("let a = 1; /* one\n two */ let b = 2;", "let a = 1;\nlet b = 2;"),
+        ('let url = "https://example.com/*path*/"; // link', 'let url = "https://example.com/*path*/";'),
+        ("let quote = 'it\\'s // not a comment';", "let quote = 'it\\'s // not a comment';"),
+        ("let path = `/a//b/*c*/${x // y\n}`;", "let path = `/a//b/*c*/${x\n}`;"),
+        ("let nested = `a${`b${c}/*d*/`}e`; // tail", "let nested = `a${`b${c}/*d*/`}e`;"),
+        ("let pattern = /\\/\\/+/g; // slashes", "let pattern = /\\/\\/+/g;"),
+        ("let pattern = /[/*]/; let x = 1;", "let pattern = /[/*]/; let x = 1;"),
+        ("if (ok) return /a*/.test(s); /* done */", "if (ok) return /a*/.test(s);"),
+        ("let ratio = a / b / c; // divided", "let ratio = a / b / c;"),
+        ("let half = (a) / 2; /* comment */", "let half = (a) / 2;"),
+    ],
+)
+def test_minify_js_drops_comments_only(source, minified):
+    assert assets.minify_js(source) == minified
+
+
+def test_minify_css_drops_comments_and_whitespace():
+    assert assets.minify_css("/* theme */\nbody {\n  color: red;\n  margin: 0 auto;\n}\n") == "body{color:red;margin:0 auto}"
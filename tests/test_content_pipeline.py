@@ -0,0 +1,52 @@
+from content_pipeline import process_content
+
+
+def table_of_contents(html):
+    return [(entry["level"], entry["id"], entry["title"]) for entry in process_content(html)["table_of_contents"]]
+
+
+def test_headings_get_unique_ids():
+    processed = process_content("<h2>Setup</h2><p>a</p><h3>Setup</h3><h2>Setup!</h2><h2>Set up</h2>")
+
+    assert [entry["id"] for entry in processed["table_of_contents"]] == ["setup", "setup-2", "setup-3", "set-up"]
+    assert '<h3 id="setup-2">' in processed["html"]
+    assert '<h2 id="setup-3">' in processed["html"]
+
+
+def test_generated_ids_skip_the_ids_of_earlier_headings():
+    assert table_of_contents('<h2 id="setup">Install</h2><h2>Setup</h2>') == [
+        (2, "setup", "Install"),
+        (2, "setup-2", "Setup"),
+    ]
+
+
+def test_processing_twice_keeps_the_ids():
+    processed = process_content("<h2>Setup</h2><h2>Setup</h2><h1>Intro &amp; more</h1>")
+
+    assert process_content(processed["html"])["html"] == processed["html"]
+    assert table_of_contents(processed["html"]) == [
+        (2, "setup", "Setup"),
+        (2, "setup-2", "Setup"),
+        (1, "intro-more", "Intro & more"),
+    ]
+
+
+def test_headings_without_text_or_letters():
+    assert table_of_contents("<h2> </h2><h2>!!!</h2><h2>???</h2><h4>Deep</h4>") == [
+        (2, "section", "!!!"),
+        (2, "section-2", "???"),
+    ]
+
+
+def test_heading_text_includes_its_inline_markup():
+    processed = process_content("<h2>Using <code>redis</code> <em>well</em></h2>")
+
+    assert table_of_contents(processed["html"]) == [(2, "using-redis-well", "Using redis well")]
+    assert processed["html"] == '<h2 id="using-redis-well">Using <code>redis</code> <em>well</em></h2>'
+
+
+def test_word_count_and_excerpt_skip_markup_and_scripts():
+    processed = process_content("<p>one two</p><p>three</p><script>var hidden = 1;</script>")
+
+    assert processed["word_count"] == 3
+    assert processed["excerpt"] == "one two three"
@@ -0,0 +1,89 @@
+import pytest
+from flask import Flask
+
+import csrf
+
+
+SECRET_KEY = "inkbloom-test"
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = SECRET_KEY
+    app.config["SESSION_COOKIE_SECURE"] = False
+
+    @app.get("/form")
+    def form():
+        return csrf.csrf_token()
+
+    @app.post("/write")
+    @csrf.csrf_protected
+    def write():
+        return "written"
+
+    app.after_request(csrf.set_csrf_cookie)
+    return app.test_client()
+
+
+def test_signed_token_is_valid_for_its_subject_only():
+    token = csrf.generate_csrf_token(SECRET_KEY, "user-1")
+
+    assert csrf.is_valid_csrf_token(SECRET_KEY, "user-1", token)
+    assert not csrf.is_valid_csrf_token(SECRET_KEY, "user-2", token)
+    assert not csrf.is_valid_csrf_token("another-secret", "user-1", token)
+
+
+@pytest.mark.parametrize(
+    "token",
+    [None, "", "not-a-token", "a.b", "a.b.c.d", "nonce.not-a-time.signature"],
+)
+def test_malformed_tokens_are_invalid(token):
+    assert not csrf.is_valid_csrf_token(SECRET_KEY, "", token)
+
+
+def test_tampered_token_is_invalid():
+    nonce, issued_at, signature = csrf.generate_csrf_token(SECRET_KEY, "").split(".")
+
+    assert not csrf.is_valid_csrf_token(SECRET_KEY, "", f"{nonce}x.{issued_at}.{signature}")
+    assert not csrf.is_valid_csrf_token(SECRET_KEY, "", f"{nonce}.{int(issued_at) + 1}.{signature}")
+
+
+def test_token_expires(monkeypatch):
+    token = csrf.generate_csrf_token(SECRET_KEY, "")
+    issued_at = int(token.split(".")[1])
+
+    monkeypatch.setattr(csrf.time, "time", lambda: issued_at + csrf.CSRF_TOKEN_TTL)
+    assert csrf.is_valid_csrf_token(SECRET_KEY, "", token)
+    monkeypatch.setattr(csrf.time, "time", lambda: issued_at + csrf.CSRF_TOKEN_TTL + 1)
+    assert not csrf.is_valid_csrf_token(SECRET_KEY, "", token)
+
+
+def test_write_needs_the_token_of_the_cookie(client):
+    token = client.get("/form").get_data(as_text=True)
+    assert client.get_cookie(csrf.CSRF_COOKIE_NAME).value == token
+
+    assert client.post("/write", headers={csrf.CSRF_HEADER_NAME: token}).status_code == 200
+    assert client.post("/write", data={csrf.CSRF_FORM_FIELD: token}).status_code == 200
+    assert client.post("/write").status_code == 403
+
+    other_token = csrf.generate_csrf_token(SECRET_KEY, "")
+    assert client.post("/write", headers={csrf.CSRF_HEADER_NAME: other_token}).status_code == 403
+
+
+def test_valid_cookie_token_is_reused(client):
+    token = client.get("/form").get_data(as_text=True)
+    response = client.get("/form")
+
+    assert response.get_data(as_text=True) == token
+    assert "Set-Cookie" not in response.headers
+
+
+def test_stale_cookie_token_is_replaced(client, monkeypatch):
+    token = client.get("/form").get_data(as_text=True)
+    monkeypatch.setattr(csrf.time, "time", lambda: int(token.split(".")[1]) + csrf.CSRF_TOKEN_TTL + 1)
+
+    response = client.get("/form")
+
+    assert response.get_data(as_text=True) != token
+    assert client.get_cookie(csrf.CSRF_COOKIE_NAME).value == response.get_data(as_text=True)
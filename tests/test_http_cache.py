@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytest
+
+import main
+import view_counter
+from http_cache import compute_etag
+
+
+@pytest.fixture
+def blog(database):
+    database["BLOGS"].insert_one(
+        {
+            "blog_id": "first-blog-id",
+            "blog_metadata": {"slug": "first-blog", "visibility": "public", "created_at": datetime(2024, 1, 1)},
+        }
+    )
+    return "first-blog"
+
+
+def etag(app, path):
+    with app.test_request_context(path):
+        return compute_etag(
+            main.policy_for(app, "site.blog"), app.config["SECRET_KEY"], main.service_version, main.request.full_path, None
+        )
+
+
+def pending_views(redis_client):
+    return {
+        blog_id.decode(): int(views)
+        for blog_id, views in redis_client.hgetall(view_counter.PENDING_VIEWS_KEY).items()
+    }
+
+
+def test_revalidated_blog_page_counts_a_view(app, redis_client, blog, monkeypatch):
+    monkeypatch.setattr(main, "is_view_flush_due", lambda redis_client, interval: False)
+    response = app.test_client().get(f"/blog/{blog}", headers={"If-None-Match": f'"{etag(app, f"/blog/{blog}")}"'})
+
+    assert response.status_code == 304
+    assert pending_views(redis_client) == {"first-blog-id": 1}
+    assert response.headers["Cache-Control"].startswith("public")
+
+
+def test_revalidation_of_a_missing_blog_counts_nothing(app, redis_client):
+    response = app.test_client().get("/blog/missing", headers={"If-None-Match": f'"{etag(app, "/blog/missing")}"'})
+
+    assert response.status_code == 304
+    assert pending_views(redis_client) == {}
+
+
+def test_anonymous_readers_are_sent_no_cookie(app, blog):
+    client = app.test_client()
+    for path in ("/api/blogs", f"/blog/{blog}", "/api/search?q=first", "/missing"):
+        response = client.get(path, headers={"If-None-Match": f'"{etag(app, path)}"'} if "blog/" in path else {})
+        assert "Set-Cookie" not in response.headers, path
@@ -0,0 +1,166 @@
+import pytest
+
+import jobs
+
+
+def claim(redis_client):
+    """Leases the next job like a worker that dies before finishing it."""
+    return redis_client.eval(
+        jobs.CLAIM_SCRIPT,
+        3,
+        jobs.QUEUE_KEY,
+        jobs.PROCESSING_KEY,
+        jobs.DELAYED_KEY,
+        jobs.time.time(),
+        jobs.JOB_LEASE,
+        jobs.JOBS_PREFIX,
+    ).decode()
+
+
+def expire_lease(redis_client, job_id):
+    redis_client.delete(jobs._lease_key(job_id))
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def handlers(calls):
+    def succeed(**payload):
+        calls.append(payload)
+
+    def fail(**payload):
+        calls.append(payload)
+        raise RuntimeError("upstream unavailable")
+
+    return {"succeed": succeed, "fail": fail}
+
+
+def test_enqueued_job_runs_once_and_succeeds(redis_client, handlers, calls):
+    job_id = jobs.enqueue(redis_client, "succeed", {"blog_id": "b1"})
+    assert jobs.get_job(redis_client, job_id)["status"] == "queued"
+
+    assert jobs.run_next_job(redis_client, handlers)
+    assert not jobs.run_next_job(redis_client, handlers)
+
+    job = jobs.get_job(redis_client, job_id)
+    assert calls == [{"blog_id": "b1"}]
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 1
+    assert job["error"] is None
+    assert redis_client.llen(jobs.PROCESSING_KEY) == 0
+    assert redis_client.ttl(jobs._job_key(job_id)) > 0
+
+
+def test_failed_job_is_retried_with_backoff_then_fails(redis_client, handlers, calls, monkeypatch):
+    job_id = jobs.enqueue(redis_client, "fail", {}, max_attempts=3)
+
+    assert jobs.run_next_job(redis_client, handlers)
+    job = jobs.get_job(redis_client, job_id)
+    assert job["status"] == "retrying"
+    assert "upstream unavailable" in job["error"]
+    assert redis_client.zscore(jobs.DELAYED_KEY, job_id) == pytest.approx(job["run_at"])
+    # Not due yet, the backoff keeps it out of the queue
+    monkeypatch.setattr(jobs, "retry_delay", lambda attempts: 0)
+    if job["run_at"] > jobs.time.time():
+        assert not jobs.run_next_job(redis_client, handlers)
+    redis_client.zadd(jobs.DELAYED_KEY, {job_id: 0})
+
+    assert jobs.run_next_job(redis_client, handlers)
+    assert jobs.get_job(redis_client, job_id)["status"] == "retrying"
+    assert jobs.run_next_job(redis_client, handlers)
+
+    job = jobs.get_job(redis_client, job_id)
+    assert len(calls) == 3
+    assert job["status"] == "failed"
+    assert job["attempts"] == 3
+    assert redis_client.zcard(jobs.DELAYED_KEY) == 0
+    assert redis_client.llen(jobs.QUEUE_KEY) == 0
+    assert not jobs.run_next_job(redis_client, handlers)
+
+
+@pytest.mark.parametrize("attempts", range(1, 8))
+def test_retry_delay_is_capped_exponential_backoff(attempts):
+    for _ in range(20):
+        assert 0 <= jobs.retry_delay(attempts) <= min(jobs.JOB_BACKOFF_MAX, jobs.JOB_BACKOFF_BASE ** attempts)
+
+
+def test_job_of_a_dead_worker_runs_again_once_its_lease_expires(redis_client, handlers, calls):
+    job_id = jobs.enqueue(redis_client, "succeed", {})
+    assert claim(redis_client) == job_id
+
+    # The lease is still held, no other worker may take the job
+    assert not jobs.run_next_job(redis_client, handlers)
+
+    expire_lease(redis_client, job_id)
+    assert jobs.run_next_job(redis_client, handlers)
+    job = jobs.get_job(redis_client, job_id)
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 2
+    assert len(calls) == 1
+
+
+def test_job_whose_workers_keep_dying_fails(redis_client, handlers, calls):
+    job_id = jobs.enqueue(redis_client, "succeed", {}, max_attempts=2)
+    for _ in range(2):
+        assert claim(redis_client) == job_id
+        expire_lease(redis_client, job_id)
+
+    assert jobs.run_next_job(redis_client, handlers)
+    job = jobs.get_job(redis_client, job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "The job exceeded its attempts"
+    assert calls == []
+
+
+def test_job_without_handler_fails_without_retrying(redis_client, handlers):
+    job_id = jobs.enqueue(redis_client, "unknown", {})
+    assert jobs.run_next_job(redis_client, handlers)
+    job = jobs.get_job(redis_client, job_id)
+    assert job["status"] == "failed"
+    assert "No handler" in job["error"]
+
+
+def test_idempotent_enqueue_reuses_the_waiting_job(redis_client, handlers, calls):
+    first_id = jobs.enqueue(redis_client, "succeed", {"blog_id": "b1"}, idempotency_key="publish:b1")
+    second_id = jobs.enqueue(redis_client, "succeed", {"blog_id": "b1"}, idempotency_key="publish:b1")
+    other_id = jobs.enqueue(redis_client, "succeed", {"blog_id": "b2"}, idempotency_key="publish:b2")
+
+    assert second_id == first_id
+    assert other_id != first_id
+    assert redis_client.llen(jobs.QUEUE_KEY) == 2
+
+    while jobs.run_next_job(redis_client, handlers):
+        pass
+    assert calls == [{"blog_id": "b1"}, {"blog_id": "b2"}]
+
+    # Once the job ran, the same key queues new work
+    third_id = jobs.enqueue(redis_client, "succeed", {"blog_id": "b1"}, idempotency_key="publish:b1")
+    assert third_id != first_id
+    assert jobs.get_job(redis_client, third_id)["status"] == "queued"
+
+
+def test_idempotent_enqueue_reuses_a_job_waiting_to_be_retried(redis_client, handlers):
+    first_id = jobs.enqueue(redis_client, "fail", {}, idempotency_key="feeds")
+    jobs.run_next_job(redis_client, handlers)
+    assert jobs.get_job(redis_client, first_id)["status"] == "retrying"
+    assert jobs.enqueue(redis_client, "fail", {}, idempotency_key="feeds") == first_id
+
+
+def test_heartbeats_tell_whether_a_worker_is_alive(redis_client, monkeypatch):
+    assert not jobs.has_live_workers(redis_client)
+    jobs.record_heartbeat(redis_client, "worker-1")
+    assert jobs.has_live_workers(redis_client)
+
+    now = jobs.time.time()
+    monkeypatch.setattr(jobs.time, "time", lambda: now + jobs.WORKER_HEARTBEAT_TTL + 1)
+    assert not jobs.has_live_workers(redis_client)
+
+
+def test_burst_worker_runs_every_due_job(redis_client, handlers, calls):
+    for blog_id in ("b1", "b2", "b3"):
+        jobs.enqueue(redis_client, "succeed", {"blog_id": blog_id})
+    jobs.run_worker(redis_client, handlers, burst=True)
+    assert [call["blog_id"] for call in calls] == ["b1", "b2", "b3"]
@@ -0,0 +1,199 @@
+import base64
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+
+import media  # noqa: E402
+from corpus import png_image  # noqa: E402
+from images import image_encoders  # noqa: E402
+from stub_cdn import start_stub_cdn  # noqa: E402
+
+
+BASE_URL = "http://inkbloom.test"
+
+
+@pytest.fixture
+def stub_cdn(monkeypatch):
+    server = start_stub_cdn()
+    monkeypatch.setattr(media, "CDN_UPLOAD_URL", server.upload_url)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def images():
+    rng = random.Random(1)
+    return [png_image(rng, 700, 60) for _ in range(3)]
+
+
+def inline_image(image):
+    return f'<img src="data:image/png;base64,{base64.b64encode(image).decode()}">'
+
+
+def uploaded_digests(object_paths):
+    """The digests of the uploaded objects, one per image whatever the number of its variants."""
+    return {object_path.rsplit("/", 1)[-1].split(".")[0].split("-")[0] for object_path in object_paths}
+
+
+def test_staging_decodes_each_image_once_and_uploads_nothing(database, redis_client, stub_cdn, images):
+    first_image, second_image, _ = images
+    staged_text = media.stage_content_images(
+        inline_image(first_image) + "<p>text</p>" + inline_image(first_image) + inline_image(second_image),
+        database,
+        redis_client,
+        BASE_URL,
+    )
+
+    assert "base64" not in staged_text
+    assert staged_text.count(media.staged_media_url(BASE_URL, media.media_digest(first_image))) == 2
+    assert 'width="700" height="60"' in staged_text
+    assert database["PENDING_MEDIA"].count_documents({}) == 2
+    assert stub_cdn.uploads == []
+
+
+@pytest.mark.skipif(image_encoders() is None, reason="Pillow isn't installed")
+def test_publishing_uploads_the_variants_of_every_image(database, redis_client, stub_cdn, images):
+    first_image = images[0]
+    staged_text = media.stage_content_images(inline_image(first_image), database, redis_client, BASE_URL)
+
+    published_text, = media.publish_staged_media(database, redis_client, BASE_URL, staged_text)
+
+    digest = media.media_digest(first_image)
+    formats = [image_format for image_format, _, _ in image_encoders()[2]]
+    assert sorted(stub_cdn.uploads) == sorted(
+        f"blogs/media/{digest}-{width}.{image_format}" for width in (320, 640, 700) for image_format in formats
+    )
+    record = database["MEDIA"].find_one({"digest": digest})
+    assert record["file_url"].endswith(f"{digest}-700.webp")
+    assert record["file_url"] in published_text
+    assert (record["width"], record["height"]) == (700, 60)
+    assert len(record["variants"]) == len(stub_cdn.uploads)
+    assert media.lookup_responsive_images(database, BASE_URL, [record["file_url"]])[record["file_url"]]["srcset"]
+
+
+def test_image_without_variants_is_uploaded_as_is(database, redis_client, stub_cdn, monkeypatch):
+    monkeypatch.setattr(media, "image_variants", lambda image: None)
+    image = b"<svg xmlns='http://www.w3.org/2000/svg'/>"
+    staged_url = media.stage_media(database, redis_client, image, "image/svg+xml", "covers", BASE_URL)
+
+    cover_url, = media.publish_staged_media(database, redis_client, BASE_URL, staged_url)
+
+    assert stub_cdn.uploads == [f"blogs/covers/{media.media_digest(image)}.svg"]
+    assert cover_url.endswith(stub_cdn.uploads[0])
+
+
+def test_cover_and_inline_image_with_one_digest_are_uploaded_once(database, redis_client, stub_cdn, images):
+    first_image, second_image, _ = images
+    cover_url = media.stage_media(database, redis_client, first_image, "image/png", "covers", BASE_URL)
+    staged_text = media.stage_content_images(
+        inline_image(first_image) + inline_image(second_image), database, redis_client, BASE_URL
+    )
+    assert cover_url in staged_text
+    assert database["PENDING_MEDIA"].count_documents({}) == 2
+
+    published_text, published_cover_url = media.publish_staged_media(
+        database, redis_client, BASE_URL, staged_text, cover_url
+    )
+
+    assert uploaded_digests(stub_cdn.uploads) == {media.media_digest(first_image), media.media_digest(second_image)}
+    assert len(stub_cdn.uploads) == len(set(stub_cdn.uploads))
+    assert published_cover_url in published_text
+    assert BASE_URL not in published_text + published_cover_url
+    assert database["PENDING_MEDIA"].count_documents({}) == 0
+    assert database["MEDIA"].count_documents({}) == 2
+
+
+def test_published_images_are_never_uploaded_again(database, redis_client, stub_cdn, images):
+    first_image, second_image, third_image = images
+    media.publish_staged_media(
+        database,
+        redis_client,
+        BASE_URL,
+        media.stage_content_images(inline_image(first_image) + inline_image(second_image), database, redis_client, BASE_URL),
+    )
+    stub_cdn.uploads.clear()
+
+    restaged_text = media.stage_content_images(
+        inline_image(first_image) + inline_image(third_image), database, redis_client, BASE_URL
+    )
+    known_urls = media.lookup_media_urls(database, redis_client, [media.media_digest(first_image)])
+    assert list(known_urls.values())[0] in restaged_text
+    cover_url = media.stage_media(database, redis_client, second_image, "image/png", "covers", BASE_URL)
+    assert not cover_url.startswith(BASE_URL)
+
+    media.publish_staged_media(database, redis_client, BASE_URL, restaged_text)
+    assert uploaded_digests(stub_cdn.uploads) == {media.media_digest(third_image)}
+
+    # The media index survives a Redis flush, the digests are looked up in Mongo
+    redis_client.delete(media.MEDIA_URLS_KEY)
+    assert set(media.lookup_media_urls(database, redis_client, [media.media_digest(second_image)])) == {
+        media.media_digest(second_image)
+    }
+
+
+def test_a_failed_upload_publishes_none_of_the_images(database, redis_client, stub_cdn, images, monkeypatch):
+    first_image, second_image, _ = images
+    staged_texts = [
+        media.stage_content_images(inline_image(image), database, redis_client, BASE_URL)
+        for image in (first_image, second_image)
+    ]
+    refused_digest = media.media_digest(second_image)
+    upload_file = media.upload_file
+
+    def refuse_second_image(file, object_path):
+        if refused_digest in object_path:
+            raise media.ImageUploadError("Failed to upload the image to the CDN!")
+        return upload_file(file, object_path)
+
+    monkeypatch.setattr(media, "upload_file", refuse_second_image)
+    with pytest.raises(media.ImageUploadError):
+        media.publish_staged_media(database, redis_client, BASE_URL, *staged_texts)
+
+    assert database["PENDING_MEDIA"].count_documents({}) == 2
+    assert database["MEDIA"].count_documents({}) == 0
+    assert redis_client.hlen(media.MEDIA_URLS_KEY) == 0
+
+    # Once the CDN accepts it again the retry publishes both
+    monkeypatch.setattr(media, "upload_file", upload_file)
+    published_texts = media.publish_staged_media(database, redis_client, BASE_URL, *staged_texts)
+    assert all(BASE_URL not in text for text in published_texts)
+    assert database["PENDING_MEDIA"].count_documents({}) == 0
+    assert database["MEDIA"].count_documents({}) == 2
+
+
+def test_refused_stalled_or_unreachable_cdn_keeps_the_images_staged(database, redis_client, stub_cdn, images, monkeypatch):
+    staged_text = media.stage_content_images(inline_image(images[0]), database, redis_client, BASE_URL)
+
+    stub_cdn.status = 500
+    with pytest.raises(media.ImageUploadError):
+        media.publish_staged_media(database, redis_client, BASE_URL, staged_text)
+    stub_cdn.status = 200
+
+    monkeypatch.setattr(media, "CDN_UPLOAD_TIMEOUT", (media.CDN_UPLOAD_TIMEOUT[0], 0.2))
+    stub_cdn.latency = 1
+    with pytest.raises(media.ImageUploadError):
+        media.publish_staged_media(database, redis_client, BASE_URL, staged_text)
+    stub_cdn.latency = 0
+
+    monkeypatch.setattr(media, "CDN_UPLOAD_URL", "http://127.0.0.1:1/v1/upload-file")
+    with pytest.raises(media.ImageUploadError):
+        media.publish_staged_media(database, redis_client, BASE_URL, staged_text)
+
+    assert database["PENDING_MEDIA"].count_documents({}) == 1
+    assert database["MEDIA"].count_documents({}) == 0
+
+
+def test_broken_or_oversized_images_are_never_staged(database, redis_client, monkeypatch):
+    with pytest.raises(media.ImageUploadError):
+        media.stage_content_images('<img src="data:image/png;base64,not base64!">', database, redis_client, BASE_URL)
+
+    monkeypatch.setattr(media, "MAX_IMAGE_BYTES", 16)
+    with pytest.raises(media.ImageTooLargeError):
+        media.stage_media(database, redis_client, b"x" * 17, "image/png", "covers", BASE_URL)
+    with pytest.raises(media.ImageTooLargeError):
+        media.stage_content_images(inline_image(b"x" * 17), database, redis_client, BASE_URL)
+    assert database["PENDING_MEDIA"].count_documents({}) == 0
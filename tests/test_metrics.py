@@ -0,0 +1,45 @@
+import pytest
+
+import main
+import metrics
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("REDIS_URL", "redis://127.0.0.1:1/0")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://127.0.0.1:1")
+    monkeypatch.setattr(main, "METRICS_TOKEN", None)
+    return main.create_app().test_client()
+
+
+def series(metric_name, **labels):
+    label_text = ",".join(f'{name}="{value}"' for name, value in labels.items())
+    for line in metrics.exposition().splitlines():
+        if line.startswith(f"{metric_name}{{{label_text}}} "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_histogram_counts_each_observation_in_its_bucket():
+    histogram = metrics.Histogram("test_sizes", "Sizes.", ("route",), buckets=(10, 100))
+    for value in (5, 50, 500):
+        histogram.observe(value, "/")
+
+    assert histogram.exposition()[2:] == [
+        'test_sizes_bucket{route="/",le="10"} 1',
+        'test_sizes_bucket{route="/",le="100"} 2',
+        'test_sizes_bucket{route="/",le="+Inf"} 3',
+        'test_sizes_count{route="/"} 3',
+        'test_sizes_sum{route="/"} 555.0',
+    ]
+
+
+def test_response_size_is_recorded_by_route(client):
+    count = series("inkbloom_response_bytes_count", route="/metrics", method="GET")
+    total = series("inkbloom_response_bytes_sum", route="/metrics", method="GET")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert series("inkbloom_response_bytes_count", route="/metrics", method="GET") == count + 1
+    assert series("inkbloom_response_bytes_sum", route="/metrics", method="GET") == total + response.content_length
@@ -0,0 +1,58 @@
+import pytest
+from bson import ObjectId
+
+from pagination import fetch_keyset_page, parse_cursor, parse_page_size
+
+
+@pytest.mark.parametrize("value", [None, ""])
+def test_missing_cursor_is_none(value):
+    assert parse_cursor(value) is None
+
+
+def test_cursor_is_the_object_id():
+    object_id = ObjectId()
+    assert parse_cursor(str(object_id)) == object_id
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["bad", "0" * 23, "0" * 25, "g" * 24, "aaaaaaaaaaaa", f"{ObjectId()} ", "'; drop", "[$ne]"],
+)
+def test_malformed_cursor_raises_value_error(value):
+    with pytest.raises(ValueError):
+        parse_cursor(value)
+
+
+@pytest.mark.parametrize(
+    "value, page_size",
+    [(None, 10), ("", 10), ("abc", 10), ("5", 5), ("0", 1), ("-3", 1), ("1000", 50)],
+)
+def test_page_size_is_clamped(value, page_size):
+    assert parse_page_size(value) == page_size
+
+
+@pytest.mark.parametrize("path", ["/?before=bad", "/?after=0", "/api/blogs?before=bad", "/api/blogs?after=[$gt]"])
+def test_routes_refuse_malformed_cursors(app, path):
+    assert app.test_client().get(path).status_code == 400
+
+
+def test_keyset_pages_walk_both_ways(database):
+    collection = database["BLOGS"]
+    ids = [collection.insert_one({"number": number}).inserted_id for number in range(5)]
+
+    documents, newer_cursor, older_cursor = fetch_keyset_page(collection, {}, None, limit=2)
+    assert [document["number"] for document in documents] == [4, 3]
+    assert newer_cursor is None
+
+    documents, newer_cursor, older_cursor = fetch_keyset_page(
+        collection, {}, None, before=parse_cursor(older_cursor), limit=2
+    )
+    assert [document["number"] for document in documents] == [2, 1]
+
+    documents, _, last_cursor = fetch_keyset_page(collection, {}, None, before=parse_cursor(older_cursor), limit=2)
+    assert [document["number"] for document in documents] == [0]
+    assert last_cursor is None
+
+    documents, newer_cursor, _ = fetch_keyset_page(collection, {}, None, after=ids[2], limit=2)
+    assert [document["number"] for document in documents] == [4, 3]
+    assert newer_cursor is None
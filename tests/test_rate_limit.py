@@ -0,0 +1,114 @@
+import pytest
+from flask import Flask, session
+
+import main
+import rate_limit
+from rate_limit import RateLimit, check_rate_limits, rate_limit_headers
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(rate_limit.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def request_context():
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "inkbloom-test"
+
+    def request_context(remote_addr="203.0.113.1", user_id=None):
+        context = app.test_request_context(environ_base={"REMOTE_ADDR": remote_addr})
+        context.push()
+        if user_id is not None:
+            session["user"] = {"user_id": user_id}
+        return context
+
+    return request_context
+
+
+def take(redis_client, request_context, limits, **identity):
+    context = request_context(**identity)
+    try:
+        return check_rate_limits(redis_client, "comment", limits)
+    finally:
+        context.pop()
+
+
+def test_burst_up_to_the_limit_then_refused(redis_client, request_context, clock):
+    limits = [RateLimit(limit=3, period=60)]
+    states = [take(redis_client, request_context, limits) for _ in range(4)]
+
+    assert [state["allowed"] for state in states] == [True, True, True, False]
+    assert [state["remaining"] for state in states] == [2, 1, 0, 0]
+    assert states[-1]["retry_after"] == 20
+    assert states[0]["policy"] == "3;w=60"
+
+
+def test_tokens_refill_evenly(redis_client, request_context, clock):
+    limits = [RateLimit(limit=3, period=60)]
+    for _ in range(3):
+        take(redis_client, request_context, limits)
+
+    clock[0] += 19
+    assert not take(redis_client, request_context, limits)["allowed"]
+    clock[0] += 1
+    assert take(redis_client, request_context, limits)["allowed"]
+    clock[0] += 3600
+    assert take(redis_client, request_context, limits)["remaining"] == 2
+
+
+def test_clients_have_their_own_buckets(redis_client, request_context, clock):
+    limits = [RateLimit(limit=1, period=60)]
+
+    assert take(redis_client, request_context, limits, remote_addr="203.0.113.1")["allowed"]
+    assert not take(redis_client, request_context, limits, remote_addr="203.0.113.1")["allowed"]
+    assert take(redis_client, request_context, limits, remote_addr="203.0.113.2")["allowed"]
+
+
+def test_refused_request_takes_no_token_from_the_other_limits(redis_client, request_context, clock):
+    limits = [RateLimit(limit=1, period=60, per="user"), RateLimit(limit=5, period=60)]
+
+    assert take(redis_client, request_context, limits, user_id="u1")["remaining"] == 0
+    refused = take(redis_client, request_context, limits, user_id="u1")
+    assert not refused["allowed"]
+    assert refused["limit"] == 1
+
+    # The address bucket only paid for the allowed request
+    assert take(redis_client, request_context, limits, user_id="u2")["remaining"] == 0
+    assert take(redis_client, request_context, limits)["remaining"] == 2
+
+
+def test_user_limits_skip_signed_out_requests(redis_client, request_context, clock):
+    assert take(redis_client, request_context, [RateLimit(limit=1, period=60, per="user")]) is None
+
+
+def test_buckets_expire_once_full(redis_client, request_context, clock):
+    take(redis_client, request_context, [RateLimit(limit=2, period=60)])
+    key = next(iter(redis_client.scan_iter(f"{rate_limit.RATE_LIMIT_PREFIX}:*")))
+
+    assert 0 < redis_client.pttl(key) <= 30_000 + 1000
+
+
+def test_refused_state_sends_retry_after(redis_client, request_context, clock):
+    limits = [RateLimit(limit=1, period=60)]
+    take(redis_client, request_context, limits)
+
+    headers = rate_limit_headers(take(redis_client, request_context, limits))
+    assert headers == {
+        "RateLimit-Limit": "1",
+        "RateLimit-Remaining": "0",
+        "RateLimit-Reset": "60",
+        "RateLimit-Policy": "1;w=60",
+        "Retry-After": "60",
+    }
+
+
+def test_route_answers_429_over_its_limit(app, monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT_ENABLED", True)
+    client = app.test_client()
+    statuses = [client.get("/api/search?q=redis").status_code for _ in range(61)]
+
+    assert statuses[:60] == [200] * 60
+    assert statuses[60] == 429
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from search_index import SearchIndex
+
+
+def blog(blog_id, title, visibility="public"):
+    return {
+        "blog_id": blog_id,
+        "blog_metadata": {
+            "title": title,
+            "description": "",
+            "slug": blog_id,
+            "tags": ["flask"],
+            "category": "dev-logs",
+            "visibility": visibility,
+            "created_at": datetime(2024, 1, 1),
+        },
+    }
+
+
+def test_search_only_returns_public_blogs():
+    index = SearchIndex()
+    index.add(blog("public", "Caching flask pages"))
+    index.add(blog("private", "Caching flask drafts", visibility="private"))
+
+    assert [result["blog_id"] for result in index.search("caching")] == ["public"]
+    assert index.search("drafts") == []
+
+
+def test_blog_made_private_leaves_the_index():
+    index = SearchIndex()
+    index.add(blog("first", "Caching flask pages"))
+    index.add(blog("first", "Caching flask pages", visibility="private"))
+
+    assert index.search("caching") == []
+    assert index.is_empty()
+    assert index.total_length == 0
+
+
+def test_search_matches_every_term_and_the_last_as_a_prefix():
+    index = SearchIndex()
+    index.add(blog("redis", "Redis lua scripts"))
+    index.add(blog("mongo", "Mongo aggregation scripts"))
+
+    assert [result["blog_id"] for result in index.search("lua scri")] == ["redis"]
+    assert {result["blog_id"] for result in index.search("scri")} == {"redis", "mongo"}
+    assert index.search("redis aggregation") == []
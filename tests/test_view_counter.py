@@ -0,0 +1,66 @@
+import mongomock
+import pytest
+from pymongo.errors import BulkWriteError
+
+import view_counter
+
+
+def bulk_update(collection, operations, ordered=True):
+    # mongomock can't run the UpdateOne of recent pymongo releases
+    for operation in operations:
+        collection.update_one(operation._filter, operation._doc)
+
+
+@pytest.fixture
+def blogs(database, monkeypatch):
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_update)
+    database["BLOGS"].insert_many(
+        [
+            {"blog_id": blog_id, "blog_metadata": {"number_of_views": 0, "number_of_unique_views": 0}}
+            for blog_id in ("first", "second")
+        ]
+    )
+    return database["BLOGS"]
+
+
+def views(blogs):
+    return {blog["blog_id"]: blog["blog_metadata"]["number_of_views"] for blog in blogs.find()}
+
+
+def test_views_are_flushed_in_one_batch(database, redis_client, blogs):
+    for visitor_id in ("a", "b", "a"):
+        view_counter.record_view(redis_client, "first", visitor_id)
+    view_counter.record_view(redis_client, "second", "a")
+
+    assert view_counter.flush_views(database, redis_client) == 2
+    assert views(blogs) == {"first": 3, "second": 1}
+    assert blogs.find_one({"blog_id": "first"})["blog_metadata"]["number_of_unique_views"] == 2
+    assert not redis_client.exists(view_counter.FLUSHING_VIEWS_KEY, view_counter.FLUSHING_BATCH_KEY)
+    assert view_counter.flush_views(database, redis_client) == 0
+
+
+def test_retried_batch_counts_each_blog_once(database, redis_client, blogs, monkeypatch):
+    view_counter.record_view(redis_client, "first", "a")
+    view_counter.record_view(redis_client, "second", "a")
+
+    def apply_first_then_fail(collection, operations, ordered=True):
+        bulk_update(collection, operations[:1])
+        raise BulkWriteError({"writeErrors": [], "nInserted": 0})
+
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", apply_first_then_fail)
+    assert view_counter.flush_views(database, redis_client) == 0
+    # Views recorded meanwhile wait for the next batch
+    view_counter.record_view(redis_client, "first", "b")
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_update)
+
+    assert view_counter.flush_views(database, redis_client) == 2
+    assert views(blogs) == {"first": 1, "second": 1}
+    assert view_counter.flush_views(database, redis_client) == 1
+    assert views(blogs) == {"first": 2, "second": 1}
+
+
+def test_one_caller_per_interval_flushes(redis_client):
+    assert view_counter.is_view_flush_due(redis_client, 30)
+    assert not view_counter.is_view_flush_due(redis_client, 30)
+    redis_client.delete(view_counter.FLUSH_LOCK_KEY)
+    assert view_counter.is_view_flush_due(redis_client, 30)